@@ -60,10 +60,15 @@ from __future__ import absolute_import, division, print_function
 
 from nfldb.db import __pdoc__ as __db_pdoc__
 from nfldb.db import api_version, connect, now, set_timezone, schema_version
-from nfldb.db import Tx
+from nfldb.db import set_unpickle_connection
+from nfldb.db import identity_map, IdentityMap, pool, Pool, Tx
+from nfldb.db import add_query_listener, remove_query_listener
+from nfldb.db import profile, Profile, Statement
 from nfldb.query import __pdoc__ as __query_pdoc__
 from nfldb.query import aggregate, current, guess_position, player_search
+from nfldb.query import clear_compiled_cache, compiled_cache_info
 from nfldb.query import Query, QueryOR
+from nfldb.parallel import run_parallel
 from nfldb.team import standard_team
 from nfldb.types import __pdoc__ as __types_pdoc__
 from nfldb.types import stat_categories
@@ -82,12 +87,19 @@ __pdoc__ = dict(__pdoc__, **__version_pdoc__)
 __all__ = [
     # nfldb.db
     'api_version', 'connect', 'now', 'set_timezone', 'schema_version',
-    'Tx',
+    'set_unpickle_connection',
+    'identity_map', 'IdentityMap', 'pool', 'Pool', 'Tx',
+    'add_query_listener', 'remove_query_listener',
+    'profile', 'Profile', 'Statement',
 
     # nfldb.query
     'aggregate', 'current', 'guess_position', 'player_search',
+    'clear_compiled_cache', 'compiled_cache_info',
     'Query', 'QueryOR',
 
+    # nfldb.parallel
+    'run_parallel',
+
     # nfldb.team
     'standard_team',
 
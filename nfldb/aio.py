@@ -0,0 +1,287 @@
+"""
+Runs queries without blocking, using the asynchronous mode of
+psycopg2. Many queries can run concurrently in one thread, each on
+its own connection returned by `nfldb.aio.connect`.
+
+The `*_async` methods of `nfldb.Query` (e.g.,
+`nfldb.Query.as_games_async`) return a `nfldb.aio.Operation` instead
+of results. An operation runs in the background and is advanced by
+calling its `poll` method whenever its file descriptor (`fileno`) is
+ready, which makes it easy to plug into any event loop. Without an
+event loop, `nfldb.aio.gather` waits for several operations at once:
+
+    #!python
+    db = nfldb.connect()
+    conns = [nfldb.aio.connect() for _ in range(2)]
+
+    q1 = nfldb.Query(db).game(season_year=2012, week=1)
+    q2 = nfldb.Query(db).game(season_year=2012, week=2)
+    games1, games2 = nfldb.aio.gather(q1.as_games_async(conns[0]),
+                                      q2.as_games_async(conns[1]))
+
+The SQL and the objects returned are exactly the same as for the
+synchronous methods. The `nfldb.Query` still needs a normal connection
+from `nfldb.connect`, which is what the objects returned use to load
+their relations lazily.
+
+A connection can only run one operation at a time.
+"""
+from __future__ import absolute_import, division, print_function
+import select
+import time
+
+import psycopg2
+from psycopg2.extensions import POLL_OK, POLL_READ, POLL_WRITE
+
+import nfldb.db
+
+__pdoc__ = {}
+
+
+def connect(database=None, user=None, password=None, host=None, port=None,
+            timezone=None, config_path=''):
+    """
+    Returns a new asynchronous psycopg2 connection, which can be used
+    with the `*_async` methods of `nfldb.Query`. The parameters are the
+    same as for `nfldb.connect`.
+
+    Making the connection blocks. (A synchronous connection is also
+    made and closed first, so that the schema is checked and the
+    `nfldb` types are registered.)
+    """
+    params, timezone = nfldb.db._connect_params(
+        database, user, password, host, port, timezone, config_path)
+    nfldb.db.connect(timezone=timezone, fast=True, **params).close()
+
+    def steps(conn):
+        yield  # Wait for the connection to be made.
+        cursor = conn.cursor()
+        cursor.execute('SET timezone = %s', (timezone or 'UTC',))
+        yield
+        cursor.close()
+        yield conn
+    return Operation(psycopg2.connect(async_=True, **params), steps).result()
+
+
+def wait(ops, timeout=None):
+    """
+    Advances every `nfldb.aio.Operation` in `ops` until all of them
+    are done or until `timeout` seconds have passed. The operations
+    that aren't done are returned.
+    """
+    deadline = None if timeout is None else time.time() + timeout
+    pending = [op for op in ops if not op.done()]
+    while len(pending) > 0:
+        remaining = None
+        if deadline is not None:
+            remaining = max(0, deadline - time.time())
+        readers = [op for op in pending if op._state == POLL_READ]
+        writers = [op for op in pending if op._state == POLL_WRITE]
+        readable, writable, _ = select.select(readers, writers, [], remaining)
+        if len(readable) == 0 and len(writable) == 0:
+            break
+        for op in readable + writable:
+            op.poll()
+        pending = [op for op in pending if not op.done()]
+    return pending
+
+
+def gather(*ops):
+    """
+    Waits for every `nfldb.aio.Operation` given and returns a list of
+    their results, in the same order. If any of them failed, its
+    exception is raised.
+    """
+    wait(ops)
+    return [op.result() for op in ops]
+
+
+class Operation (object):
+    """
+    A sequence of SQL statements running on an asynchronous
+    connection, followed by some Python code that turns their results
+    into a value. (Usually the value is a list of `nfldb` objects.)
+    """
+    def __init__(self, conn, steps):
+        """
+        `steps` is a generator function that is called with `conn`.
+        It must yield `None` after each statement it sends (or
+        after nothing at all, to wait for the connection to be made)
+        and then yield the value of the operation, which must not be
+        `None`.
+        """
+        self.connection = conn
+        """The asynchronous connection that the operation runs on."""
+
+        self._steps = steps(conn)
+        self._state = None
+        self._value = None
+        self._error = None
+        self._done = False
+        self._guard(self._advance)
+
+    def fileno(self):
+        """
+        Returns the file descriptor of the operation's connection,
+        which must be waited on as indicated by `nfldb.aio.Operation.
+        wants_read` before calling `nfldb.aio.Operation.poll`.
+        """
+        return self.connection.fileno()
+
+    @property
+    def wants_read(self):
+        """
+        Whether the operation is waiting for its connection to become
+        readable. (Otherwise, it's waiting for it to be writable.)
+        """
+        return self._state == POLL_READ
+
+    def done(self):
+        """Returns `True` if and only if the operation has finished."""
+        return self._done
+
+    def poll(self):
+        """
+        Advances the operation as far as possible without blocking
+        and returns `True` if it has finished.
+        """
+        if not self._done:
+            self._guard(self._poll)
+        return self._done
+
+    def result(self):
+        """
+        Returns the value of the operation, waiting for it to finish
+        if necessary. If the operation failed, then its exception is
+        raised.
+        """
+        wait([self])
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+    def _guard(self, advance):
+        try:
+            advance()
+        except Exception as e:
+            self._error, self._done = e, True
+            self._steps.close()
+
+    def _poll(self):
+        self._state = self.connection.poll()
+        if self._state == POLL_OK:
+            self._advance()
+
+    def _advance(self):
+        while True:
+            value = next(self._steps)
+            if value is not None:
+                self._value, self._done = value, True
+                self._steps.close()
+                return
+            self._state = self.connection.poll()
+            if self._state != POLL_OK:
+                return
+
+
+def query(conn, compile, hydrate):
+    """
+    Returns a `nfldb.aio.Operation` that runs the SQL returned by
+    `compile` on `conn` and whose value is the list returned by
+    `hydrate` given every row in the result set. `compile` is called
+    with a cursor of `conn`.
+    """
+    def steps(conn):
+        cursor = conn.cursor()
+        cursor.execute(compile(cursor))
+        yield
+        rows = cursor.fetchall()
+        cursor.close()
+        yield hydrate(rows)
+    return Operation(conn, steps)
+
+
+class Batches (object):
+    """
+    Fetches the results of a query in batches from a server-side
+    cursor on an asynchronous connection. Each batch is retrieved with
+    `nfldb.aio.Batches.next_batch`. For example, to process every play
+    of a season without loading all of them at once:
+
+        #!python
+        q = nfldb.Query(db).game(season_year=2012)
+        batches = q.iter_plays_async(conn, batch_size=500)
+        while not batches.done:
+            for play in batches.next_batch().result():
+                ...
+
+    (In an event loop, the operation returned by `next_batch` would
+    instead be waited on with the loop.)
+
+    A transaction is held open on the connection until every batch has
+    been fetched or `nfldb.aio.Batches.close` is called.
+    """
+    def __init__(self, conn, name, compile, hydrate, batch_size):
+        """
+        `compile` is called with a cursor of `conn` and must return the
+        SQL of the query. `hydrate` is called with a list of rows and a
+        flag that is `True` for the last batch, and must return a
+        list of objects. `name` is the name of the server-side cursor.
+        """
+        self.connection = conn
+        """The asynchronous connection that the query runs on."""
+
+        self.done = False
+        """Whether every batch has been fetched."""
+
+        self._name = name
+        self._compile = compile
+        self._hydrate = hydrate
+        self._batch_size = batch_size
+        self._declared = False
+
+    def next_batch(self):
+        """
+        Returns a `nfldb.aio.Operation` whose value is the next list of
+        objects. Batches are never empty, unless there are no results
+        left, in which case `nfldb.aio.Batches.done` becomes `True`.
+        """
+        assert not self.done, 'every batch has already been fetched'
+
+        def steps(conn):
+            cursor = conn.cursor()
+            if not self._declared:
+                cursor.execute('BEGIN; DECLARE %s NO SCROLL CURSOR FOR %s'
+                               % (self._name, self._compile(cursor)))
+                yield
+                self._declared = True
+            while True:
+                cursor.execute('FETCH %d FROM %s'
+                               % (self._batch_size, self._name))
+                yield
+                rows = cursor.fetchall()
+                last = len(rows) < self._batch_size
+                objs = self._hydrate(rows, last)
+                if last:
+                    cursor.execute('CLOSE %s; COMMIT' % self._name)
+                    yield
+                    self.done = True
+                if last or len(objs) > 0:
+                    cursor.close()
+                    yield objs
+        return Operation(self.connection, steps)
+
+    def close(self):
+        """
+        Returns a `nfldb.aio.Operation` that closes the server-side
+        cursor without fetching the rest of the batches.
+        """
+        def steps(conn):
+            if self._declared and not self.done:
+                cursor = conn.cursor()
+                cursor.execute('ROLLBACK')
+                yield
+                cursor.close()
+            self.done = True
+            yield True
+        return Operation(self.connection, steps)
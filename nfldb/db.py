@@ -1,12 +1,21 @@
 from __future__ import absolute_import, division, print_function
+try:
+    from collections import OrderedDict
+except ImportError:
+    from ordereddict import OrderedDict
 import ConfigParser
+from contextlib import contextmanager
 import datetime
 import os
 import os.path as path
 import re
 import sys
+import threading
+import time
+import weakref
 
 import psycopg2
+import psycopg2.pool
 from psycopg2.extras import RealDictCursor
 from psycopg2.extensions import TRANSACTION_STATUS_INTRANS
 from psycopg2.extensions import new_type, register_type
@@ -27,7 +36,10 @@ __pdoc__['api_version'] = \
     """
 
 _SHOW_QUERIES = False
-"""When set, all queries will be printed to stderr."""
+"""
+When set, all queries will be printed to stderr. (See also
+`nfldb.profile`.)
+"""
 
 _NUM_QUERIES = 0
 """
@@ -87,8 +99,38 @@ def config(config_path=''):
     return None, tried
 
 
+_connect_cache = {}
+"""
+Maps a connection DSN to a pair of the schema version of its database
+and the OIDs of the types in `_type_casts`. It is filled by
+`nfldb.connect` and read only by fast connections.
+"""
+
+
+def _connect_params(database, user, password, host, port, timezone,
+                    config_path):
+    """
+    Returns a pair of the keyword arguments given to `psycopg2.connect`
+    and the time zone to use for a connection made by `nfldb.connect`
+    with the same parameters. This is where the configuration file is
+    read when `database` is `None`.
+    """
+    if database is None:
+        conf, tried = config(config_path=config_path)
+        if conf is None:
+            raise IOError("Could not find valid configuration file. "
+                          "Tried the following paths: %s" % tried)
+
+        timezone, database = conf['timezone'], conf['database']
+        user, password = conf['user'], conf['password']
+        host, port = conf['host'], conf['port']
+    params = dict(database=database, user=user, password=password,
+                  host=host, port=port)
+    return params, timezone
+
+
 def connect(database=None, user=None, password=None, host=None, port=None,
-            timezone=None, config_path=''):
+            timezone=None, config_path='', fast=False):
     """
     Returns a `psycopg2._psycopg.connection` object from the
     `psycopg2.connect` function. If database is `None`, then `connect`
@@ -111,46 +153,107 @@ def connect(database=None, user=None, password=None, host=None, port=None,
     N.B. The `timezone` parameter should be set to a value that
     PostgreSQL will accept. Select from the `pg_timezone_names` view
     to get a list of valid time zones.
+
+    If `fast` is `True`, then the schema version and type information
+    discovered by the first connection to a database are cached and
+    reused by subsequent connections with the same parameters. Such
+    connections skip the schema check and migration entirely and send
+    the rest of their setup (the time zone and, if it isn't cached yet,
+    the contents of the `team` table) in a single round trip. This is
+    useful for short-lived processes that connect often, but it means
+    that a schema upgraded by another process after the first
+    connection won't be noticed.
     """
-    if database is None:
-        conf, tried = config(config_path=config_path)
-        if conf is None:
-            raise IOError("Could not find valid configuration file. "
-                          "Tried the following paths: %s" % tried)
+    params, timezone = _connect_params(database, user, password, host, port,
+                                       timezone, config_path)
+    conn = psycopg2.connect(**params)
+
+    cached = _connect_cache.get(conn.dsn) if fast else None
+    if cached is None:
+        # Start the migration. Make sure if this is the initial setup
+        # that the DB is empty.
+        sversion = schema_version(conn)
+        assert sversion <= api_version, \
+            'Library with version %d is older than the schema with ' \
+            'version %d' % (api_version, sversion)
+        assert sversion > 0 or (sversion == 0 and _is_empty(conn)), \
+            'Schema has version 0 but is not empty.'
+        set_timezone(conn, 'UTC')
+        _migrate(conn, api_version)
+
+        # A migration may have changed the teams.
+        import nfldb.types
+        nfldb.types._team_caches.pop(conn.dsn, None)
+
+        cached = (api_version, _type_oids(conn))
+        _connect_cache[conn.dsn] = cached
+    assert cached[0] == api_version
+
+    _setup(conn, timezone or 'UTC', preload_teams=fast)
 
-        timezone, database = conf['timezone'], conf['database']
-        user, password = conf['user'], conf['password']
-        host, port = conf['host'], conf['port']
+    # Bind SQL -> Python casting functions.
+    for (name, cast), oid in zip(_type_casts(), cached[1]):
+        register_type(new_type((oid,), name, cast))
+
+    return conn
 
-    conn = psycopg2.connect(database=database, user=user, password=password,
-                            host=host, port=port)
 
-    # Start the migration. Make sure if this is the initial setup that
-    # the DB is empty.
-    sversion = schema_version(conn)
-    assert sversion <= api_version, \
-        'Library with version %d is older than the schema with version %d' \
-        % (api_version, sversion)
-    assert sversion > 0 or (sversion == 0 and _is_empty(conn)), \
-        'Schema has version 0 but is not empty.'
-    set_timezone(conn, 'UTC')
-    _migrate(conn, api_version)
+class Pool (psycopg2.pool.ThreadedConnectionPool):
+    """
+    A thread-safe pool of database connections. Every connection in
+    the pool is created with `nfldb.connect`, so the `nfldb` type
+    bindings are set up exactly once for each physical connection.
 
-    if timezone is not None:
-        set_timezone(conn, timezone)
+    Connections are borrowed with `nfldb.Pool.session`. A connection
+    must only be used by one thread at a time, but any number of
+    threads may hold sessions concurrently.
 
-    # Bind SQL -> Python casting functions.
-    from nfldb.types import Clock, _Enum, Enums, FieldPosition, PossessionTime
-    _bind_type(conn, 'game_phase', _Enum._pg_cast(Enums.game_phase))
-    _bind_type(conn, 'season_phase', _Enum._pg_cast(Enums.season_phase))
-    _bind_type(conn, 'game_day', _Enum._pg_cast(Enums.game_day))
-    _bind_type(conn, 'player_pos', _Enum._pg_cast(Enums.player_pos))
-    _bind_type(conn, 'player_status', _Enum._pg_cast(Enums.player_status))
-    _bind_type(conn, 'game_time', Clock._pg_cast)
-    _bind_type(conn, 'pos_period', PossessionTime._pg_cast)
-    _bind_type(conn, 'field_pos', FieldPosition._pg_cast)
+    Use `nfldb.pool` to create a pool.
+    """
+    def _connect(self, key=None):
+        conn = connect(**self._kwargs)
+        if key is not None:
+            self._used[key] = conn
+            self._rused[id(conn)] = key
+        else:
+            self._pool.append(conn)
+        return conn
+
+    @contextmanager
+    def session(self):
+        """
+        A `with` compatible method that borrows a connection from the
+        pool and returns it when the block exits. The connection can
+        be used anywhere a connection from `nfldb.connect` can, e.g.,
+        with `nfldb.Query` or `nfldb.Tx`:
+
+            #!python
+            with pool.session() as db:
+                games = nfldb.Query(db).game(week=1).as_games()
+
+        If a transaction is still open when the block exits, it is
+        rolled back.
+        """
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
 
-    return conn
+
+def pool(minconn, maxconn, **kwargs):
+    """
+    Returns a new `nfldb.Pool` that keeps at least `minconn` and at
+    most `maxconn` connections open. The remaining keyword arguments
+    are passed to `nfldb.connect` for every connection that the pool
+    opens.
+
+    Unless `fast` is given, the connections of a pool are made with
+    `fast=True`, so only the first connection to a database checks its
+    schema.
+    """
+    kwargs.setdefault('fast', True)
+    return Pool(minconn, maxconn, **kwargs)
 
 
 def schema_version(conn):
@@ -191,19 +294,55 @@ def now():
     return datetime.datetime.now(pytz.utc)
 
 
-def _bind_type(conn, sql_type_name, cast):
+def _type_casts():
     """
-    Binds a `cast` function to the SQL type in the connection `conn`
-    given by `sql_type_name`. `cast` must be a function with two
-    parameters: the SQL value and a cursor object. It should return the
-    appropriate Python object.
+    Returns a list of pairs of SQL type names and the functions that
+    cast values of those types to Python objects. A cast function has
+    two parameters: the SQL value and a cursor object.
+    """
+    from nfldb.types import Clock, _Enum, Enums, FieldPosition, PossessionTime
+    return [
+        ('game_phase', _Enum._pg_cast(Enums.game_phase)),
+        ('season_phase', _Enum._pg_cast(Enums.season_phase)),
+        ('game_day', _Enum._pg_cast(Enums.game_day)),
+        ('player_pos', _Enum._pg_cast(Enums.player_pos)),
+        ('player_status', _Enum._pg_cast(Enums.player_status)),
+        ('game_time', Clock._pg_cast),
+        ('pos_period', PossessionTime._pg_cast),
+        ('field_pos', FieldPosition._pg_cast),
+    ]
 
-    Note that `sql_type_name` is not escaped.
+
+def _type_oids(conn):
+    """
+    Returns the OIDs that values of the types in `_type_casts` have
+    in the connection `conn`, in the same order. Only one query is
+    executed.
+
+    Note that the type names are not escaped.
+    """
+    with Tx(conn) as c:
+        c.execute('SELECT %s' % ', '.join('NULL::%s' % name
+                                          for name, _ in _type_casts()))
+        return [col.type_code for col in c.description]
+
+
+def _setup(conn, timezone, preload_teams=False):
+    """
+    Sets the time zone of `conn` and, if `preload_teams` is true and
+    the teams of its database aren't cached, fills the cache used by
+    `nfldb.Team`. Only one round trip is made.
     """
+    import nfldb.types
+
+    preload = preload_teams and conn.dsn not in nfldb.types._team_caches
     with Tx(conn) as c:
-        c.execute('SELECT NULL::%s' % sql_type_name)
-        typ = new_type((c.description[0].type_code,), sql_type_name, cast)
-        register_type(typ)
+        sql = c.mogrify('SET timezone = %s', (timezone,))
+        if preload:
+            sql += '; SELECT team_id, city, name FROM team'
+        c.execute(sql)
+        if preload:
+            nfldb.types.Team._cache_teams(conn, c.fetchall())
 
 
 def _db_name(conn):
@@ -237,6 +376,355 @@ def _num_rows(cursor, table):
     return cursor.fetchone()['rowcount']
 
 
+_listeners = []
+"""
+The functions called with every `nfldb.Statement` executed. See
+`nfldb.add_query_listener`.
+"""
+
+_listeners_lock = threading.Lock()
+"""Protects modifications of `_listeners`."""
+
+_current = threading.local()
+"""
+The `nfldb.Statement` whose results are being fetched and hydrated in
+each thread, if any.
+"""
+
+
+def add_query_listener(callback):
+    """
+    Registers `callback` to be called with a `nfldb.Statement` for
+    every SQL statement executed with the cursor of a `nfldb.Tx` block,
+    once its results have been fetched and hydrated (i.e., when the
+    next statement is executed with the same cursor or when the block
+    exits). The callback is called in the thread that executed the
+    statement.
+
+    While any callback is registered, the cursors of `nfldb.Tx` blocks
+    measure every statement and the objects created from their rows,
+    which makes queries a bit slower. See also `nfldb.profile`.
+    """
+    with _listeners_lock:
+        _listeners.append(callback)
+
+
+def remove_query_listener(callback):
+    """
+    Unregisters a `callback` registered with
+    `nfldb.add_query_listener`.
+    """
+    with _listeners_lock:
+        _listeners.remove(callback)
+
+
+_fingerprint_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_fingerprint_lists = re.compile(r'(\?|\(\?(?:, \.\.\.)?\))(?:\s*,\s*\1)+')
+
+
+def _fingerprint(sql):
+    """
+    Returns `sql` with its literal values replaced by `?` and its
+    whitespace normalized, so that statements that only differ in the
+    values they use have the same fingerprint. Lists of values (like
+    the ones in `IN` and `VALUES` expressions) are collapsed to a
+    single value followed by `...`.
+    """
+    sql = ' '.join(_fingerprint_literals.sub('?', sql).split())
+    sql = _fingerprint_lists.sub(r'\1, ...', sql)
+    return _fingerprint_lists.sub(r'\1, ...', sql)
+
+
+def _caller(frame):
+    """
+    Returns a pair of the outermost public function of `nfldb` in the
+    call stack starting at `frame` (like `Query.as_plays` or the lazy
+    property `Play.play_players`) and the location, as `file:line`, of
+    the code outside of `nfldb` that called it.
+    """
+    caller = None
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module != 'nfldb' and not module.startswith('nfldb.'):
+            code = frame.f_code
+            return caller, '%s:%d' % (code.co_filename, frame.f_lineno)
+
+        name = frame.f_code.co_name
+        if not name.startswith('_') and not name.startswith('<'):
+            obj = frame.f_locals.get('self', frame.f_locals.get('cls'))
+            if obj is not None:
+                cls = obj if isinstance(obj, type) else type(obj)
+                name = '%s.%s' % (cls.__name__, name)
+            caller = name
+        frame = frame.f_back
+    return caller, None
+
+
+def _size(row):
+    """
+    Returns the approximate number of bytes that the values in `row`
+    took up when they were sent by the database.
+    """
+    n = 0
+    for v in (row.values() if isinstance(row, dict) else row):
+        if isinstance(v, basestring):
+            n += len(v)
+        elif v is not None:
+            n += len(str(v))
+    return n
+
+
+class Statement (object):
+    """
+    Measurements of one SQL statement executed with the cursor of a
+    `nfldb.Tx` block. Statements are given to the callbacks registered
+    with `nfldb.add_query_listener` and collected by `nfldb.profile`.
+    """
+    __slots__ = ['sql', 'fingerprint', 'duration', 'rows', 'bytes',
+                 'hydration', 'caller', 'location']
+
+    def __init__(self, sql, caller, location):
+        self.sql = sql
+        """The SQL that was executed, with its parameters."""
+
+        self.fingerprint = _fingerprint(sql)
+        """
+        The SQL without its literal values, which is the same for
+        statements that only differ in their parameters.
+        """
+
+        self.duration = 0.0
+        """
+        The seconds spent executing the statement and fetching its
+        rows, including converting them to Python values.
+        """
+
+        self.rows = 0
+        """The number of rows fetched."""
+
+        self.bytes = 0
+        """The approximate size of the values fetched, in bytes."""
+
+        self.hydration = 0.0
+        """The seconds spent creating `nfldb` objects from its rows."""
+
+        self.caller = caller
+        """
+        The name of the outermost public function or method of `nfldb`
+        that executed the statement, like `Query.as_plays`, or a lazily
+        loaded property like `Play.play_players`. It is `None` if the
+        statement was executed directly.
+        """
+
+        self.location = location
+        """Where the caller was called from, as `file:line`."""
+
+    def __str__(self):
+        return '%s (%.3fms, %d rows, %d bytes, %.3fms hydrating) %s' \
+               % (self.caller, self.duration * 1000, self.rows, self.bytes,
+                  self.hydration * 1000, self.fingerprint)
+
+
+class _InstrumentedCursor (object):
+    """
+    Wraps the cursor of a `nfldb.Tx` block to print the statements it
+    executes (when `_SHOW_QUERIES` is set) and to measure them for the
+    callbacks registered with `nfldb.add_query_listener`.
+    """
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._statement = None
+
+    def execute(self, *args, **kwargs):
+        global _NUM_QUERIES
+
+        self._finish()
+        if len(_listeners) > 0:
+            self._statement = Statement('', *_caller(sys._getframe(1)))
+            _current.statement = self._statement
+
+        start = time.time()
+        self._cursor.execute(*args, **kwargs)
+        if self._statement is not None:
+            self._statement.duration += time.time() - start
+            self._statement.sql = self._cursor.query
+            self._statement.fingerprint = _fingerprint(self._cursor.query)
+        if _SHOW_QUERIES:
+            _NUM_QUERIES += 1
+            print(self._cursor.query, file=sys.stderr, end='\n\n')
+
+    def _fetched(self, rows, start):
+        """
+        Adds the list of `rows` fetched since `start` to the
+        measurements of the last statement.
+        """
+        s = self._statement
+        if s is not None:
+            s.duration += time.time() - start
+            s.rows += len(rows)
+            s.bytes += sum(_size(row) for row in rows)
+
+    def fetchone(self):
+        start = time.time()
+        row = self._cursor.fetchone()
+        self._fetched([] if row is None else [row], start)
+        return row
+
+    def fetchmany(self, *args):
+        start = time.time()
+        rows = self._cursor.fetchmany(*args)
+        self._fetched(rows, start)
+        return rows
+
+    def fetchall(self):
+        start = time.time()
+        rows = self._cursor.fetchall()
+        self._fetched(rows, start)
+        return rows
+
+    def __iter__(self):
+        start = time.time()
+        for row in self._cursor:
+            self._fetched([row], start)
+            yield row
+            start = time.time()
+
+    def _finish(self):
+        """
+        Gives the last statement executed to every listener, now that
+        its results have been used.
+        """
+        s, self._statement = self._statement, None
+        if s is None:
+            return
+        if getattr(_current, 'statement', None) is s:
+            _current.statement = None
+        for callback in list(_listeners):
+            callback(s)
+
+    def __getattr__(self, k):
+        return getattr(self._cursor, k)
+
+
+def _timed_hydrator(hydrate):
+    """
+    Returns a version of the hydrator `hydrate` (see
+    `nfldb.Entity._hydrator`) that adds the time it takes to the
+    `nfldb.Statement` whose rows are being fetched.
+    """
+    def timed(db, t):
+        start = time.time()
+        obj = hydrate(db, t)
+        s = getattr(_current, 'statement', None)
+        if s is not None:
+            s.hydration += time.time() - start
+        return obj
+    return timed
+
+
+class Profile (object):
+    """
+    The statements executed inside of a `nfldb.profile` block.
+    """
+    def __init__(self):
+        self.statements = []
+        """Every `nfldb.Statement` executed, in order."""
+
+        self._lock = threading.Lock()
+
+    def _add(self, statement):
+        with self._lock:
+            self.statements.append(statement)
+
+    @property
+    def duration(self):
+        """The total seconds spent executing statements."""
+        return sum(s.duration for s in self.statements)
+
+    def groups(self):
+        """
+        Returns a list of the statements grouped by their caller and
+        fingerprint. Each group is a pair of the `(caller, fingerprint)`
+        key and its list of statements. Groups that took the longest
+        in total come first.
+        """
+        groups = OrderedDict()
+        for s in self.statements:
+            groups.setdefault((s.caller, s.fingerprint), []).append(s)
+
+        def total(group):
+            return sum(s.duration + s.hydration for s in group[1])
+        return sorted(groups.items(), key=total, reverse=True)
+
+    def n_plus_one(self, threshold=10):
+        """
+        Returns the groups (see `nfldb.Profile.groups`) that look like
+        N+1 query patterns: at least `threshold` statements with the
+        same fingerprint that were executed to load a relation lazily
+        (e.g., with `nfldb.Play.play_players` or
+        `nfldb.PlayPlayer.player`) instead of by a method of
+        `nfldb.Query`. They can usually be replaced by one query with
+        `nfldb.Query.prefetch`.
+        """
+        return [(key, group) for key, group in self.groups()
+                if len(group) >= threshold and key[0] is not None
+                and not key[0].startswith('Query.')]
+
+    def __str__(self):
+        lines = ['%d statements in %.3fms'
+                 % (len(self.statements), self.duration * 1000)]
+        suspects = set(key for key, _ in self.n_plus_one())
+        for key, group in self.groups():
+            lines.append('%s%dx %s (%.3fms, %d rows, %d bytes, '
+                         '%.3fms hydrating) %s'
+                         % ('N+1 ' if key in suspects else '', len(group),
+                            key[0], sum(s.duration for s in group) * 1000,
+                            sum(s.rows for s in group),
+                            sum(s.bytes for s in group),
+                            sum(s.hydration for s in group) * 1000, key[1]))
+        return '\n'.join(lines)
+
+
+@contextmanager
+def profile():
+    """
+    A `with` compatible function that records every statement executed
+    inside of its block in a `nfldb.Profile`:
+
+        #!python
+        with nfldb.profile() as prof:
+            for play in Query(db).game(gsis_id='2012090500').as_plays():
+                print play.drive
+        print prof
+        for (caller, fingerprint), statements in prof.n_plus_one():
+            print '%s ran %d times' % (caller, len(statements))
+
+    Statements are recorded from every thread.
+    """
+    prof = Profile()
+    add_query_listener(prof._add)
+    try:
+        yield prof
+    finally:
+        remove_query_listener(prof._add)
+
+
+_dialect = threading.local()
+"""
+The SQL dialect of the connection used by the innermost `nfldb.Tx`
+block of each thread. See `nfldb.db.dialect`.
+"""
+
+
+def dialect():
+    """
+    Returns the name of the SQL dialect that queries should be written
+    in: `postgresql`, or `sqlite` inside a `nfldb.Tx` block of a
+    connection returned by `nfldb.sqlite.connect`.
+    """
+    return getattr(_dialect, 'name', 'postgresql')
+
+
 class Tx (object):
     """
     Tx is a `with` compatible class that abstracts a transaction given
@@ -286,8 +774,13 @@ class Tx (object):
         self.__factory = factory
         if self.__factory is None:
             self.__factory = RealDictCursor
+        self.__dialect = None
+        self.__instrumented = None
 
     def __enter__(self):
+        self.__dialect = dialect()
+        _dialect.name = getattr(self.__conn, 'dialect', 'postgresql')
+
         # No biscuits for the psycopg2 author. Changed the public API in
         # 2.5 in a very very subtle way.
         # In 2.4, apparently `name` cannot be `None`. Why? I don't know.
@@ -295,24 +788,16 @@ class Tx (object):
             self.__cursor = self.__conn.cursor(cursor_factory=self.__factory)
         else:
             self.__cursor = self.__conn.cursor(self.__name, self.__factory)
-        c = self.__cursor
-
-        if _SHOW_QUERIES:
-            class _ (object):
-                def execute(self, *args, **kwargs):
-                    global _NUM_QUERIES
-
-                    _NUM_QUERIES += 1
-                    c.execute(*args, **kwargs)
-                    print(c.query, file=sys.stderr, end='\n\n')
-
-                def __getattr__(self, k):
-                    return getattr(c, k)
-            return _()
-        else:
-            return c
+        if _SHOW_QUERIES or len(_listeners) > 0:
+            self.__instrumented = _InstrumentedCursor(self.__cursor)
+            return self.__instrumented
+        return self.__cursor
 
     def __exit__(self, typ, value, traceback):
+        _dialect.name = self.__dialect
+        if self.__instrumented is not None:
+            self.__instrumented._finish()
+            self.__instrumented = None
         if not self.__cursor.closed:
             self.__cursor.close()
         if typ is not None:
@@ -325,6 +810,158 @@ class Tx (object):
             return True
 
 
+class IdentityMap (object):
+    """
+    An identity map of `nfldb` entities (games, drives, plays and
+    players) keyed by their primary keys. When a connection has an
+    identity map (see `nfldb.identity_map`), loading an entity that
+    is already in the map returns the object in the map instead of a
+    new one, and the lazy properties of entities (like
+    `nfldb.Play.drive` or `nfldb.PlayPlayer.player`) check the map
+    before querying the database.
+
+    The map holds at most `size` entities. When it is full, the least
+    recently used entity is evicted.
+
+    Objects in the map are never refreshed from the database. If the
+    database has changed, use `nfldb.IdentityMap.invalidate`.
+
+    Like the connection it belongs to, an identity map must not be
+    used by more than one thread at a time.
+    """
+    def __init__(self, size=10000):
+        self.size = size
+        """The maximum number of entities held in the map."""
+
+        self.hits = 0
+        """The number of lookups that found an entity in the map."""
+
+        self.misses = 0
+        """The number of lookups that did not find an entity."""
+
+        self._objs = OrderedDict()
+
+    @staticmethod
+    def _key(obj):
+        entity = type(obj)
+        pk = entity._sql_tables['primary']
+        return (entity, tuple(getattr(obj, f) for f in pk))
+
+    def get(self, entity, pk):
+        """
+        Returns the instance of `entity` (e.g., `nfldb.Game`) with the
+        primary key `pk`, which is a tuple of values in the order of
+        the primary key of `entity`. If no such instance is in the map,
+        then `None` is returned.
+        """
+        k = (entity, tuple(pk))
+        obj = self._objs.pop(k, None)
+        if obj is None:
+            self.misses += 1
+            return None
+        self._objs[k] = obj
+        self.hits += 1
+        return obj
+
+    def add(self, obj):
+        """
+        Adds the entity `obj` to the map and returns it. If an entity
+        with the same type and primary key is already in the map, then
+        that entity is returned instead and `obj` is discarded.
+        """
+        k = self._key(obj)
+        obj = self._objs.pop(k, obj)
+        self._objs[k] = obj
+        while len(self._objs) > self.size:
+            self._objs.popitem(last=False)
+        return obj
+
+    def invalidate(self, entity=None, pk=None):
+        """
+        Removes entities from the map. With no arguments, the map is
+        emptied. If `entity` is given, then only instances of `entity`
+        are removed, and if `pk` is also given, then only the instance
+        with that primary key is removed.
+        """
+        if entity is None:
+            self._objs.clear()
+        elif pk is not None:
+            self._objs.pop((entity, tuple(pk)), None)
+        else:
+            for k in [k for k in self._objs if k[0] is entity]:
+                del self._objs[k]
+
+    def __len__(self):
+        return len(self._objs)
+
+
+_identity_maps = weakref.WeakKeyDictionary()
+"""A map from connections to the `nfldb.IdentityMap` attached to them."""
+
+_identity_maps_lock = threading.Lock()
+"""Guards the creation of identity maps in `_identity_maps`."""
+
+
+def identity_map(conn, size=10000):
+    """
+    Returns the `nfldb.IdentityMap` attached to the connection `conn`.
+    If `conn` doesn't have one, then a new map holding at most `size`
+    entities is attached and returned.
+
+    If `size` is `0`, then any identity map is detached from `conn`
+    and `None` is returned.
+
+    Identity maps are disabled by default.
+    """
+    with _identity_maps_lock:
+        if size == 0:
+            _identity_maps.pop(conn, None)
+            return None
+        if conn not in _identity_maps:
+            _identity_maps[conn] = IdentityMap(size)
+        return _identity_maps[conn]
+
+
+_unpickle_conn = None
+"""The connection used by unpickled entities. See `_unpickle_connection`."""
+
+
+def set_unpickle_connection(conn):
+    """
+    Sets the connection used by `nfldb` objects that were unpickled.
+    Pickles never include a database connection, so an unpickled
+    object only asks for one when it needs the database, e.g., to load
+    `nfldb.Play.drive`.
+
+    If no connection is set, then one is made with `nfldb.connect` the
+    first time that an unpickled object needs the database.
+    """
+    global _unpickle_conn
+    _unpickle_conn = conn
+
+
+def _unpickle_connection():
+    """
+    Returns the connection set with `nfldb.set_unpickle_connection`,
+    connecting with `nfldb.connect` first if none has been set.
+    """
+    global _unpickle_conn
+    if _unpickle_conn is None:
+        _unpickle_conn = connect()
+    return _unpickle_conn
+
+
+def _identity(conn, obj):
+    """
+    Returns the canonical instance of the entity `obj` if `conn` has
+    an identity map. Otherwise, `obj` is returned.
+    """
+    imap = _identity_maps.get(conn)
+    if imap is None:
+        return obj
+    return imap.add(obj)
+
+
 def _big_insert(cursor, table, datas):
     """
     Given a database cursor, table name and a list of asssociation
@@ -0,0 +1,169 @@
+"""
+Summaries of the plans that PostgreSQL chooses for the queries of
+`nfldb.Query`. See `nfldb.Query.explain`.
+"""
+from __future__ import absolute_import, division, print_function
+from collections import namedtuple
+
+__pdoc__ = {}
+
+
+_STAT_TABLES = ('play', 'play_player', 'agg_play')
+"""
+The tables that are too big to be scanned sequentially without
+being noticed.
+"""
+
+_MISESTIMATE_FACTOR = 10
+"""
+The factor by which the number of rows that PostgreSQL estimates a
+plan node will return must be off to be reported as a misestimate.
+"""
+
+_SLOWEST = 5
+"""The number of the slowest plan nodes reported."""
+
+
+class PlanNode (namedtuple('PlanNode', ['node_type', 'relation', 'depth',
+                                        'cost', 'time', 'rows',
+                                        'estimated_rows', 'loops'])):
+    """
+    A node of a query plan. `node_type` is its type as reported by
+    PostgreSQL (e.g., `Seq Scan` or `Hash Join`), `relation` is the
+    table it reads (or `None`) and `depth` is its depth in the plan.
+    `cost` is the total cost estimated by the planner.
+
+    The rest of the fields are only set when the query was run (and
+    are `None` otherwise): `time` is the number of seconds spent in
+    the node itself, excluding its children, over all of its `loops`.
+    `rows` is the number of rows it returned per loop, and
+    `estimated_rows` is the number of rows the planner expected.
+    """
+    __slots__ = ()
+
+    @property
+    def estimate_error(self):
+        """
+        The factor by which the planner's row estimate was off, which
+        is always at least `1`, or `None` if the query wasn't run.
+        """
+        if self.rows is None:
+            return None
+        actual, estimate = max(1, self.rows), max(1, self.estimated_rows)
+        return max(actual / estimate, estimate / actual)
+
+    def __str__(self):
+        s = '  ' * self.depth + self.node_type
+        if self.relation is not None:
+            s += ' on %s' % self.relation
+        if self.time is None:
+            return '%s (cost=%.2f)' % (s, self.cost)
+        return '%s (%.3fms, rows=%d, estimated=%d, loops=%d)' \
+               % (s, self.time * 1000, self.rows, self.estimated_rows,
+                  self.loops)
+
+
+def _nodes(plan, depth=0):
+    """
+    Returns a list of `nfldb.explain.PlanNode` for the node `plan`
+    and all of its descendents, from the JSON output of `EXPLAIN`.
+    """
+    children = plan.get('Plans', [])
+    time, rows, loops = None, None, None
+    if 'Actual Total Time' in plan:
+        loops = plan['Actual Loops']
+        time = plan['Actual Total Time'] * loops
+        for child in children:
+            time -= child.get('Actual Total Time', 0) \
+                * child.get('Actual Loops', 1)
+        time, rows = max(0, time) / 1000, plan['Actual Rows']
+    node = PlanNode(plan['Node Type'], plan.get('Relation Name'), depth,
+                    plan['Total Cost'], time, rows, plan['Plan Rows'], loops)
+    nodes = [node]
+    for child in children:
+        nodes += _nodes(child, depth + 1)
+    return nodes
+
+
+class Explanation (object):
+    """
+    The plan of a query along with a breakdown of where the time
+    spent running it went. Returned by `nfldb.Query.explain`.
+    """
+    def __init__(self, sql, plan, timings):
+        self.sql = sql
+        """The SQL that was explained."""
+
+        self.plan = plan
+        """The plan as returned by `EXPLAIN (FORMAT JSON)`."""
+
+        self.nodes = _nodes(plan['Plan'])
+        """
+        Every node in the plan as a `nfldb.explain.PlanNode`, in
+        depth first order.
+        """
+
+        self.timings = timings
+        """
+        An ordered dictionary of the seconds spent in each stage of
+        running the query from Python: `generate` (building the SQL),
+        `execute` (running it and receiving the rows), `fetch`
+        (converting rows to Python values) and `hydrate` (creating
+        `nfldb` objects). Only `generate` is present if the query
+        wasn't run.
+        """
+
+        self.planning_time = plan.get('Planning Time')
+        """The milliseconds PostgreSQL spent planning the query."""
+
+        self.execution_time = plan.get('Execution Time')
+        """
+        The milliseconds PostgreSQL spent executing the query, or
+        `None` if it wasn't run.
+        """
+
+    @property
+    def slowest(self):
+        """
+        The nodes where the most time was spent, slowest first. If
+        the query wasn't run, then the most costly nodes are returned
+        instead.
+        """
+        if self.execution_time is None:
+            key = lambda n: n.cost
+        else:
+            key = lambda n: n.time
+        return sorted(self.nodes, key=key, reverse=True)[:_SLOWEST]
+
+    @property
+    def seq_scans(self):
+        """
+        The nodes that scan one of the `play`, `play_player` or
+        `agg_play` tables sequentially.
+        """
+        return [n for n in self.nodes
+                if n.node_type == 'Seq Scan' and n.relation in _STAT_TABLES]
+
+    @property
+    def misestimates(self):
+        """
+        The nodes whose estimated number of rows was off by a factor
+        of at least 10.
+        """
+        return [n for n in self.nodes if n.rows is not None
+                and n.estimate_error >= _MISESTIMATE_FACTOR]
+
+    def __str__(self):
+        lines = ['Plan:'] + ['  ' + str(n) for n in self.nodes]
+        for name in ('slowest', 'seq_scans', 'misestimates'):
+            nodes = getattr(self, name)
+            if len(nodes) > 0:
+                lines.append('%s:' % name.replace('_', ' ').capitalize())
+                lines += ['  ' + str(n).strip() for n in nodes]
+        lines.append('Timings:')
+        if self.execution_time is not None:
+            lines.append('  database: %.3fms planning, %.3fms executing'
+                         % (self.planning_time, self.execution_time))
+        for stage, secs in self.timings.items():
+            lines.append('  %s: %.3fms' % (stage, secs * 1000))
+        return '\n'.join(lines)
@@ -0,0 +1,250 @@
+"""
+Runs many queries at once, each on one of a set of database
+connections, so that independent questions (or pieces of one big
+question) are answered in parallel. See `nfldb.run_parallel`.
+"""
+from __future__ import absolute_import, division, print_function
+import heapq
+import itertools
+import Queue
+import threading
+
+import nfldb.db
+from nfldb.db import Tx
+import nfldb.query
+import nfldb.types as types
+
+__pdoc__ = {}
+
+
+def run_parallel(queries, workers=4, method='as_games', shards=None,
+                 pool=None, **kwargs):
+    """
+    Executes every `nfldb.Query` in `queries` with `workers`
+    connections at a time and returns a list of their results, in
+    the same order as `queries`. The results of a query are the
+    return value of its method named `method` (e.g., `as_plays` or
+    `as_aggregate`), which is called with `kwargs`. For example, to
+    find the top rushers of each season:
+
+        #!python
+        qs = []
+        for year in range(2009, 2016):
+            q = nfldb.Query(db).game(season_year=year, season_type='Regular')
+            qs.append(q.sort('rushing_yds').limit(10))
+        for year, top in zip(range(2009, 2016),
+                             nfldb.run_parallel(qs, method='as_aggregate')):
+            print year, top[0].player, top[0].rushing_yds
+
+    Alternatively, `queries` may be a single query that is split into
+    shards, one for each dictionary of `nfldb.Query.game` criteria in
+    `shards`. Then the results of every shard are merged into one
+    list, which is what the query would return on its own as long as
+    the shards don't overlap (and cover all of the games it matches).
+    If the query is sorted, then the results are merged in sorted
+    order and only the top `limit` results are kept. For example:
+
+        #!python
+        q = nfldb.Query(db).play(passing_yds__ge=40).sort('passing_yds')
+        shards = [{'season_year': y} for y in range(2009, 2016)]
+        plays = nfldb.run_parallel(q.limit(20), method='as_plays',
+                                   shards=shards)
+
+    (Shards can also be ranges of games, like
+    `{'gsis_id__ge': '2012090500', 'gsis_id__lt': '2012100100'}`.)
+    Since statistics summed over each shard can't be combined without
+    their limits and aggregate criteria going wrong, `as_aggregate`
+    cannot be sharded.
+
+    Every query sees the same snapshot of the database: the first
+    connection starts a `REPEATABLE READ` transaction and exports its
+    snapshot with `pg_export_snapshot`, which every other connection
+    imports.
+
+    If `pool` is an `nfldb.Pool`, then connections are borrowed from
+    it. Otherwise, `workers` connections are made with
+    `nfldb.connect` (using the configuration file) and closed when
+    done. Either way, the objects returned are bound to the connection
+    of the query they came from, so that their relations are loaded
+    with it.
+    """
+    assert method.startswith('as_') and method != 'as_columns', \
+        'cannot run the method "%s" in parallel' % method
+    assert shards is None or method != 'as_aggregate', \
+        'aggregates of different shards cannot be merged'
+    if shards is not None:
+        query = queries
+        queries = []
+        for criteria in shards:
+            queries.append(query._bind(query._db).game(**criteria))
+    else:
+        queries = list(queries)
+    if len(queries) == 0:
+        return []
+
+    workers = max(1, min(workers, len(queries)))
+    if pool is None:
+        conns = [nfldb.db.connect(fast=True) for _ in range(workers)]
+    else:
+        conns = [pool.getconn() for _ in range(workers)]
+    try:
+        results = _run(conns, queries, method, kwargs)
+    finally:
+        for conn in conns:
+            if pool is None:
+                conn.close()
+            else:
+                pool.putconn(conn)
+
+    for q, objs in zip(queries, results):
+        _rebind(q._db, objs)
+    results = [_canonical(q._db, objs) for q, objs in zip(queries, results)]
+    if shards is None:
+        return results
+    return _merge(queries[0], method, results)
+
+
+def _run(conns, queries, method, kwargs):
+    """
+    Runs every query in `queries` with the connections in `conns`,
+    one thread per connection, in a single shared snapshot. The list
+    of results is returned in the same order as `queries`.
+    """
+    tasks = Queue.Queue()
+    for i, q in enumerate(queries):
+        tasks.put((i, q))
+    results = [None] * len(queries)
+    errors = []
+
+    def work(conn, snapshot):
+        try:
+            with Tx(conn) as cursor:
+                if snapshot is not None:
+                    cursor.execute('''
+                        SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;
+                        SET TRANSACTION SNAPSHOT %s
+                    ''', (snapshot,))
+                while len(errors) == 0:
+                    try:
+                        i, q = tasks.get_nowait()
+                    except Queue.Empty:
+                        break
+                    results[i] = getattr(q._bind(conn), method)(**kwargs)
+        except Exception as e:
+            errors.append(e)
+
+    # The transaction of the first connection must stay open until every
+    # other connection has imported its snapshot, so it is the outermost
+    # transaction here and its queries are run in this thread.
+    with Tx(conns[0]) as cursor:
+        cursor.execute('''
+            SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;
+            SELECT pg_export_snapshot() AS snapshot
+        ''')
+        snapshot = cursor.fetchone()['snapshot']
+
+        threads = [threading.Thread(target=work, args=(conn, snapshot))
+                   for conn in conns[1:]]
+        for t in threads:
+            t.start()
+        work(conns[0], None)
+        for t in threads:
+            t.join()
+    if len(errors) > 0:
+        raise errors[0]
+    return results
+
+
+_relation_attrs = ['_game', '_drive', '_play', '_player', '_drives', '_plays',
+                   '_play_players']
+"""The attributes of entities that hold the entities they relate to."""
+
+
+def _rebind(db, objs):
+    """
+    Binds every entity in the list `objs`, and every entity related
+    to them that has been loaded, to the connection `db`.
+    """
+    seen = set()
+    stack = list(objs)
+    while len(stack) > 0:
+        obj = stack.pop()
+        if id(obj) in seen or not hasattr(obj, '_db'):
+            continue
+        seen.add(id(obj))
+        obj._db = db
+        for attr in _relation_attrs:
+            related = getattr(obj, attr, None)
+            if isinstance(related, list):
+                stack.extend(related)
+            elif related is not None:
+                stack.append(related)
+
+
+def _canonical(db, objs):
+    """
+    Replaces the entities in `objs` with their canonical instances in
+    the identity map of `db`, like the `as_*` methods of
+    `nfldb.Query` do.
+    """
+    identified = (types.Game, types.Drive, types.Play, types.Player)
+    if len(objs) == 0 or not isinstance(objs[0], identified):
+        return objs
+    return nfldb.query._identities(db, objs)
+
+
+_method_entities = {
+    'as_games': types.Game,
+    'as_drives': types.Drive,
+    'as_plays': types.Play,
+    'as_play_players': types.PlayPlayer,
+    'as_players': types.Player,
+}
+"""The entities returned by each method that can be sharded."""
+
+
+class _Descending (object):
+    """Wraps a value so that it sorts in the reverse order."""
+    __slots__ = ['value']
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __ne__(self, other):
+        return self.value != other.value
+
+
+def _merge(query, method, results):
+    """
+    Merges the lists of results of the shards of `query` into one.
+    If `query` is sorted, then each list is in sorted order, and the
+    top results of all of them are found with a k-way merge.
+    """
+    # The results must be merged in exactly the order that each shard
+    # sorted them in, including the primary key that breaks ties.
+    if method == 'as_plays':
+        sorter = query._play_sorter()
+    else:
+        sorter = query._sorter(_method_entities[method])
+    if len(sorter.exprs) == 0:
+        merged = itertools.chain(*results)
+    else:
+        def key(obj):
+            k = []
+            for _, field, order in sorter.exprs:
+                v = getattr(obj, field)
+                v = (v is None, v)
+                k.append(_Descending(v) if order == 'DESC' else v)
+            return k
+        decorated = [[((key(obj), j, i), obj) for i, obj in enumerate(objs)]
+                     for j, objs in enumerate(results)]
+        merged = (obj for _, obj in heapq.merge(*decorated))
+    if sorter.limit > 0:
+        merged = itertools.islice(merged, sorter.limit)
+    return list(merged)
@@ -1,14 +1,27 @@
 from __future__ import absolute_import, division, print_function
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 try:
     from collections import OrderedDict
 except ImportError:
     from ordereddict import OrderedDict
+import array
+import copy
+import itertools
+import json
 import re
+import threading
+import time
+import weakref
 
 from psycopg2.extensions import cursor as tuple_cursor
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
-from nfldb.db import Tx
+import nfldb.aio
+import nfldb.explain
+from nfldb.db import _identity, _identity_maps, dialect, Tx
 import nfldb.sql as sql
 import nfldb.types as types
 
@@ -45,21 +58,101 @@ def aggregate(objs):
     The order of the list returned is stable with respect to the
     order of players obtained from each element in `objs`.
 
+    `objs` may be any iterable, including a generator such as the
+    ones returned by `nfldb.Query.iter_plays`. It is consumed only
+    once, and when NumPy is installed, statistics are summed in
+    batches so that memory use is bounded by the number of distinct
+    players rather than by the size of `objs`.
+
     It is recommended to use `nfldb.Query.aggregate` and
     `nfldb.Query.as_aggregate` instead of this function since summing
     statistics in the database is much faster. However, this function
     is provided for aggregation that cannot be expressed by the query
     interface.
     """
-    summed = OrderedDict()
-    for obj in objs:
-        pps = [obj] if isinstance(obj, types.PlayPlayer) else obj.play_players
-        for pp in pps:
+    if numpy is None:
+        summed = OrderedDict()
+        for pp in _play_players(objs):
             if pp.player_id not in summed:
                 summed[pp.player_id] = pp._copy()
             else:
                 summed[pp.player_id]._add(pp)
-    return summed.values()
+        return summed.values()
+    return _aggregate_vectors(objs)
+
+
+_AGGREGATE_BATCH_SIZE = 10000
+"""
+The number of `nfldb.PlayPlayer` statistics vectors that
+`nfldb.aggregate` buffers before summing them with NumPy.
+"""
+
+
+def _play_players(objs):
+    """
+    Generates every `nfldb.PlayPlayer` in `objs` in the order described
+    by `nfldb.aggregate`.
+    """
+    for obj in objs:
+        if isinstance(obj, types.PlayPlayer):
+            yield obj
+        else:
+            for pp in obj.play_players:
+                yield pp
+
+
+def _aggregate_vectors(objs, batch_size=_AGGREGATE_BATCH_SIZE):
+    """
+    The implementation of `nfldb.aggregate` when NumPy is available.
+
+    The statistics vector of each `nfldb.PlayPlayer` is appended to a
+    buffer along with the index of its player. Every `batch_size`
+    vectors, the buffer is grouped by player and added into a matrix of
+    totals with one row per player. Everything other than statistics
+    (game, team, player meta data, etc.) is merged exactly as
+    `nfldb.PlayPlayer._add` would.
+    """
+    ncats = len(types._player_categories)
+    players, summed = {}, []
+    totals = numpy.zeros((64, ncats))
+    rows, stats = array.array('l'), array.array('f')
+
+    def flush():
+        if len(rows) == 0:
+            return
+        # This is `numpy.add.at(totals, rows, stats)`, but `add.at` is
+        # unbuffered and several times slower than sorting the batch by
+        # player and summing each run of rows with `add.reduceat`.
+        idx = numpy.frombuffer(rows, dtype=numpy.dtype('l'))
+        vecs = numpy.frombuffer(stats, dtype=numpy.float32)
+        vecs = vecs.reshape(len(rows), ncats)
+        order = numpy.argsort(idx, kind='mergesort')
+        idx = idx[order]
+        starts = numpy.flatnonzero(numpy.r_[True, idx[1:] != idx[:-1]])
+        totals[idx[starts]] += numpy.add.reduceat(
+            vecs[order].astype(numpy.float64), starts)
+        del rows[:], stats[:]
+
+    for pp in _play_players(objs):
+        i = players.get(pp.player_id)
+        if i is None:
+            i = players[pp.player_id] = len(summed)
+            summed.append(pp._copy())
+            if i == len(totals):
+                totals = numpy.concatenate([totals, numpy.zeros_like(totals)])
+        else:
+            summed[i]._merge(pp)
+        rows.append(i)
+        stats.extend(pp._stats)
+        if len(rows) >= batch_size:
+            flush()
+    flush()
+
+    totals = totals[:len(summed)].astype(numpy.float32)
+    for pp, row in zip(summed, totals):
+        pp._stats = array.array('f', row.tostring())
+        pp._fields = None
+    return summed
 
 
 def current(db):
@@ -79,6 +172,305 @@ def current(db):
     return tuple([None] * 3)
 
 
+_cursor_ids = itertools.count()
+"""
+A counter used to give every server-side cursor opened by the `iter_*`
+methods of `nfldb.Query` a unique name.
+"""
+
+
+def _cursor_name():
+    """Returns a fresh name for a server-side cursor."""
+    return 'nfldb_iter_%d' % next(_cursor_ids)
+
+
+def _fetch_batches(cursor, batch_size):
+    """
+    Yields every row in the result set of `cursor`, fetching at most
+    `batch_size` rows at a time from the database.
+    """
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if len(rows) == 0:
+            break
+        for row in rows:
+            yield row
+
+
+def _plays_with_players(db, rows):
+    """
+    Given an iterable of rows produced by the query from
+    `nfldb.Query._fill_plays_query`, yields each `nfldb.Play` with its
+    `play_players` attribute filled.
+    """
+    init_play = types.Play._hydrator()
+    init_pp = types.PlayPlayer._hydrator()
+    npcols = len(types.Play.sql_fields())
+
+    play, pid = None, None
+    for row in rows:
+        # The first three columns are the primary key of a play.
+        if row[0:3] != pid:
+            if play is not None:
+                yield play
+            play, pid = _identity(db, init_play(db, row)), row[0:3]
+            play._play_players = []
+        if row[npcols] is not None:
+            pp = init_pp(db, row[npcols:])
+            pp._play = play
+            play._play_players.append(pp)
+    if play is not None:
+        yield play
+
+
+_group_by_entities = [types.PlayPlayer, types.Play, types.Drive,
+                      types.Game, types.Player]
+"""
+The entities searched, in order, for a field given to the `group_by`
+parameter of `nfldb.Query.as_aggregate`.
+"""
+
+_aggregate_row_types = {}
+"""
+A cache of named tuple types for the rows returned by
+`nfldb.Query.as_aggregate` when grouping, keyed by their field names.
+"""
+
+
+def _group_by_entity(field):
+    """
+    Returns the first entity in `nfldb.query._group_by_entities` that
+    has `field`.
+    """
+    for entity in _group_by_entities:
+        if field in entity.sql_fields():
+            return entity
+    assert False, "The field '%s' cannot be used with group_by." % field
+
+
+def _aggregate_row_type(fields):
+    """
+    Returns a named tuple type with the given field names for rows
+    of aggregate statistics.
+    """
+    if fields not in _aggregate_row_types:
+        _aggregate_row_types.setdefault(fields,
+                                        namedtuple('AggregateRow', fields))
+    return _aggregate_row_types[fields]
+
+
+_COLUMN_NULL = -2147483648
+"""
+The value used for `NULL` in integer columns returned by
+`nfldb.Query.as_columns`. (The smallest 32 bit integer.)
+"""
+
+_column_types = weakref.WeakKeyDictionary()
+"""
+A map from database connection to a dictionary from `(entity, field)`
+pairs to the name of the SQL type of that field.
+"""
+
+
+def _column_type_names(db, cursor, entity, fields):
+    """
+    Returns a list of the names of the SQL types of each field in
+    `fields` for `entity`. The types are looked up in the database the
+    first time they're needed for each connection.
+    """
+    known = _column_types.setdefault(db, {})
+    missing = [f for f in fields if (entity, f) not in known]
+    if len(missing) > 0:
+        cursor.execute('SELECT %s %s LIMIT 0' % (
+            ', '.join(entity._sql_select_fields(missing)), entity._sql_from()))
+        oids = [d.type_code for d in cursor.description]
+        cursor.execute('SELECT oid, typname FROM pg_type WHERE oid IN %s',
+                       (tuple(set(oids)),))
+        names = dict(cursor.fetchall())
+        for f, oid in zip(missing, oids):
+            known[(entity, f)] = names[oid]
+    return [known[(entity, f)] for f in fields]
+
+
+def _enum_code(enum, sql):
+    """
+    Returns a SQL expression that converts the SQL expression `sql`
+    of the enumeration type `enum` to the `value` of its member in
+    `nfldb.Enums`.
+    """
+    whens = ' '.join("WHEN '%s' THEN %d" % (m.name, m.value) for m in enum)
+    return '(CASE %s %s END)' % (sql, whens)
+
+
+def _column_sql(typname, field):
+    """
+    Given the name of the SQL type of the SQL expression `field`,
+    returns a pair of an `array` type code and a SQL expression that
+    converts `field` to a value storable in such an array. If the
+    value cannot be stored in an `array`, then the type code is `None`
+    and `field` is returned unchanged.
+    """
+    def integer(sql, typecode='i'):
+        return typecode, 'COALESCE(%s, %d)' % (sql, _COLUMN_NULL)
+
+    def real(sql):
+        return 'd', "COALESCE((%s)::float8, 'NaN')" % sql
+
+    if typname in ('int2', 'int4'):
+        return integer(field)
+    elif typname == 'int8':
+        return integer(field, typecode='l')
+    elif typname == 'bool':
+        return integer('(%s)::int' % field)
+    elif typname in ('float4', 'float8', 'numeric'):
+        return real(field)
+    elif typname in ('timestamp', 'timestamptz'):
+        return real('EXTRACT(EPOCH FROM %s)' % field)
+    elif typname == 'game_time':
+        phase = _enum_code(types.Enums.game_phase, '(%s).phase' % field)
+        return integer('%s * 1000 + (%s).elapsed' % (phase, field))
+    elif typname == 'field_pos':
+        return integer('(%s).pos' % field)
+    elif typname == 'pos_period':
+        return integer('(%s).elapsed' % field)
+    elif isinstance(getattr(types.Enums, typname, None), type):
+        return integer(_enum_code(getattr(types.Enums, typname), field))
+    return None, field
+
+
+_PREPARE_QUERIES = True
+"""
+When `True`, the `as_*` methods of `nfldb.Query` compile their SQL
+once per query shape and execute it with `PREPARE` and `EXECUTE`.
+Set this to `False` if your connections go through a pooler that
+does not preserve session state (like PgBouncer in transaction mode).
+"""
+
+_COMPILED_CACHE_SIZE = 256
+"""
+The maximum number of compiled queries to keep in the cache. This is
+also the maximum number of prepared statements kept on any single
+connection.
+"""
+
+_compiled = OrderedDict()
+"""
+A least-recently-used cache of compiled queries. Keys are query shapes
+(see `nfldb.Condition._shape`) and values are pairs of a prepared
+statement name and the SQL template with positional parameters.
+"""
+
+_compiled_stats = {'hits': 0, 'misses': 0, 'prepares': 0}
+"""Counters for the compiled query cache. See `compiled_cache_info`."""
+
+_prepared = weakref.WeakKeyDictionary()
+"""
+A map from database connection to an ordered set (as an `OrderedDict`)
+of prepared statement names that exist on that connection.
+"""
+
+_statement_ids = itertools.count()
+"""A counter used to name every compiled query uniquely."""
+
+_compiled_lock = threading.Lock()
+"""
+Guards `_compiled`, `_compiled_stats` and `_prepared`, which are shared
+by all threads. (The statements prepared on any one connection are only
+touched by the thread using that connection.)
+"""
+
+
+def compiled_cache_info():
+    """
+    Returns a dictionary with statistics about the cache of compiled
+    queries used by the `as_*` methods of `nfldb.Query`. The keys
+    are `hits`, `misses`, `prepares` (the number of `PREPARE`
+    statements sent to the database over all connections) and
+    `size` (the number of query shapes currently cached).
+    """
+    with _compiled_lock:
+        return dict(_compiled_stats, size=len(_compiled))
+
+
+def clear_compiled_cache():
+    """
+    Empties the cache of compiled queries and resets its counters.
+    Statements that were already prepared on open connections are
+    left alone and deallocated as they fall out of use.
+    """
+    with _compiled_lock:
+        _compiled.clear()
+        for k in _compiled_stats:
+            _compiled_stats[k] = 0
+
+
+class _Parameters (object):
+    """
+    Stands in for a database cursor while compiling a query. Instead
+    of quoting values into the SQL text, `mogrify` replaces each
+    placeholder with a positional parameter (`$1`, `$2`, ...) and
+    saves the value in `values`.
+    """
+    def __init__(self):
+        self.values = []
+
+    def mogrify(self, fmt, args):
+        pieces = fmt.split('%s')
+        assert len(pieces) == len(args) + 1, \
+            'wrong number of arguments for "%s"' % fmt
+        sql = pieces[0]
+        for arg, piece in zip(args, pieces[1:]):
+            self.values.append(arg)
+            sql += '$%d%s' % (len(self.values), piece)
+        return sql
+
+
+def _execute_compiled(db, cursor, shape, values, compile):
+    """
+    Executes a compiled query identified by `shape` with the
+    parameters `values` using `cursor`, which must be a cursor for
+    the connection `db`.
+
+    If no query is cached for `shape`, then `compile` is called with
+    an instance of `nfldb.query._Parameters` and must return the SQL
+    template for the query. Collecting values for the same shape must
+    always produce them in the order that `compile` binds them.
+    """
+    with _compiled_lock:
+        compiled = _compiled.pop(shape, None)
+        _compiled_stats['misses' if compiled is None else 'hits'] += 1
+    if compiled is None:
+        params = _Parameters()
+        template = compile(params)
+        assert len(params.values) == len(values), \
+            'compiled query has %d parameters but %d values were given' \
+            % (len(params.values), len(values))
+        compiled = ('nfldb_query_%d' % next(_statement_ids), template)
+    name, template = compiled
+    with _compiled_lock:
+        _compiled[shape] = compiled
+        while len(_compiled) > _COMPILED_CACHE_SIZE:
+            _compiled.popitem(last=False)
+        names = _prepared.setdefault(db, OrderedDict())
+
+    if name in names:
+        names[name] = names.pop(name)
+    else:
+        cursor.execute('PREPARE %s AS %s' % (name, template))
+        with _compiled_lock:
+            _compiled_stats['prepares'] += 1
+        names[name] = True
+        while len(names) > _COMPILED_CACHE_SIZE:
+            old, _ = names.popitem(last=False)
+            cursor.execute('DEALLOCATE %s' % old)
+
+    if len(values) == 0:
+        cursor.execute('EXECUTE %s' % name)
+    else:
+        placeholders = ', '.join(['%s'] * len(values))
+        cursor.execute('EXECUTE %s (%s)' % (name, placeholders), values)
+
+
 def _entities_by_ids(db, entity, *ids):
     """
     Given an `nfldb` `entity` like `nfldb.Play` and a list of tuples
@@ -86,22 +478,219 @@ def _entities_by_ids(db, entity, *ids):
     primary key) for `entity`, return a list of instances of `entity`
     corresponding to the `ids` given.
 
+    All tuples in `ids` must have the same length. They are joined with
+    the table of `entity` as a `VALUES` list, so that only one query is
+    executed regardless of the number of `ids`.
+
     The order of the returned entities is undefined.
+
+    If `db` has an identity map (see `nfldb.identity_map`), then
+    entities in the map are returned without querying for them, and
+    entities that are queried are added to the map. (Only tuples with
+    a complete primary key are looked up in the map.)
     """
-    funs = {
-        types.Game: {'query': Query.game, 'results': Query.as_games},
-        types.Drive: {'query': Query.drive, 'results': Query.as_drives},
-        types.Play: {'query': Query.play, 'results': Query.as_plays},
-        types.PlayPlayer: {'query': Query.play_player,
-                           'results': Query.as_play_players},
-        types.Player: {'query': Query.player, 'results': Query.as_players},
-    }[entity]
-    q = Query(db)
-    entq = funs['query']
-    for pkey in ids:
-        named = dict(zip(entity._sql_tables['primary'], pkey))
-        q.orelse(entq(Query(db), **named))
-    return funs['results'](q)
+    if len(ids) == 0:
+        return []
+    pk = entity._sql_tables['primary'][0:len(ids[0])]
+    assert all(len(pkey) == len(pk) for pkey in ids), \
+        'all ids must have the same number of columns'
+
+    results = []
+    imap = _identity_maps.get(db)
+    if imap is not None and len(pk) == len(entity._sql_tables['primary']):
+        missing = []
+        for pkey in ids:
+            obj = imap.get(entity, pkey)
+            if obj is None:
+                missing.append(pkey)
+            else:
+                results.append(obj)
+        ids = missing
+        if len(ids) == 0:
+            return results
+    with Tx(db, factory=tuple_cursor) as cursor:
+        row_tpl = '(%s)' % ', '.join(['%s'] * len(pk))
+        values = ', '.join(cursor.mogrify(row_tpl, pkey) for pkey in ids)
+        if dialect() == 'sqlite':
+            # SQLite can't name the columns of a `VALUES` list.
+            q = '''
+                SELECT {columns} {from_tables}
+                WHERE ({fields}) IN (VALUES {values})
+            '''
+        else:
+            q = '''
+                SELECT {columns} {from_tables}
+                INNER JOIN (VALUES {values}) AS ids ({pk})
+                ON ({fields}) = ({ids_fields})
+            '''
+        q = q.format(
+            columns=', '.join(entity._sql_select_fields(entity.sql_fields())),
+            from_tables=entity._sql_from(),
+            values=values,
+            pk=', '.join(pk),
+            fields=', '.join(entity._sql_field(k) for k in pk),
+            ids_fields=', '.join('ids.%s' % k for k in pk),
+        )
+        cursor.execute(q)
+        init = entity._hydrator()
+        for row in cursor.fetchall():
+            results.append(_identity(db, init(db, row)))
+    return results
+
+
+def _identities(db, objs):
+    """
+    Returns the list of entities `objs` with each entity replaced by
+    its canonical instance in the identity map of `db`, if there is
+    one.
+    """
+    imap = _identity_maps.get(db)
+    if imap is None:
+        return objs
+    return [imap.add(obj) for obj in objs]
+
+
+def _group_by_key(objs, fields):
+    """
+    Returns an `OrderedDict` mapping tuples of the values of `fields`
+    to lists of the objects in `objs` with those values.
+    """
+    groups = OrderedDict()
+    for obj in objs:
+        key = tuple(getattr(obj, f) for f in fields)
+        groups.setdefault(key, []).append(obj)
+    return groups
+
+
+def _children(db, entity, parents, fields):
+    """
+    Fetches every instance of `entity` whose values for `fields`
+    match one of `parents` (where `fields` is a prefix of the primary
+    key of `entity`). Returns a dictionary that maps each parent to
+    a list of its children.
+    """
+    ids = list(set(tuple(getattr(p, f) for f in fields) for p in parents))
+    children = _group_by_key(_entities_by_ids(db, entity, *ids), fields)
+    return dict((p, children.get(tuple(getattr(p, f) for f in fields), []))
+                for p in parents)
+
+
+def _prefetch_drives(db, games, loaded):
+    by_game = _children(db, types.Drive, games, ['gsis_id'])
+    drives = []
+    for g in games:
+        g._drives = sorted(by_game[g], key=lambda d: d.drive_id)
+        for d in g._drives:
+            d._game = g
+        drives += g._drives
+    return drives
+
+
+def _prefetch_plays(db, parents, loaded):
+    def play_order(p):
+        return (p.time, p.play_id)
+
+    if isinstance(parents[0], types.Drive):
+        fields = ['gsis_id', 'drive_id']
+    else:
+        fields = ['gsis_id']
+    by_parent = _children(db, types.Play, parents, fields)
+    plays = []
+    for parent in parents:
+        parent._plays = sorted(by_parent[parent], key=play_order)
+        if isinstance(parent, types.Drive):
+            for p in parent._plays:
+                p._drive = parent
+        plays += parent._plays
+
+    # If plays were loaded through drives, then the games of those drives
+    # may as well know about them too.
+    if isinstance(parents[0], types.Drive) and types.Game in loaded:
+        by_game = _group_by_key(plays, ['gsis_id'])
+        for g in loaded[types.Game]:
+            g._plays = sorted(by_game.get((g.gsis_id,), []), key=play_order)
+    return plays
+
+
+def _prefetch_play_players(db, plays, loaded):
+    fields = ['gsis_id', 'drive_id', 'play_id']
+    by_play = _children(db, types.PlayPlayer, plays, fields)
+    pps = []
+    for p in plays:
+        p._play_players = sorted(by_play[p], key=lambda pp: pp.player_id)
+        for pp in p._play_players:
+            pp._play = p
+        pps += p._play_players
+    return pps
+
+
+def _prefetch_player(db, pps, loaded):
+    ids = [(pid,) for pid in set(pp.player_id for pp in pps)]
+    players = dict((p.player_id, p)
+                   for p in _entities_by_ids(db, types.Player, *ids))
+    for pp in pps:
+        pp._player = players.get(pp.player_id)
+    return players.values()
+
+
+def _prefetch_parents(entity, attr):
+    """
+    Returns a prefetch function that fills `attr` in each object with
+    the instance of `entity` that contains it.
+    """
+    def prefetch(db, objs, loaded):
+        types._fill(db, entity, objs, attr)
+        return list(set(getattr(obj, attr) for obj in objs))
+    return prefetch
+
+
+_prefetchers = {
+    'drives': (types.Drive, [(types.Game, _prefetch_drives)]),
+    'plays': (types.Play, [(types.Drive, _prefetch_plays),
+                           (types.Game, _prefetch_plays)]),
+    'play_players': (types.PlayPlayer, [(types.Play, _prefetch_play_players)]),
+    'player': (types.Player, [(types.PlayPlayer, _prefetch_player)]),
+    'play': (types.Play,
+             [(types.PlayPlayer, _prefetch_parents(types.Play, '_play'))]),
+    'drive': (types.Drive,
+              [(types.Play, _prefetch_parents(types.Drive, '_drive'))]),
+    'game': (types.Game,
+             [(types.Drive, _prefetch_parents(types.Game, '_game'))]),
+}
+"""
+A map from relation names accepted by `nfldb.Query.prefetch` to a
+pair of the entity the relation loads and a list of pairs of an entity
+that has the relation and a function that loads the relation for a
+list of objects of that entity. Each function is called with a
+database connection, the list of objects and a dictionary of all
+entities loaded so far. It returns the objects that were loaded.
+
+When more than one entity has a relation, the first one in the list
+that has already been loaded is used.
+"""
+
+
+def _prefetch(db, entity, objs, relations):
+    """
+    Loads each relation in `relations` for the list of `entity`
+    objects in `objs`, in order. Each relation is loaded from the
+    objects of the entity it belongs to that were loaded by the
+    previous relations (or `objs` itself), with one query per relation.
+    """
+    loaded = {entity: objs}
+    for rel in relations:
+        target, sources = _prefetchers[rel]
+        for source, prefetch in sources:
+            if source in loaded:
+                break
+        else:
+            assert False, \
+                "Cannot prefetch '%s' from %s." \
+                % (rel, ', '.join(e.__name__ for e in loaded))
+        if len(loaded[source]) == 0:
+            loaded[target] = []
+        else:
+            loaded[target] = prefetch(db, loaded[source], loaded)
 
 
 def player_search(db, full_name, team=None, position=None,
@@ -144,6 +733,8 @@ def player_search(db, full_name, team=None, position=None,
     functions for comparing using Soundex.
     """
     assert isinstance(limit, int) and limit >= 1
+    assert getattr(db, 'dialect', 'postgresql') == 'postgresql', \
+        'player_search requires a PostgreSQL connection'
 
     if soundex:
         # Careful, soundex distances are sorted in reverse of Levenshtein
@@ -247,6 +838,191 @@ def _comp_suffix(s):
     return 'eq'
 
 
+_relations = [
+    (types.Game, 'game', 'drives'),
+    (types.Drive, 'drive', 'plays'),
+    (types.Play, 'play', 'play_players'),
+    (types.PlayPlayer, 'play_player', None),
+]
+"""
+The entities that can be walked from one to another, ordered from
+the coarsest to the finest. Each is given with the variable name used
+for its objects in compiled predicates and the attribute holding its
+children.
+"""
+
+_python_compiled = {}
+"""
+A cache of functions compiled by `nfldb.query._python_compile`, keyed
+by their source.
+"""
+
+
+def _python_compile(source, name):
+    """
+    Compiles the Python `source` of a function that takes a list of
+    values `_v` and a list of coercion functions `_c` (see
+    `nfldb.query._coercer`), and returns the function `name` it
+    defines.
+    """
+    if source not in _python_compiled:
+        namespace = {}
+        exec(compile(source, '<nfldb %s>' % name, 'exec'), namespace)
+        _python_compiled.setdefault(source, namespace['make'])
+    return _python_compiled[source]
+
+
+def _coercer(value):
+    """
+    Returns a function that converts `value` to the type of the value
+    it's compared with. This lets enumeration fields be compared with
+    the names of their members, like in SQL.
+    """
+    cache = {}
+
+    def convert(t, v):
+        if issubclass(t, types._Enum) and isinstance(v, strtype):
+            return t[v]
+        return v
+
+    def coerce(x):
+        t = type(x)
+        if t not in cache:
+            if isinstance(value, (list, tuple)):
+                cache[t] = tuple(convert(t, v) for v in value)
+            else:
+                cache[t] = convert(t, value)
+        return cache[t]
+    return coerce
+
+
+def _python_var(entity):
+    if entity is types.Player:
+        return 'player'
+    return [var for e, var, _ in _relations if e is entity][0]
+
+
+def _python_field(entity, var, field):
+    """
+    Returns a Python expression for the value of `field` of the
+    `entity` object named `var`. Derived fields are computed from the
+    fields they're derived from, in the same way as in SQL.
+    """
+    if entity in (types.Play, types.PlayPlayer):
+        if field in types.PlayPlayer._derived_combined:
+            fields = types.PlayPlayer._derived_combined[field]
+            return 'max(%s)' % ', '.join('%s.%s' % (var, f) for f in fields)
+        elif field == 'points':
+            return 'max(%s)' % ', '.join('%s.%s * %d' % (var, f, pval)
+                                         for f, pval
+                                         in types.PlayPlayer._point_values)
+    if entity is types.Play and field == 'game_date':
+        return '%s.gsis_id[:8]' % var
+    return '%s.%s' % (var, field)
+
+
+def _python_where(cond, values):
+    """
+    Returns a Python expression equivalent to the criteria in the
+    `nfldb.Condition` `cond`, or an empty string if there are none.
+    The values compared are appended to `values` and referred to by
+    their index in `_v`. Like `NULL` in SQL, `None` never matches.
+    """
+    if isinstance(cond, Comparison):
+        i = len(values)
+        values.append(cond.value)
+        x = _python_field(cond.entity, _python_var(cond.entity), cond.column)
+        if isinstance(cond.value, (list, tuple)):
+            assert cond.operator == '=', \
+                'Disjunctions must use "=" for column "%s"' % cond.column
+            return '%s in _c[%d](%s)' % (x, i, x)
+        if cond.operator == '=':
+            op = '=='
+        else:
+            op = cond.operator
+        if isinstance(cond.value, strtype):
+            v = '_c[%d](%s)' % (i, x)
+        else:
+            v = '_v[%d]' % i
+        checks = []
+        if not x.startswith('max('):
+            checks.append('%s is not None' % x)
+        if hasattr(cond.value, 'valid'):
+            checks.append('%s.valid' % x)
+        return ' and '.join(checks + ['%s %s %s' % (x, op, v)])
+
+    terms = [_python_where(c, values) for c in cond._andalso]
+    terms = [' and '.join('(%s)' % t for t in terms if t)]
+    terms += [_python_where(c, values) for c in cond._orelse]
+    return ' or '.join('(%s)' % t for t in terms if t)
+
+
+def _python_predicate(entity, cond):
+    """
+    Returns a predicate for objects of `entity` that is `True` if and
+    only if the object is matched by the criteria in `cond`.
+
+    Criteria on other entities are evaluated through the relations of
+    each object (like `nfldb.Play.drive` or `nfldb.Play.play_players`),
+    which are loaded from the database if they haven't been already.
+    As with a join in SQL, an object is matched if any combination of
+    its related objects satisfies the criteria.
+    """
+    values = []
+    where = _python_where(cond, values) or 'True'
+
+    entities = cond._entities()
+    if entity is types.Player:
+        assert entities <= set([types.Player]), \
+            'only player criteria can be used to filter players'
+        entities.add(types.Player)
+    elif types.Player in entities:
+        entities.add(types.PlayPlayer)
+    order = [e for e, _, _ in _relations]
+    ents = entities.union([entity]).difference([types.Player])
+    start = order.index(entity) if entity in order else 0
+    first = min(order.index(e) for e in ents) if ents else start
+    last = max(order.index(e) for e in ents) if ents else start
+
+    var = _python_var(entity)
+    lines = ['def make(_v, _c):', '    def predicate(%s):' % var]
+    for i in range(start, first, -1):
+        lines.append('        %s = %s.%s' % (_relations[i - 1][1],
+                                             _relations[i][1],
+                                             _relations[i - 1][1]))
+    indent = '        '
+    for i in range(start, last):
+        lines.append('%sfor %s in %s.%s:' % (indent, _relations[i + 1][1],
+                                            _relations[i][1], _relations[i][2]))
+        indent += '    '
+    if types.Player in entities and entity is not types.Player:
+        lines.append('%splayer = play_player.player' % indent)
+    lines.append('%sif %s:' % (indent, where))
+    lines.append('%s    return True' % indent)
+    lines.append('        return False')
+    lines.append('    return predicate')
+    make = _python_compile('\n'.join(lines) + '\n', 'predicate')
+    return make(values, [_coercer(v) for v in values])
+
+
+def _python_sort(entity, objs, sorter):
+    """
+    Sorts the list of `entity` objects `objs` in place by the sort
+    expressions in `sorter`. As in PostgreSQL, `None` is bigger than
+    every other value.
+    """
+    var = _python_var(entity)
+    for _, field, order in reversed(sorter.exprs):
+        if field not in entity.sql_fields():
+            raise ValueError('%s is not a valid sort field for %s'
+                             % (field, entity.__name__))
+        x = _python_field(entity, var, field)
+        source = 'def make(_v, _c):\n    return lambda %s: (%s is None, %s)\n' \
+                 % (var, x, x)
+        key = _python_compile(source, 'sort key')(None, None)
+        objs.sort(key=key, reverse=(order == 'DESC'))
+
+
 class Condition (object):
     """
     An abstract class that describes the interface of components
@@ -275,6 +1051,20 @@ class Condition (object):
         """
         assert False, "subclass responsibility"
 
+    def _shape(self, values, aggregate=False):
+        """
+        Returns a hashable value describing the structure of this
+        condition without any of its values. Two conditions with the
+        same shape produce the same SQL up to the values compared.
+
+        The values of this condition are appended to the list `values`
+        in the same order that `nfldb.Condition._sql_where` uses them.
+
+        If `aggregate` is `True`, then the shape of the aggregate
+        conditions is returned instead of regular conditions.
+        """
+        assert False, "subclass responsibility"
+
     @classmethod
     def _disjunctions(cls, cursor, disjuncts, aliases=None, aggregate=False):
         """
@@ -338,6 +1128,14 @@ class Comparison (Condition):
     def _entities(self):
         return set([self.entity])
 
+    def _shape(self, values, aggregate=False):
+        if isinstance(self.value, tuple) or isinstance(self.value, list):
+            values.extend(self.value)
+            return (self.entity, self.column, self.operator, len(self.value))
+        else:
+            values.append(self.value)
+            return (self.entity, self.column, self.operator, None)
+
     def __str__(self):
         return '%s %s %s' \
                % (self.entity._sql_field(self.column),
@@ -347,14 +1145,20 @@ class Comparison (Condition):
         field = self.entity._sql_field(self.column, aliases=aliases)
         if aggregate:
             field = 'SUM(%s)' % field
-        if isinstance(self.value, tuple) or isinstance(self.value, list):
+        value = self.value
+        if dialect() == 'sqlite':
+            # Enumerations are stored as integers in SQLite, so the
+            # names of members can't be compared with them directly.
+            value = cursor.connection._adapt_field(self.entity, self.column,
+                                                   value)
+        if isinstance(value, tuple) or isinstance(value, list):
             assert self.operator == '=', \
                 'Disjunctions must use "=" for column "%s"' % field
-            vals = [cursor.mogrify('%s', (v,)) for v in self.value]
+            vals = [cursor.mogrify('%s', (v,)) for v in value]
             return '%s IN (%s)' % (field, ', '.join(vals))
         else:
             paramed = '%s %s %s' % (field, self.operator, '%s')
-            return cursor.mogrify(paramed, (self.value,))
+            return cursor.mogrify(paramed, (value,))
 
 
 def QueryOR(db):
@@ -490,6 +1294,13 @@ class Query (Condition):
 
         # The aggregate counter-parts of the above.
         self._agg_andalso, self._agg_orelse = [], []
+        self._agg_group_by = None
+
+        self._prefetch = []
+        """Relations to load for the results. See `Query.prefetch`."""
+
+        self._after = None
+        """The last result of the previous page. See `Query.after`."""
         if orelse:
             self._agg_default_cond = self._agg_orelse
         else:
@@ -569,13 +1380,116 @@ class Query (Condition):
         self._limit = count
         return self
 
+    def prefetch(self, *relations):
+        """
+        Specifies relations to load along with the results of the
+        `as_games`, `as_drives`, `as_plays` and `as_play_players`
+        methods, so that accessing them later doesn't query the
+        database once for every object. Each relation is loaded with a
+        single query, so walking the objects costs the same number of
+        queries no matter how many there are.
+
+        The relations are `drives`, `plays`, `play_players`, `player`,
+        `play`, `drive` and `game`, which correspond to the attributes
+        of the same name in `nfldb.Game`, `nfldb.Drive`, `nfldb.Play`
+        and `nfldb.PlayPlayer`. They are loaded in the order given, and
+        each is loaded for the objects of the most recently loaded
+        entity that has it. For example, to walk every play and player
+        statistic of every game in a season:
+
+            #!python
+            q = Query(db).game(season_year=2012, season_type='Regular')
+            q.prefetch('drives', 'plays', 'play_players', 'player')
+            for game in q.as_games():
+                for drive in game.drives:
+                    for play in drive.plays:
+                        for pp in play.play_players:
+                            print pp.player, pp.passing_yds
+
+        Note that the relations are not restricted by the criteria of
+        the query. (e.g., `drives` loads *every* drive of each game.)
+        """
+        for rel in relations:
+            assert rel in _prefetchers, 'unknown relation: %s' % rel
+        self._prefetch += relations
+        return self
+
+    def after(self, last):
+        """
+        Restricts the results to those that come after `last` in the
+        sort order of the query, where `last` is the last result of
+        the previous page. This pages through results with a condition
+        on the sort fields instead of skipping rows, so every page is
+        as cheap to retrieve as the first one. For example:
+
+            #!python
+            q = Query(db).game(season_year=2012).sort('passing_yds')
+            page = q.limit(50).as_plays()
+            while len(page) > 0:
+                ...
+                page = q.after(page[-1]).as_plays()
+
+        The primary key of the results is added to the sort criteria
+        of limited or paged queries, which makes their order total.
+        (`nfldb.Query.as_plays` always does this.)
+
+        `last` may also be a tuple of the values of the sort fields
+        followed by the fields of the primary key that aren't sorted
+        on, in the same order.
+
+        Keyset pagination is not supported by
+        `nfldb.Query.as_aggregate` or `nfldb.Query.filter_objects`.
+        """
+        self._after = last
+        return self
+
     def _sorter(self, default_entity):
-        return Sorter(default_entity, self._sort_exprs, self._limit)
+        sorter = Sorter(default_entity, self._sort_exprs, self._limit)
+        # Limited results must be in a total order for `Query.after` to
+        # find the next page, so the primary key breaks ties.
+        paged = self._limit or self._after is not None
+        if paged and default_entity in _group_by_entities:
+            sorted_fields = set(f for _, f, _ in sorter.exprs)
+            sorter.add_exprs(*[(f, 'asc')
+                               for f in default_entity._sql_tables['primary']
+                               if f not in sorted_fields])
+        return sorter
+
+    def _keyset(self, sorter):
+        """
+        Returns the SQL template and arguments of the condition added
+        by `nfldb.Query.after` for results sorted by `sorter`. If no
+        condition was added, the template is empty.
+        """
+        if self._after is None:
+            return '', []
+        if isinstance(self._after, (tuple, list)):
+            values = list(self._after)
+        else:
+            values = [getattr(self._after, f) for _, f in sorter.keys()]
+        return sorter.keyset(values)
 
     def _assert_no_aggregate(self):
         assert len(self._agg_andalso) == 0 and len(self._agg_orelse) == 0, \
             'aggregate criteria are only compatible with as_aggregate'
 
+    def _bind(self, db):
+        """
+        Returns a copy of `self` that runs on the connection `db`.
+        Criteria added to the copy are not added to `self`.
+        """
+        q = copy.copy(self)
+        q._db = db
+        q._andalso, q._orelse = list(self._andalso), list(self._orelse)
+        q._agg_andalso = list(self._agg_andalso)
+        q._agg_orelse = list(self._agg_orelse)
+        if self._default_cond is self._orelse:
+            q._default_cond, q._agg_default_cond = q._orelse, q._agg_orelse
+        else:
+            q._default_cond, q._agg_default_cond = q._andalso, q._agg_andalso
+        q._prefetch = list(self._prefetch)
+        return q
+
     def andalso(self, *conds):
         """
         Adds the list of `nfldb.Query` objects in `conds` to this
@@ -722,15 +1636,24 @@ class Query (Condition):
         `nfldb.Query.game`, `nfldb.Query.play`, etc. (Regular criteria
         restrict *what to aggregate* while aggregate criteria restrict
         *aggregated results*.)
+
+        The special keyword `group_by` may be used to set the fields
+        that statistics are aggregated over. See
+        `nfldb.Query.as_aggregate` for details.
         """
+        if 'group_by' in kw:
+            self._agg_group_by = kw.pop('group_by')
         _append_conds(self._agg_default_cond, types.PlayPlayer, kw)
         return self
 
-    def _make_join_query(self, cursor, entity, only_prim=False, sorter=None,
-                         ent_fillers=None):
-        if sorter is None:
-            sorter = self._sorter(entity)
-
+    def _join_parts(self, cursor, entity, sorter, ent_fillers=None):
+        """
+        Returns the pieces of a query that finds the `entity` rows
+        matched by the criteria in `self`, as a dictionary with the
+        `from`, `joins` and `where` clauses and the list of `groupby`
+        fields that collapse the joined rows to one row per `entity`.
+        (The list is empty if no rows need to be collapsed.)
+        """
         entities = self._entities()
         entities.update(sorter.entities)
         for ent in ent_fillers or []:
@@ -747,31 +1670,49 @@ class Query (Condition):
                 or (entity is types.Player and len(entities) > 0):
             entities.add(types.PlayPlayer)
 
-        if only_prim:
-            columns = entity._sql_tables['primary']
-            fields = entity._sql_select_fields(fields=columns)
-        else:
-            fields = []
-            for ent in ent_fillers or []:
-                fields += ent._sql_select_fields(fields=ent.sql_fields())
-            fields += entity._sql_select_fields(fields=entity.sql_fields())
-        args = {
-            'columns': ', '.join(fields),
+        # The criteria are bound before the keyset condition, in the
+        # same order as `Query._execute` collects their values.
+        where = self._sql_where(cursor)
+        keyset, keyset_args = self._keyset(sorter)
+        if keyset:
+            keyset = cursor.mogrify(keyset, keyset_args)
+        parts = {
             'from': entity._sql_from(),
             'joins': entity._sql_join_all(entities),
-            'where': sql.ands(self._sql_where(cursor)),
-            'groupby': '',
-            'sortby': sorter.sql(),
+            'where': sql.ands(where, keyset),
+            'groupby': [],
         }
 
         # We need a GROUP BY if we're joining with a table that has more
         # specific information. e.g., selecting from game with criteria
         # for plays.
         if any(entity._sql_relation_distance(to) > 0 for to in entities):
-            fields = []
             for table, _ in entity._sql_tables['tables']:
-                fields += entity._sql_primary_key(table)
-            args['groupby'] = 'GROUP BY ' + ', '.join(fields)
+                parts['groupby'] += entity._sql_primary_key(table)
+        return parts
+
+    def _make_join_query(self, cursor, entity, only_prim=False, sorter=None,
+                         ent_fillers=None, select=None):
+        if sorter is None:
+            sorter = self._sorter(entity)
+
+        if only_prim:
+            columns = entity._sql_tables['primary']
+            fields = entity._sql_select_fields(fields=columns)
+        elif select is not None:
+            fields = select
+        else:
+            fields = []
+            for ent in ent_fillers or []:
+                fields += ent._sql_select_fields(fields=ent.sql_fields())
+            fields += entity._sql_select_fields(fields=entity.sql_fields())
+        args = self._join_parts(cursor, entity, sorter, ent_fillers)
+        args['columns'] = ', '.join(fields)
+        args['sortby'] = sorter.sql()
+        if len(args['groupby']) > 0:
+            args['groupby'] = 'GROUP BY ' + ', '.join(args['groupby'])
+        else:
+            args['groupby'] = ''
 
         q = '''
             SELECT {columns} {from} {joins}
@@ -781,6 +1722,111 @@ class Query (Condition):
         '''.format(**args)
         return q
 
+    def _count_query(self, cursor, entity, sorter, exists=False):
+        """
+        Returns a query that counts the `entity` rows matched by the
+        criteria in `self` without retrieving them, or that checks
+        whether there are any if `exists` is `True`. Either way, the
+        rows are never grouped: a count of the distinct primary keys
+        stands in for the `GROUP BY` of `nfldb.Query._make_join_query`.
+        """
+        parts = self._join_parts(cursor, entity, sorter)
+        if exists:
+            return '''
+                SELECT EXISTS (SELECT 1 {from} {joins} WHERE {where})
+            '''.format(**parts)
+
+        pk = entity._sql_primary_key(entity._sql_primary_table())
+        if len(parts['groupby']) == 0:
+            parts['count'] = 'COUNT(*)'
+        elif len(pk) == 1:
+            parts['count'] = 'COUNT(DISTINCT %s)' % pk[0]
+        elif dialect() == 'sqlite':
+            # SQLite can only count distinct values of one expression.
+            parts['count'] = "COUNT(DISTINCT %s)" % " || '/' || ".join(pk)
+        else:
+            parts['count'] = 'COUNT(DISTINCT (%s))' % ', '.join(pk)
+        return '''
+            SELECT {count} {from} {joins}
+            WHERE {where}
+        '''.format(**parts)
+
+    def _execute(self, cursor, key, sorter, compile):
+        """
+        Executes the query produced by `compile` with `cursor`.
+
+        `key` identifies the kind of query being run (e.g., the entity
+        being selected) and, along with `sorter` and the shape of the
+        criteria in `self`, determines which compiled query is used.
+        `compile` is called with a stand-in for `cursor` whenever the
+        query needs to be compiled and must return its SQL.
+        """
+        if not _PREPARE_QUERIES or dialect() != 'postgresql':
+            cursor.execute(compile(cursor))
+            return
+
+        values = []
+        keyset, args = self._keyset(sorter)
+        shape = (key, self._shape(values), self._shape(values, True),
+                 tuple((f, o) for _, f, o in sorter.exprs), sorter.limit,
+                 keyset)
+        values += args
+        _execute_compiled(self._db, cursor, shape, values, compile)
+
+    def _execute_join_query(self, cursor, entity, only_prim=False,
+                            sorter=None):
+        """
+        Executes the query generated by `nfldb.Query._make_join_query`
+        with `cursor`.
+        """
+        if sorter is None:
+            sorter = self._sorter(entity)
+
+        def compile(cursor):
+            return self._make_join_query(cursor, entity,
+                                         only_prim=only_prim, sorter=sorter)
+        self._execute(cursor, (entity, only_prim), sorter, compile)
+
+    def count(self, entity):
+        """
+        Returns the number of results that the `as_*` method for
+        `entity` (e.g., `nfldb.Query.as_plays` for `nfldb.Play`) would
+        return, without retrieving them. For example, to count every
+        play in the 2012 regular season:
+
+            #!python
+            q = Query(db).game(season_year=2012, season_type='Regular')
+            print q.count(types.Play)
+
+        Only the count is sent by the database.
+        """
+        self._assert_no_aggregate()
+
+        sorter = self._sorter(entity)
+
+        def compile(cursor):
+            return self._count_query(cursor, entity, sorter)
+        with Tx(self._db, factory=tuple_cursor) as cursor:
+            self._execute(cursor, ('count', entity), sorter, compile)
+            n = cursor.fetchone()[0]
+        return n if not self._limit else min(n, self._limit)
+
+    def exists(self, entity):
+        """
+        Returns `True` if and only if the `as_*` method for `entity`
+        would return at least one result. (See `nfldb.Query.count`.)
+        The database stops looking as soon as it finds a match.
+        """
+        self._assert_no_aggregate()
+
+        sorter = self._sorter(entity)
+
+        def compile(cursor):
+            return self._count_query(cursor, entity, sorter, exists=True)
+        with Tx(self._db, factory=tuple_cursor) as cursor:
+            self._execute(cursor, ('exists', entity), sorter, compile)
+            return bool(cursor.fetchone()[0])
+
     def as_games(self):
         """
         Executes the query and returns the results as a list of
@@ -790,12 +1836,40 @@ class Query (Condition):
 
         results = []
         with Tx(self._db, factory=tuple_cursor) as cursor:
-            q = self._make_join_query(cursor, types.Game)
-            cursor.execute(q)
+            init = types.Game._hydrator()
+            self._execute_join_query(cursor, types.Game)
             for row in cursor.fetchall():
-                results.append(types.Game.from_row_tuple(self._db, row))
+                results.append(init(self._db, row))
+        results = _identities(self._db, results)
+        _prefetch(self._db, types.Game, results, self._prefetch)
         return results
 
+    def _iter_rows(self, entity, batch_size):
+        """
+        Executes the join query for `entity` with a server-side cursor
+        and yields each row in the result set. At most `batch_size`
+        rows are transferred from the database at a time.
+        """
+        with Tx(self._db, name=_cursor_name(), factory=tuple_cursor) as cursor:
+            cursor.execute(self._make_join_query(cursor, entity))
+            for row in _fetch_batches(cursor, batch_size):
+                yield row
+
+    def iter_games(self, batch_size=1000):
+        """
+        Like `nfldb.Query.as_games`, except the results are returned
+        as a generator of `nfldb.Game` objects. Rows are retrieved
+        from a server-side cursor in batches of `batch_size`.
+
+        Note that a transaction is held open until the generator is
+        exhausted (or closed).
+        """
+        self._assert_no_aggregate()
+
+        init = types.Game._hydrator()
+        for row in self._iter_rows(types.Game, batch_size):
+            yield _identity(self._db, init(self._db, row))
+
     def as_drives(self):
         """
         Executes the query and returns the results as a list of
@@ -805,26 +1879,34 @@ class Query (Condition):
 
         results = []
         with Tx(self._db, factory=tuple_cursor) as cursor:
-            q = self._make_join_query(cursor, types.Drive)
-            cursor.execute(q)
+            init = types.Drive._hydrator()
+            self._execute_join_query(cursor, types.Drive)
             for row in cursor.fetchall():
-                results.append(types.Drive.from_row_tuple(self._db, row))
+                results.append(init(self._db, row))
+        results = _identities(self._db, results)
+        _prefetch(self._db, types.Drive, results, self._prefetch)
         return results
 
-    def as_plays(self, fill=True):
+    def iter_drives(self, batch_size=1000):
         """
-        Executes the query and returns the results as a dictionary
-        of `nlfdb.Play` objects that don't have the `play_player`
-        attribute filled. The keys of the dictionary are play id
-        tuples with the spec `(gsis_id, drive_id, play_id)`.
+        Like `nfldb.Query.as_drives`, except the results are returned
+        as a generator of `nfldb.Drive` objects. Rows are retrieved
+        from a server-side cursor in batches of `batch_size`.
 
-        The primary key membership SQL expression is also returned.
+        Note that a transaction is held open until the generator is
+        exhausted (or closed).
         """
-        def make_pid(play):
-            return (play.gsis_id, play.drive_id, play.play_id)
-
         self._assert_no_aggregate()
 
+        init = types.Drive._hydrator()
+        for row in self._iter_rows(types.Drive, batch_size):
+            yield _identity(self._db, init(self._db, row))
+
+    def _play_sorter(self):
+        """
+        Returns a `nfldb.Sorter` for plays that always produces the same
+        order of rows for the same criteria.
+        """
         # This is pretty terrifying.
         # Apparently PostgreSQL can change the order of rows returned
         # depending on the columns selected. So e.g., if you sort by `down`
@@ -843,48 +1925,100 @@ class Query (Condition):
         consistent = [(c, 'asc') for c in ['gsis_id', 'drive_id', 'play_id']]
         sorter = Sorter(types.Play, self._sort_exprs, self._limit)
         sorter.add_exprs(*consistent)
+        return sorter
+
+    def _fill_plays_query(self, cursor, sorter):
+        """
+        Returns a query that selects every play matched by the
+        criteria in `self` along with each of its `play_player` rows.
+        The search is done only once: its results are joined with
+        the `play_player` table, so that each play appears in as many
+        consecutive rows as it has players (or once, if it has none).
+
+        The columns of each row are the columns of `nfldb.Play`
+        followed by the columns of `nfldb.PlayPlayer`. Rows are ordered
+        by `sorter` and then by player.
+        """
+        aliases = {'play_player': 'pp'}
+        plays = self._make_join_query(cursor, types.Play, sorter=sorter)
+        columns = types.PlayPlayer._sql_select_fields(
+            fields=types.PlayPlayer.sql_fields(), aliases=aliases)
+
+        # The sorting criteria are applied to the aliased columns of the
+        # play subquery. The limit has already been applied inside it.
+        order = [Sorter.order_sql('p.play_%s' % f, o)
+                 for _, f, o in sorter.exprs]
+        order.append('pp.player_id ASC')
+        return '''
+            SELECT p.*, {columns}
+            FROM ({plays}) AS p
+            LEFT JOIN play_player AS pp
+            ON (pp.gsis_id, pp.drive_id, pp.play_id)
+               = (p.play_gsis_id, p.play_drive_id, p.play_play_id)
+            ORDER BY {order}
+        '''.format(columns=', '.join(columns), plays=plays,
+                   order=', '.join(order))
 
+    def as_plays(self, fill=True):
+        """
+        Executes the query and returns the results as a dictionary
+        of `nlfdb.Play` objects that don't have the `play_player`
+        attribute filled. The keys of the dictionary are play id
+        tuples with the spec `(gsis_id, drive_id, play_id)`.
+
+        The primary key membership SQL expression is also returned.
+        """
+        self._assert_no_aggregate()
+
+        sorter = self._play_sorter()
         if not fill:
             results = []
             with Tx(self._db, factory=tuple_cursor) as cursor:
-                init = types.Play.from_row_tuple
-                q = self._make_join_query(cursor, types.Play, sorter=sorter)
-                cursor.execute(q)
+                init = types.Play._hydrator()
+                self._execute_join_query(cursor, types.Play, sorter=sorter)
                 for row in cursor.fetchall():
                     results.append(init(self._db, row))
-            return results
+            results = _identities(self._db, results)
         else:
-            plays = OrderedDict()
+            def compile(cursor):
+                return self._fill_plays_query(cursor, sorter)
+
             with Tx(self._db, factory=tuple_cursor) as cursor:
-                init_play = types.Play.from_row_tuple
-                q = self._make_join_query(cursor, types.Play, sorter=sorter)
-                cursor.execute(q)
-                for row in cursor.fetchall():
-                    play = init_play(self._db, row)
-                    play._play_players = []
-                    plays[make_pid(play)] = play
-
-                # Run the above query *again* as a subquery.
-                # This time, only fetch the primary key, and use that to
-                # fetch all the `play_player` records in one swoop.
-                aliases = {'play_player': 'pp'}
-                ids = self._make_join_query(cursor, types.Play,
-                                            only_prim=True, sorter=sorter)
-                from_tables = types.PlayPlayer._sql_from(aliases=aliases)
-                columns = types.PlayPlayer._sql_select_fields(
-                    fields=types.PlayPlayer.sql_fields(), aliases=aliases)
-                q = '''
-                    SELECT {columns} {from_tables}
-                    WHERE (pp.gsis_id, pp.drive_id, pp.play_id) IN ({ids})
-                '''.format(columns=', '.join(columns),
-                           from_tables=from_tables, ids=ids)
-
-                init_pp = types.PlayPlayer.from_row_tuple
-                cursor.execute(q)
-                for row in cursor.fetchall():
-                    pp = init_pp(self._db, row)
-                    plays[make_pid(pp)]._play_players.append(pp)
-            return plays.values()
+                self._execute(cursor, 'fill_plays', sorter, compile)
+                rows = cursor.fetchall()
+                results = list(_plays_with_players(self._db, rows))
+        _prefetch(self._db, types.Play, results, self._prefetch)
+        return results
+
+    def iter_plays(self, fill=True, batch_size=1000):
+        """
+        Like `nfldb.Query.as_plays`, except the results are returned
+        as a generator of `nfldb.Play` objects. Rows are retrieved
+        from a server-side cursor in batches of `batch_size`, so that
+        only a bounded number of plays is held in memory at any one
+        time.
+
+        If `fill` is `True`, then the `play_players` attribute of
+        each play is filled as the plays are generated.
+
+        Note that a transaction is held open until the generator is
+        exhausted (or closed).
+        """
+        self._assert_no_aggregate()
+
+        sorter = self._play_sorter()
+        with Tx(self._db, name=_cursor_name(), factory=tuple_cursor) as cur:
+            if not fill:
+                init = types.Play._hydrator()
+                cur.execute(self._make_join_query(cur, types.Play,
+                                                  sorter=sorter))
+                for row in _fetch_batches(cur, batch_size):
+                    yield _identity(self._db, init(self._db, row))
+            else:
+                cur.execute(self._fill_plays_query(cur, sorter))
+                rows = _fetch_batches(cur, batch_size)
+                for play in _plays_with_players(self._db, rows):
+                    yield play
 
     def as_play_players(self):
         """
@@ -902,13 +2036,28 @@ class Query (Condition):
 
         results = []
         with Tx(self._db, factory=tuple_cursor) as cursor:
-            init = types.PlayPlayer.from_row_tuple
-            q = self._make_join_query(cursor, types.PlayPlayer)
-            cursor.execute(q)
+            init = types.PlayPlayer._hydrator()
+            self._execute_join_query(cursor, types.PlayPlayer)
             for row in cursor.fetchall():
                 results.append(init(self._db, row))
+        _prefetch(self._db, types.PlayPlayer, results, self._prefetch)
         return results
 
+    def iter_play_players(self, batch_size=1000):
+        """
+        Like `nfldb.Query.as_play_players`, except the results are
+        returned as a generator of `nfldb.PlayPlayer` objects. Rows are
+        retrieved from a server-side cursor in batches of `batch_size`.
+
+        Note that a transaction is held open until the generator is
+        exhausted (or closed).
+        """
+        self._assert_no_aggregate()
+
+        init = types.PlayPlayer._hydrator()
+        for row in self._iter_rows(types.PlayPlayer, batch_size):
+            yield init(self._db, row)
+
     def as_players(self):
         """
         Executes the query and returns the results as a list of
@@ -917,15 +2066,102 @@ class Query (Condition):
         self._assert_no_aggregate()
 
         results = []
-        with Tx(self._db) as cursor:
-            q = self._make_join_query(cursor, types.Player)
-            cursor.execute(q)
-
+        with Tx(self._db, factory=tuple_cursor) as cursor:
+            init = types.Player._hydrator()
+            self._execute_join_query(cursor, types.Player)
             for row in cursor.fetchall():
-                results.append(types.Player.from_row_dict(self._db, row))
-        return results
+                results.append(init(self._db, row))
+        return _identities(self._db, results)
+
+    def iter_players(self, batch_size=1000):
+        """
+        Like `nfldb.Query.as_players`, except the results are returned
+        as a generator of `nfldb.Player` objects. Rows are retrieved
+        from a server-side cursor in batches of `batch_size`.
 
-    def as_aggregate(self):
+        Note that a transaction is held open until the generator is
+        exhausted (or closed).
+        """
+        self._assert_no_aggregate()
+
+        init = types.Player._hydrator()
+        for row in self._iter_rows(types.Player, batch_size):
+            yield _identity(self._db, init(self._db, row))
+
+    def as_columns(self, entity, fields=None, batch_size=10000):
+        """
+        Executes the query and returns the results for `entity` (e.g.,
+        `nfldb.Play`) as columns instead of objects. The return value
+        is an `OrderedDict` mapping each field in `fields` to a
+        sequence of values. When `fields` is `None`, then all fields
+        returned by `entity.sql_fields()` are used.
+
+        Numeric fields are stored in NumPy arrays if NumPy is
+        installed, and in `array.array` sequences otherwise. Fields
+        that aren't numeric (like `gsis_id` or `team`) are NumPy arrays
+        of Python objects, or plain lists without NumPy.
+
+        No `nfldb` objects are created. Instead, values of special types
+        are converted to integer codes:
+
+          * Enumerations become the `value` of the corresponding
+            member of `nfldb.Enums`.
+          * `nfldb.Clock` becomes `phase * 1000 + elapsed`, where
+            `phase` is the code for its game phase and `elapsed` is
+            the number of seconds elapsed in that phase.
+          * `nfldb.FieldPosition` becomes its offset from midfield,
+            in the range `[-50, 50]`.
+          * `nfldb.PossessionTime` becomes a number of seconds.
+          * Booleans become `0` or `1` and timestamps become seconds
+            since the UNIX epoch.
+
+        `NULL` is represented by `NaN` in real valued columns and by
+        `-2147483648` in integer columns.
+
+        Rows are retrieved from a server-side cursor in batches of
+        `batch_size`.
+        """
+        self._assert_no_aggregate()
+        assert entity in _ENTITIES.values(), 'unknown entity: %s' % entity
+        assert getattr(self._db, 'dialect', 'postgresql') == 'postgresql', \
+            'as_columns requires a PostgreSQL connection'
+
+        if fields is None:
+            fields = entity.sql_fields()
+        allowed = set(entity.sql_fields())
+        for f in fields:
+            assert f in allowed, \
+                "The field '%s' does not exist for entity '%s'." \
+                % (f, entity.__name__)
+
+        with Tx(self._db, factory=tuple_cursor) as cursor:
+            typnames = _column_type_names(self._db, cursor, entity, fields)
+        typecodes, select = [], []
+        for f, typname in zip(fields, typnames):
+            typecode, sql = _column_sql(typname, entity._sql_field(f))
+            typecodes.append(typecode)
+            select.append(sql)
+
+        columns = [[] if c is None else array.array(c) for c in typecodes]
+        with Tx(self._db, name=_cursor_name(), factory=tuple_cursor) as cur:
+            cur.execute(self._make_join_query(cur, entity, select=select))
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if len(rows) == 0:
+                    break
+                for column, values in zip(columns, zip(*rows)):
+                    column.extend(values)
+
+        if numpy is not None:
+            for i, column in enumerate(columns):
+                if typecodes[i] is None:
+                    columns[i] = numpy.array(column, dtype=object)
+                else:
+                    columns[i] = numpy.frombuffer(column,
+                                                  dtype=typecodes[i]).copy()
+        return OrderedDict(zip(fields, columns))
+
+    def as_aggregate(self, group_by=None):
         """
         Executes the query and returns the results as aggregated
         `nfldb.PlayPlayer` objects. This method is meant to be a more
@@ -936,12 +2172,56 @@ class Query (Condition):
 
         If any sorting criteria is specified, it is applied to the
         aggregate *player* values only.
+
+        By default, statistics are aggregated over each player. To
+        aggregate over something else, set `group_by` to a list of
+        fields. A field may belong to any of `nfldb.PlayPlayer`,
+        `nfldb.Play`, `nfldb.Drive`, `nfldb.Game` or `nfldb.Player`,
+        and is looked up in that order. (So `team` is the team in
+        `nfldb.PlayPlayer`.) For example, to get each team's total
+        passing yards in every week of the 2012 regular season:
+
+            #!python
+            q = Query(db).game(season_year=2012, season_type='Regular')
+            for row in q.as_aggregate(group_by=['team', 'week']):
+                print row.team, row.week, row.passing_yds
+
+        When `group_by` is given, the results are named tuples with
+        the fields in `group_by` followed by every player statistical
+        category and derived field of `nfldb.PlayPlayer`. Results may
+        also be sorted by the fields in `group_by`.
+
+        If `group_by` is `None`, then the value given with the
+        `group_by` keyword to `nfldb.Query.aggregate` is used.
+        """
+        key, sorter, compile, init = self._aggregate_query(group_by)
+        with Tx(self._db, factory=tuple_cursor) as cur:
+            self._execute(cur, key, sorter, compile)
+            return [init(row) for row in cur.fetchall()]
+
+    def _aggregate_query(self, group_by):
         """
+        Returns the query run by `nfldb.Query.as_aggregate` for
+        `group_by` as a tuple of the key and `nfldb.Sorter` given to
+        `nfldb.Query._execute`, the function that compiles the query
+        and a function that turns each row into a result.
+        """
+        assert self._after is None, \
+            'keyset pagination is not supported by as_aggregate'
+        if group_by is None:
+            group_by = self._agg_group_by
+        group_by = tuple(group_by or ())
+        groups = OrderedDict()
+        for field in group_by:
+            groups[field] = _group_by_entity(field)
+
         class AggPP (types.PlayPlayer):
             @classmethod
             def _sql_field(cls, name, aliases=None):
 
-                if name in cls._derived_combined:
+                if name in groups:
+                    return groups[name]._sql_field(name, aliases=aliases)
+                elif name in cls._derived_combined:
                     fields = cls._derived_combined[name]
                     fields = [cls._sql_field(f, aliases=aliases) for f in fields]
                     return ' + '.join(fields)
@@ -953,40 +2233,272 @@ class Query (Condition):
                     sql = super(AggPP, cls)._sql_field(name, aliases=aliases)
                     return 'SUM(%s)' % sql
 
-        joins = ''
-        results = []
-        with Tx(self._db) as cur:
-            for ent in self._entities():
+        sum_fields = types._player_categories.keys() \
+            + AggPP._sql_tables['derived']
+        for field in group_by:
+            assert field not in sum_fields, \
+                "Cannot group by the statistic '%s'." % field
+
+        def compile(cur):
+            joins = ''
+            for ent in self._entities().union(groups.values()):
                 if ent is types.PlayPlayer:
                     continue
                 joins += types.PlayPlayer._sql_join_to_all(ent)
 
-            sum_fields = types._player_categories.keys() \
-                + AggPP._sql_tables['derived']
+            if len(groups) == 0:
+                group_fields = ['play_player.player_id']
+                select_group_fields = [
+                    'play_player.player_id AS play_player_player_id']
+            else:
+                group_fields = [AggPP._sql_field(f) for f in groups]
+                select_group_fields = group_fields
             select_sum_fields = AggPP._sql_select_fields(sum_fields)
             where = self._sql_where(cur)
             having = self._sql_where(cur, aggregate=True)
-            q = '''
+            return '''
                 SELECT
-                    play_player.player_id AS play_player_player_id, {sum_fields}
+                    {group_fields}, {sum_fields}
                 FROM play_player
                 {joins}
                 WHERE {where}
-                GROUP BY play_player.player_id
+                GROUP BY {group_by}
                 HAVING {having}
                 {order}
             '''.format(
+                group_fields=', '.join(select_group_fields),
                 sum_fields=', '.join(select_sum_fields),
                 joins=joins,
                 where=sql.ands(where),
+                group_by=', '.join(group_fields),
                 having=sql.ands(having),
-                order=self._sorter(AggPP).sql(),
+                order=sorter.sql(),
             )
 
-            init = AggPP.from_row_dict
-            cur.execute(q)
-            for row in cur.fetchall():
-                results.append(init(self._db, row))
+        sorter = self._sorter(AggPP)
+        if len(groups) == 0:
+            init = types.PlayPlayer._hydrator(['player_id'] + sum_fields)
+            return 'aggregate', sorter, compile, lambda row: init(self._db, row)
+        else:
+            init = _aggregate_row_type(group_by + tuple(sum_fields))
+            return ('aggregate', group_by), sorter, compile, lambda r: init(*r)
+
+    def _as_async(self, conn, entity, sorter=None):
+        """
+        Returns a `nfldb.aio.Operation` that runs the join query for
+        `entity` on the asynchronous connection `conn`. Its value is
+        the list of `entity` objects found.
+        """
+        self._assert_no_aggregate()
+        assert len(self._prefetch) == 0, \
+            'relations cannot be prefetched asynchronously'
+
+        init = entity._hydrator()
+
+        def compile(cursor):
+            return self._make_join_query(cursor, entity, sorter=sorter)
+
+        def hydrate(rows):
+            results = [init(self._db, row) for row in rows]
+            if entity is types.PlayPlayer:
+                return results
+            return _identities(self._db, results)
+        return nfldb.aio.query(conn, compile, hydrate)
+
+    def as_games_async(self, conn):
+        """
+        Like `nfldb.Query.as_games`, except the query is run on the
+        asynchronous connection `conn` (see `nfldb.aio.connect`) and
+        a `nfldb.aio.Operation` whose value is the list of games is
+        returned immediately.
+
+        Relations cannot be prefetched asynchronously.
+        """
+        return self._as_async(conn, types.Game)
+
+    def as_drives_async(self, conn):
+        """
+        Like `nfldb.Query.as_games_async`, but for
+        `nfldb.Query.as_drives`.
+        """
+        return self._as_async(conn, types.Drive)
+
+    def as_plays_async(self, conn, fill=True):
+        """
+        Like `nfldb.Query.as_games_async`, but for
+        `nfldb.Query.as_plays`.
+        """
+        sorter = self._play_sorter()
+        if not fill:
+            return self._as_async(conn, types.Play, sorter=sorter)
+        self._assert_no_aggregate()
+        assert len(self._prefetch) == 0, \
+            'relations cannot be prefetched asynchronously'
+
+        def compile(cursor):
+            return self._fill_plays_query(cursor, sorter)
+
+        def hydrate(rows):
+            return list(_plays_with_players(self._db, rows))
+        return nfldb.aio.query(conn, compile, hydrate)
+
+    def iter_plays_async(self, conn, fill=True, batch_size=1000):
+        """
+        Like `nfldb.Query.iter_plays`, except the query is run on the
+        asynchronous connection `conn` and a `nfldb.aio.Batches` is
+        returned, from which plays are fetched in batches of at most
+        `batch_size` rows.
+
+        When `fill` is `True`, the rows of a play's players are never
+        split across two batches.
+        """
+        self._assert_no_aggregate()
+
+        sorter = self._play_sorter()
+        init = types.Play._hydrator()
+        carry = []
+
+        def compile(cursor):
+            if fill:
+                return self._fill_plays_query(cursor, sorter)
+            return self._make_join_query(cursor, types.Play, sorter=sorter)
+
+        def hydrate(rows, last):
+            if not fill:
+                return [_identity(self._db, init(self._db, r)) for r in rows]
+
+            # Hold back the rows of the last play, since the rest of its
+            # players may be in the next batch.
+            rows = carry + rows
+            del carry[:]
+            if not last and len(rows) > 0:
+                i = len(rows)
+                while i > 0 and rows[i-1][0:3] == rows[-1][0:3]:
+                    i -= 1
+                carry.extend(rows[i:])
+                rows = rows[:i]
+            return list(_plays_with_players(self._db, rows))
+        return nfldb.aio.Batches(conn, _cursor_name(), compile, hydrate,
+                                 batch_size)
+
+    def as_play_players_async(self, conn):
+        """
+        Like `nfldb.Query.as_games_async`, but for
+        `nfldb.Query.as_play_players`.
+        """
+        return self._as_async(conn, types.PlayPlayer)
+
+    def as_players_async(self, conn):
+        """
+        Like `nfldb.Query.as_games_async`, but for
+        `nfldb.Query.as_players`.
+        """
+        return self._as_async(conn, types.Player)
+
+    def as_aggregate_async(self, conn, group_by=None):
+        """
+        Like `nfldb.Query.as_games_async`, but for
+        `nfldb.Query.as_aggregate`.
+        """
+        _, _, compile, init = self._aggregate_query(group_by)
+        return nfldb.aio.query(conn, compile,
+                               lambda rows: [init(row) for row in rows])
+
+    def explain(self, entity=None, analyze=True, group_by=None):
+        """
+        Returns a `nfldb.explain.Explanation` of the query that would
+        be run to retrieve the results for `entity`, which is one of
+        `nfldb.Game`, `nfldb.Drive`, `nfldb.Play`, `nfldb.PlayPlayer`
+        or `nfldb.Player`. If `entity` is `None`, then the query of
+        `nfldb.Query.as_aggregate` (with `group_by`) is explained.
+
+        If `analyze` is `True`, then the query is run twice: once with
+        `EXPLAIN (ANALYZE, BUFFERS)`, so that the plan includes the
+        time spent in each node, and once more as it would normally
+        be run, to measure the time spent in Python. Otherwise, only
+        the estimated plan is retrieved. For example:
+
+            #!python
+            q = Query(db).game(season_year=2012).play(down=3)
+            ex = q.explain(types.Play)
+            print ex
+            for node in ex.seq_scans:
+                print 'scans every row of %s' % node.relation
+        """
+        if entity is None:
+            _, _, compile, init = self._aggregate_query(group_by)
+            hydrate = lambda rows: [init(row) for row in rows]
+        elif entity is types.Play:
+            self._assert_no_aggregate()
+            sorter = self._play_sorter()
+            compile = lambda cur: self._fill_plays_query(cur, sorter)
+            hydrate = lambda rows: list(_plays_with_players(self._db, rows))
+        else:
+            self._assert_no_aggregate()
+            init = entity._hydrator()
+            compile = lambda cur: self._make_join_query(cur, entity)
+            hydrate = lambda rows: [init(self._db, row) for row in rows]
+
+        timings = OrderedDict()
+        with Tx(self._db, factory=tuple_cursor) as cursor:
+            start = time.time()
+            q = compile(cursor)
+            timings['generate'] = time.time() - start
+
+            options = 'ANALYZE, BUFFERS, ' if analyze else ''
+            cursor.execute('EXPLAIN (%sFORMAT JSON) %s' % (options, q))
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, strtype):
+                plan = json.loads(plan)
+
+            if analyze:
+                for stage, run in [('execute', lambda: cursor.execute(q)),
+                                   ('fetch', cursor.fetchall),
+                                   ('hydrate', lambda: hydrate(rows))]:
+                    start = time.time()
+                    rows = run()
+                    timings[stage] = time.time() - start
+        return nfldb.explain.Explanation(q, plan[0], timings)
+
+    def filter_objects(self, objs):
+        """
+        Returns the objects in `objs` that are matched by the criteria
+        in `self`, sorted and limited by the criteria given to
+        `nfldb.Query.sort` and `nfldb.Query.limit`. The objects must
+        all be of the same entity (e.g., `nfldb.Play`). No query is
+        sent to the database. Instead, the criteria are compiled to
+        a Python function, which is cached for criteria with the same
+        shape.
+
+        This makes it cheap to narrow down objects that have already
+        been retrieved. For example:
+
+            #!python
+            q = Query(db).game(season_year=2012, season_type='Regular')
+            plays = q.as_plays()
+
+            long_third = Query(db).play(down=3, yards_to_go__ge=7)
+            for p in long_third.filter_objects(plays):
+                print p
+
+        Criteria on other entities are evaluated with the relations of
+        each object (like `nfldb.Play.drive` or
+        `nfldb.Play.play_players`), which are retrieved from the
+        database if they haven't been already. Use
+        `nfldb.Query.prefetch` to load them up front.
+        """
+        self._assert_no_aggregate()
+        assert self._after is None, \
+            'keyset pagination is not supported by filter_objects'
+
+        objs = list(objs)
+        if len(objs) == 0:
+            return []
+        entity = [e for e in _group_by_entities if isinstance(objs[0], e)][0]
+        results = filter(_python_predicate(entity, self), objs)
+        _python_sort(entity, results, self._sorter(entity))
+        if self._limit:
+            results = results[:self._limit]
         return results
 
     def _entities(self):
@@ -998,6 +2510,14 @@ class Query (Condition):
             tabs = tabs.union(cond._entities())
         return tabs
 
+    def _shape(self, values, aggregate=False):
+        if aggregate:
+            conds = (self._agg_andalso, self._agg_orelse)
+        else:
+            conds = (self._andalso, self._orelse)
+        return tuple(tuple(c._shape(values, aggregate=aggregate) for c in cs)
+                     for cs in conds)
+
     def show_where(self, aggregate=False):
         """
         Returns an approximate WHERE clause corresponding to the
@@ -1074,6 +2594,96 @@ class Sorter (object):
                 "or two-element tuples like (column, order). "
                 "Got value '%s' with type '%s'." % (e, type(e)))
 
+    def keys(self):
+        """
+        Returns the list of `(entity, field)` pairs sorted on, without
+        repeats, in order.
+        """
+        keys = []
+        for ent, field, _ in self.exprs:
+            if (ent, field) not in keys:
+                keys.append((ent, field))
+        return keys
+
+    def keyset(self, values, aliases=None):
+        """
+        Returns a SQL condition, as a template and a list of arguments
+        for it, that matches the rows sorted after a row whose values
+        for `nfldb.Sorter.keys` are `values`. `NULL` sorts as if it
+        were greater than every other value, which is how
+        `nfldb.Sorter.order_sql` orders rows on every backend.
+
+        When every field is sorted in the same direction and none of
+        `values` are `None`, the condition is a row value comparison
+        (with a test for `NULL` values of ascending fields that aren't
+        in the primary key), which can use an index on the sort fields.
+        """
+        orders = dict(((ent, f), o) for ent, f, o in reversed(self.exprs))
+        keys = self.keys()
+        assert len(values) == len(keys), \
+            'expected %d values to sort after, got %d' \
+            % (len(keys), len(values))
+        fields = []
+        for ent, field in keys:
+            try:
+                fields.append(ent._sql_field(field, aliases=aliases))
+            except KeyError:
+                raise ValueError('%s is not a valid sort field for %s'
+                                 % (field, ent.__name__))
+        orders = [orders[k] for k in keys]
+
+        if len(set(orders)) == 1 and None not in values:
+            cond = '(%s) %s (%s)' % (', '.join(fields),
+                                     '>' if orders[0] == 'ASC' else '<',
+                                     ', '.join(['%s'] * len(values)))
+            conds, args = [cond], list(values)
+            if orders[0] == 'ASC':
+                for i, (ent, field) in enumerate(keys):
+                    if field in ent._sql_tables['primary']:
+                        continue
+                    eqs = ['%s = %%s' % f for f in fields[:i]]
+                    conds.append(' AND '.join(eqs + ['%s IS NULL'
+                                                     % fields[i]]))
+                    args += values[:i]
+            return ' OR '.join('(%s)' % c for c in conds), args
+
+        conds, args = [], []
+        for i, (field, order, v) in enumerate(zip(fields, orders, values)):
+            if v is None:
+                if order == 'ASC':
+                    continue
+                after, after_args = '%s IS NOT NULL' % field, []
+            elif order == 'ASC':
+                after, after_args = '(%s > %%s OR %s IS NULL)' \
+                                    % (field, field), [v]
+            else:
+                after, after_args = '%s < %%s' % field, [v]
+            eqs = []
+            for f, w in zip(fields[:i], values[:i]):
+                if w is None:
+                    eqs.append('%s IS NULL' % f)
+                else:
+                    eqs.append('%s = %%s' % f)
+                    args.append(w)
+            conds.append(' AND '.join(eqs + [after]))
+            args += after_args
+        if len(conds) == 0:
+            return 'false', []
+        return ' OR '.join('(%s)' % c for c in conds), args
+
+    @staticmethod
+    def order_sql(field, order):
+        """
+        Returns the SQL that orders rows by the column `field` in the
+        direction `order` (`ASC` or `DESC`). On both PostgreSQL and
+        SQLite, `NULL` sorts as if it were greater than every other
+        value. (SQLite sorts it as the smallest value by default.)
+        """
+        if dialect() == 'sqlite':
+            nulls = 'LAST' if order == 'ASC' else 'FIRST'
+            return '%s %s NULLS %s' % (field, order, nulls)
+        return '%s %s' % (field, order)
+
     def sql(self, aliases=None):
         """
         Return a SQL `ORDER BY ... LIMIT` expression corresponding to
@@ -1095,7 +2705,7 @@ class Sorter (object):
                     raise ValueError(
                         '%s is not a valid sort field for %s'
                         % (field, ent.__name__))
-                sort_fields.append('%s %s' % (field, order))
+                sort_fields.append(self.order_sql(field, order))
             s += 'ORDER BY %s' % ', '.join(sort_fields)
         if self.limit > 0:
             s += ' LIMIT %d' % self.limit
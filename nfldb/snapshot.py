@@ -0,0 +1,734 @@
+"""
+Read only snapshots of a season of nfldb data stored as memory mapped
+column files.
+
+The data for a season rarely changes once the season is over, but
+searching it with `nfldb.Query` still requires a round trip to the
+database. A snapshot is an export of the `game`, `drive`, `play`,
+`play_player` and `player` tables for a single season into a
+directory of NumPy files, which can then be searched with
+`nfldb.snapshot.Query` without a database connection. Since the files
+are memory mapped, any number of processes searching the same snapshot
+share one copy of it in the operating system's page cache.
+
+Snapshots are made with `nfldb.snapshot.export` or with the
+`nfldb-snapshot` script:
+
+    #!bash
+    nfldb-snapshot /var/lib/nfldb 2012 2013
+
+And searched with the same criteria that `nfldb.Query` accepts:
+
+    #!python
+    import nfldb.snapshot
+
+    snap = nfldb.snapshot.Snapshot('/var/lib/nfldb', 2013)
+    q = snap.query().game(season_type='Regular', week=1)
+    q.player(full_name='Tom Brady').sort('passing_yds').limit(5)
+    for p in q.as_plays():
+        print p
+
+NumPy is required to use this module.
+"""
+from __future__ import absolute_import, division, print_function
+from bisect import bisect_left, bisect_right
+try:
+    from collections import OrderedDict
+except ImportError:
+    from ordereddict import OrderedDict
+import calendar
+import datetime
+import json
+import operator
+import os
+import os.path
+import shutil
+
+import numpy
+from psycopg2.extensions import cursor as tuple_cursor
+import pytz
+
+from nfldb.db import api_version, Tx
+import nfldb.query as query
+import nfldb.types as types
+
+__pdoc__ = {}
+
+
+_FORMAT_VERSION = 1
+"""
+The version of the layout of snapshot directories. Snapshots with a
+different version cannot be opened.
+"""
+
+_TABLES = OrderedDict([
+    ('game', types.Game),
+    ('drive', types.Drive),
+    ('play', types.Play),
+    ('player', types.Player),
+    ('play_player', types.PlayPlayer),
+])
+"""
+The tables in a snapshot, in the order they're exported, with the
+entity stored in each.
+"""
+
+_TABLE_NAMES = dict((e, t) for t, e in _TABLES.items())
+
+_PARENTS = {
+    'drive': ['game'],
+    'play': ['game', 'drive'],
+    'play_player': ['game', 'drive', 'play', 'player'],
+}
+"""
+For each table, the tables that its rows refer to. A snapshot stores
+the row index of each referenced row in a column named after the
+referenced table with a leading underscore (e.g., `_game`).
+"""
+
+_GRAINS = ['game', 'drive', 'play', 'play_player']
+"""
+Tables ordered from the coarsest to the finest. Criteria on several
+tables are evaluated on the rows of the finest one.
+"""
+
+_OPERATORS = {
+    '=': operator.eq, '!=': operator.ne,
+    '<': operator.lt, '<=': operator.le,
+    '>': operator.gt, '>=': operator.ge,
+}
+
+
+def _season_path(directory, season_year):
+    return os.path.join(directory, str(season_year))
+
+
+def export(db, directory, season_year):
+    """
+    Writes a snapshot of the season `season_year` (including the
+    preseason and postseason) to a sub-directory of `directory` named
+    after the year. An existing snapshot of the same season is
+    replaced. Readers of the old snapshot are unaffected, since the
+    new snapshot is written to a temporary directory first and then
+    moved into place.
+
+    Only players that have statistics in the season are included.
+
+    Each column is stored in its own NumPy file with the same encoding
+    used by `nfldb.Query.as_columns`, except that strings are stored
+    as integer codes into a sorted list of the distinct strings in the
+    column. Rows are ordered by primary key.
+    """
+    path = _season_path(directory, season_year)
+    tmp = path + '.tmp'
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+
+    q = query.Query(db).game(season_year=season_year)
+    meta = {
+        'format': _FORMAT_VERSION,
+        'api_version': api_version,
+        'season_year': season_year,
+        'tables': {},
+    }
+    keys = {}
+    for table, entity in _TABLES.items():
+        fields = entity.sql_fields()
+        with Tx(db, factory=tuple_cursor) as cursor:
+            typnames = query._column_type_names(db, cursor, entity, fields)
+        columns = q.as_columns(entity, fields)
+
+        vocabs = {}
+        for f in fields:
+            if columns[f].dtype == object:
+                vocabs[f] = sorted(set(v for v in columns[f] if v is not None))
+                index = dict((v, i) for i, v in enumerate(vocabs[f]))
+                index[None] = -1
+                columns[f] = numpy.array([index[v] for v in columns[f]],
+                                         dtype=numpy.int32)
+
+        # Strings codes are ordered like the strings themselves, so
+        # sorting the codes sorts the rows by primary key.
+        primary = entity._sql_tables['primary']
+        order = numpy.lexsort([columns[f] for f in reversed(primary)])
+        for f in fields:
+            columns[f] = columns[f][order]
+
+        pks = zip(*[[vocabs[f][c] for c in columns[f]] if f in vocabs
+                    else columns[f].tolist() for f in primary])
+        keys[table] = dict((pk, i) for i, pk in enumerate(pks))
+        for parent in _PARENTS.get(table, []):
+            pindex = keys[parent]
+            pprimary = _TABLES[parent]._sql_tables['primary']
+            idx = [primary.index(f) for f in pprimary]
+            columns['_' + parent] = numpy.array(
+                [pindex[tuple(pk[i] for i in idx)] for pk in pks],
+                dtype=numpy.int32)
+
+        tabledir = os.path.join(tmp, table)
+        os.makedirs(tabledir)
+        for f, column in columns.items():
+            numpy.save(os.path.join(tabledir, f + '.npy'), column)
+        for f, vocab in vocabs.items():
+            with open(os.path.join(tabledir, f + '.json'), 'w') as fp:
+                json.dump(vocab, fp)
+        meta['tables'][table] = {
+            'rows': len(order),
+            'types': dict(zip(fields, typnames)),
+        }
+
+    with open(os.path.join(tmp, 'meta.json'), 'w') as fp:
+        json.dump(meta, fp)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.rename(tmp, path)
+
+
+def _epoch(dt):
+    """
+    Returns the number of seconds since the UNIX epoch of the datetime
+    `dt`. A naive datetime is assumed to be in UTC.
+    """
+    return calendar.timegm(dt.utctimetuple()) + dt.microsecond / 1000000
+
+
+def _encode(typname, value):
+    """
+    Returns `value` encoded like a value in a column with the SQL type
+    `typname`. `None` is returned if the value corresponds to `NULL`.
+    """
+    if value is None:
+        return None
+    enum = getattr(types.Enums, typname, None)
+    if isinstance(enum, type):
+        if not isinstance(value, enum):
+            value = enum[value]
+        return value.value
+    elif typname in ('timestamp', 'timestamptz'):
+        return _epoch(value)
+    elif typname == 'game_time':
+        return value.phase.value * 1000 + value.elapsed
+    elif typname == 'field_pos':
+        return value._offset
+    elif typname == 'pos_period':
+        return value._seconds
+    elif typname == 'bool':
+        return int(value)
+    return value
+
+
+def _decoder(typname, vocab=None):
+    """
+    Returns a function that decodes a list of values from a column
+    with the SQL type `typname` to the Python values returned by the
+    database. `vocab` is the list of strings of a string column.
+    """
+    def nullable(f):
+        return lambda vs: [None if v == query._COLUMN_NULL else f(v)
+                           for v in vs]
+
+    def memoized(f):
+        cache = {}
+
+        def decode(v):
+            if v not in cache:
+                cache[v] = f(v)
+            return cache[v]
+        return decode
+
+    epoch = datetime.datetime(1970, 1, 1, tzinfo=pytz.utc)
+    enum = getattr(types.Enums, typname, None)
+    if vocab is not None:
+        return lambda vs: [None if v < 0 else vocab[v] for v in vs]
+    elif isinstance(enum, type):
+        return nullable(enum)
+    elif typname in ('timestamp', 'timestamptz'):
+        return lambda vs: [epoch + datetime.timedelta(seconds=v) for v in vs]
+    elif typname in ('float4', 'float8', 'numeric'):
+        return lambda vs: [None if v != v else v for v in vs]
+    elif typname == 'game_time':
+        phases = types.Enums.game_phase
+        return nullable(memoized(
+            lambda v: types.Clock(phases(v // 1000), v % 1000)))
+    elif typname == 'field_pos':
+        return lambda vs: [types.FieldPosition(None if v == query._COLUMN_NULL
+                                               else v) for v in vs]
+    elif typname == 'pos_period':
+        return nullable(memoized(types.PossessionTime))
+    elif typname == 'bool':
+        return nullable(bool)
+    return nullable(lambda v: v)
+
+
+class Snapshot (object):
+    """
+    A snapshot of a season written by `nfldb.snapshot.export`. Its
+    columns are memory mapped when they're first used.
+    """
+    def __init__(self, directory, season_year):
+        """
+        Opens the snapshot of the season `season_year` in `directory`.
+        """
+        self.path = _season_path(directory, season_year)
+        """The directory containing the snapshot."""
+
+        with open(os.path.join(self.path, 'meta.json')) as fp:
+            self._meta = json.load(fp)
+        assert self._meta['format'] == _FORMAT_VERSION, \
+            'snapshot %s has format %d but format %d is required' \
+            % (self.path, self._meta['format'], _FORMAT_VERSION)
+
+        self.season_year = self._meta['season_year']
+        """The season year of the snapshot."""
+
+        self._columns = {}
+        self._vocabs = {}
+        self._player_cache = None
+
+    def query(self):
+        """
+        Returns a new `nfldb.snapshot.Query` that searches this
+        snapshot.
+        """
+        return Query(self)
+
+    def rows(self, table):
+        """Returns the number of rows in `table` (e.g., `play`)."""
+        return self._meta['tables'][table]['rows']
+
+    def _typname(self, table, field):
+        return self._meta['tables'][table]['types'][field]
+
+    def _column(self, table, field):
+        """
+        Returns the memory mapped column `field` of `table`. Columns
+        of strings contain codes into `nfldb.snapshot.Snapshot._vocab`.
+        """
+        key = (table, field)
+        if key not in self._columns:
+            path = os.path.join(self.path, table, field + '.npy')
+            self._columns[key] = numpy.load(path, mmap_mode='r')
+        return self._columns[key]
+
+    def _vocab(self, table, field):
+        """
+        Returns the sorted list of strings in the column `field` of
+        `table`, or `None` if it isn't a column of strings.
+        """
+        key = (table, field)
+        if key not in self._vocabs:
+            path = os.path.join(self.path, table, field + '.json')
+            vocab = None
+            if os.path.exists(path):
+                with open(path) as fp:
+                    vocab = json.load(fp)
+                if str is bytes:
+                    vocab = [s.encode('utf-8') for s in vocab]
+            self._vocabs[key] = vocab
+        return self._vocabs[key]
+
+    def _parents(self, grain, table):
+        """
+        Returns an array mapping each row of `grain` to its row in
+        `table`, or `None` if they're the same table.
+        """
+        if grain == table:
+            return None
+        return self._column(grain, '_' + table)
+
+    def _compare(self, table, field, op, value):
+        """
+        Returns a boolean mask over the rows of `table` that are
+        matched by the comparison `field op value`. As in SQL, `NULL`
+        values never match.
+        """
+        column = self._column(table, field)
+        vocab = self._vocab(table, field)
+        if isinstance(value, (list, tuple)):
+            assert op == '=', \
+                'Disjunctions must use "=" for column "%s"' % field
+            if vocab is not None:
+                codes = [bisect_left(vocab, v) for v in value]
+                codes = [c for c, v in zip(codes, value)
+                         if c < len(vocab) and vocab[c] == v]
+            else:
+                codes = [_encode(self._typname(table, field), v)
+                         for v in value]
+                codes = [c for c in codes if c is not None]
+            return numpy.in1d(column, codes)
+
+        if vocab is not None:
+            valid = column >= 0
+            lo, hi = bisect_left(vocab, value), bisect_right(vocab, value)
+            if op == '=':
+                return (column >= lo) & (column < hi)
+            elif op == '!=':
+                return valid & ((column < lo) | (column >= hi))
+            return valid & {
+                '<': lambda: column < lo, '<=': lambda: column < hi,
+                '>': lambda: column >= hi, '>=': lambda: column >= lo,
+            }[op]()
+
+        value = _encode(self._typname(table, field), value)
+        if value is None:
+            return numpy.zeros(len(column), dtype=bool)
+        if column.dtype.kind == 'f':
+            valid = ~numpy.isnan(column)
+        else:
+            valid = column != query._COLUMN_NULL
+        return valid & _OPERATORS[op](column, value)
+
+    def _players(self):
+        """
+        Returns a dictionary from player id to `nfldb.Player` for
+        every player in the snapshot.
+        """
+        if self._player_cache is None:
+            init = types.Player._hydrator()
+            rows = numpy.arange(self.rows('player'))
+            players = [init(None, r) for r in self._hydrate('player', rows)]
+            self._player_cache = dict((p.player_id, p) for p in players)
+        return self._player_cache
+
+    def _hydrate(self, table, rows, fields=None):
+        """
+        Returns a list of row tuples of the values in `fields` of
+        `table` for each row index in `rows`.
+        """
+        entity = _TABLES[table]
+        columns = []
+        for f in fields or entity.sql_fields():
+            decode = _decoder(self._typname(table, f), self._vocab(table, f))
+            columns.append(decode(self._column(table, f)[rows].tolist()))
+        return zip(*columns)
+
+
+def _evaluate(cond, leaf, aggregate=False):
+    """
+    Returns a boolean mask for the condition `cond`, where `leaf`
+    returns the mask of each `nfldb.query.Comparison`. `None` is
+    returned if `cond` places no restrictions.
+
+    If `aggregate` is `True`, then the aggregate criteria of queries
+    are evaluated instead.
+    """
+    if isinstance(cond, query.Comparison):
+        return leaf(cond)
+    if aggregate:
+        andalso, orelse = cond._agg_andalso, cond._agg_orelse
+    else:
+        andalso, orelse = cond._andalso, cond._orelse
+
+    terms = []
+    conj = [_evaluate(c, leaf, aggregate) for c in andalso]
+    conj = [m for m in conj if m is not None]
+    if len(conj) > 0:
+        terms.append(reduce(operator.and_, conj))
+    for c in orelse:
+        m = _evaluate(c, leaf, aggregate)
+        if m is not None:
+            terms.append(m)
+    if len(terms) == 0:
+        return None
+    return reduce(operator.or_, terms)
+
+
+def _sort_key(column, vocab, order):
+    """
+    Returns a key for `numpy.lexsort` that orders the values in
+    `column` like PostgreSQL does, where `NULL` is bigger than every
+    other value.
+    """
+    if vocab is not None:
+        key = numpy.where(column < 0, len(vocab), column)
+    elif column.dtype.kind == 'f':
+        key = numpy.where(numpy.isnan(column), numpy.inf, column)
+    else:
+        key = numpy.where(column == query._COLUMN_NULL, numpy.inf,
+                          column.astype(numpy.float64))
+    return -key if order == 'DESC' else key
+
+
+def QueryOR(snapshot):
+    """
+    Creates a disjunctive `nfldb.snapshot.Query` object. It is the
+    counterpart of `nfldb.QueryOR`.
+    """
+    return Query(snapshot, orelse=True)
+
+
+class Query (query.Query):
+    """
+    A `nfldb.Query` that is evaluated against a
+    `nfldb.snapshot.Snapshot` instead of a database.
+
+    Criteria are given in the same way, with the `game`, `drive`,
+    `play`, `play_player`, `player`, `aggregate`, `sort` and `limit`
+    methods. Results are retrieved with the `as_*` methods, which
+    return `nfldb` objects that aren't attached to a database. (The
+    `play_players` of plays and the `player` of play players are
+    filled from the snapshot.)
+
+    There are a few differences with a database search: strings are
+    compared byte-wise, only players in the season can be found and
+    results that aren't sorted are returned in primary key order.
+    """
+    def __init__(self, snapshot, orelse=False):
+        super(Query, self).__init__(snapshot, orelse=orelse)
+
+    def prefetch(self, *relations):
+        assert False, 'prefetch is not supported by snapshots'
+
+    def after(self, last):
+        assert False, 'keyset pagination is not supported by snapshots'
+
+    def _rows(self, table):
+        """
+        Returns an array of the indices of the rows of `table` that
+        match the criteria in `self`, sorted and limited.
+        """
+        snap = self._db
+        tables = set(_TABLE_NAMES[e] for e in self._entities())
+        tables.add(table)
+        if 'player' in tables and len(tables) > 1:
+            tables.add('play_player')
+        if tables == set(['player']):
+            grain = 'player'
+        else:
+            grain = max(tables - set(['player']), key=_GRAINS.index)
+
+        def leaf(c):
+            ctable = _TABLE_NAMES[c.entity]
+            mask = snap._compare(ctable, c.column, c.operator, c.value)
+            parents = snap._parents(grain, ctable)
+            return mask if parents is None else mask[parents]
+
+        mask = _evaluate(self, leaf)
+        if mask is None:
+            rows = numpy.arange(snap.rows(grain))
+        else:
+            rows = numpy.flatnonzero(mask)
+        parents = snap._parents(grain, table)
+        if parents is not None:
+            rows = numpy.unique(parents[rows])
+
+        sorter = self._sorter(_TABLES[table])
+        keys = []
+        for _, field, order in sorter.exprs:
+            if field not in sorter.default_entity.sql_fields():
+                raise ValueError('%s is not a valid sort field for %s'
+                                 % (field, sorter.default_entity.__name__))
+            column = snap._column(table, field)[rows]
+            keys.append(_sort_key(column, snap._vocab(table, field), order))
+        if len(keys) > 0:
+            rows = rows[numpy.lexsort(keys[::-1])]
+        if sorter.limit > 0:
+            rows = rows[:sorter.limit]
+        return rows
+
+    def _as_entities(self, table):
+        self._assert_no_aggregate()
+        init = _TABLES[table]._hydrator()
+        return [init(None, row)
+                for row in self._db._hydrate(table, self._rows(table))]
+
+    def _fill_players(self, pps):
+        """
+        Sets the `player` of each play player in `pps` from the
+        players in the snapshot.
+        """
+        players = self._db._players()
+        for pp in pps:
+            pp._player = players.get(pp.player_id)
+
+    def as_games(self):
+        """
+        Returns the results as a list of `nfldb.Game` objects.
+        """
+        return self._as_entities('game')
+
+    def as_drives(self):
+        """
+        Returns the results as a list of `nfldb.Drive` objects.
+        """
+        return self._as_entities('drive')
+
+    def as_plays(self, fill=True):
+        """
+        Returns the results as a list of `nfldb.Play` objects. If
+        `fill` is `True`, then the `play_players` attribute of each
+        play is filled.
+        """
+        plays = self._as_entities('play')
+        if fill:
+            snap = self._db
+            rows = self._rows('play')
+            ofplay = snap._column('play_player', '_play')
+            mask = numpy.in1d(ofplay, rows)
+            ppinit = types.PlayPlayer._hydrator()
+            byplay = {}
+            for i, row in zip(ofplay[mask].tolist(),
+                              snap._hydrate('play_player',
+                                            numpy.flatnonzero(mask))):
+                byplay.setdefault(i, []).append(ppinit(None, row))
+            for i, play in zip(rows.tolist(), plays):
+                play._play_players = byplay.get(i, [])
+                for pp in play._play_players:
+                    pp._play = play
+            self._fill_players([pp for p in plays for pp in p._play_players])
+        return plays
+
+    def as_play_players(self):
+        """
+        Returns the results as a list of `nfldb.PlayPlayer` objects.
+        """
+        pps = self._as_entities('play_player')
+        self._fill_players(pps)
+        return pps
+
+    def as_players(self):
+        """
+        Returns the results as a list of `nfldb.Player` objects.
+        """
+        return self._as_entities('player')
+
+    def iter_games(self, batch_size=1000):
+        return iter(self.as_games())
+
+    def iter_drives(self, batch_size=1000):
+        return iter(self.as_drives())
+
+    def iter_plays(self, fill=True, batch_size=1000):
+        return iter(self.as_plays(fill=fill))
+
+    def iter_play_players(self, batch_size=1000):
+        return iter(self.as_play_players())
+
+    def iter_players(self, batch_size=1000):
+        return iter(self.as_players())
+
+    def as_columns(self, entity, fields=None, batch_size=10000):
+        """
+        Returns the results for `entity` as columns, just like
+        `nfldb.Query.as_columns`. The columns are read straight from
+        the snapshot.
+        """
+        self._assert_no_aggregate()
+        table = _TABLE_NAMES[entity]
+        if fields is None:
+            fields = entity.sql_fields()
+        rows = self._rows(table)
+        columns = OrderedDict()
+        for f in fields:
+            column = self._db._column(table, f)[rows]
+            vocab = self._db._vocab(table, f)
+            if vocab is not None:
+                column = numpy.array(vocab + [None], dtype=object)[column]
+            columns[f] = column
+        return columns
+
+    def as_aggregate(self, group_by=None):
+        """
+        Returns aggregated statistics just like
+        `nfldb.Query.as_aggregate`.
+        """
+        snap = self._db
+        if group_by is None:
+            group_by = self._agg_group_by
+        group_by = tuple(group_by or ())
+        categories = types._player_categories.keys()
+        sum_fields = categories + types.PlayPlayer._sql_tables['derived']
+        for field in group_by:
+            assert field not in sum_fields, \
+                "Cannot group by the statistic '%s'." % field
+
+        def leaf(c):
+            ctable = _TABLE_NAMES[c.entity]
+            mask = snap._compare(ctable, c.column, c.operator, c.value)
+            parents = snap._parents('play_player', ctable)
+            return mask if parents is None else mask[parents]
+
+        mask = _evaluate(self, leaf)
+        if mask is None:
+            rows = numpy.arange(snap.rows('play_player'))
+        else:
+            rows = numpy.flatnonzero(mask)
+
+        # Each group is identified by a list of columns with one value
+        # for every play player row.
+        groups = []
+        for field in group_by or ('player_id',):
+            table = _TABLE_NAMES[query._group_by_entity(field)]
+            parents = snap._parents('play_player', table)
+            grows = rows if parents is None else parents[rows]
+            groups.append((field, table, snap._column(table, field)[grows]))
+
+        if len(rows) > 0:
+            order = numpy.lexsort([c for _, _, c in groups[::-1]])
+            stacked = numpy.array([c[order] for _, _, c in groups])
+            starts = numpy.flatnonzero(numpy.concatenate(
+                ([True], numpy.any(stacked[:, 1:] != stacked[:, :-1],
+                                   axis=0))))
+        else:
+            order = starts = numpy.arange(0)
+
+        sums = OrderedDict()
+        for f in categories:
+            column = snap._column('play_player', f)[rows][order]
+            dtype = numpy.float64 if column.dtype.kind == 'f' else numpy.int64
+            if len(rows) > 0:
+                sums[f] = numpy.add.reduceat(column.astype(dtype), starts)
+            else:
+                sums[f] = numpy.zeros(0, dtype=dtype)
+        for f, parts in types.PlayPlayer._derived_combined.items():
+            sums[f] = sum(sums[p] for p in parts)
+        sums['points'] = sum(sums[f] * pval
+                             for f, pval in types.PlayPlayer._point_values)
+        keys = OrderedDict((f, c[order][starts]) for f, _, c in groups)
+
+        def agg_leaf(c):
+            assert c.column in sums, \
+                "Cannot use '%s' in aggregate criteria." % c.column
+            values = sums[c.column]
+            if isinstance(c.value, (list, tuple)):
+                return numpy.in1d(values, c.value)
+            return _OPERATORS[c.operator](values, c.value)
+
+        result = numpy.arange(len(starts))
+        having = _evaluate(self, agg_leaf, aggregate=True)
+        if having is not None:
+            result = numpy.flatnonzero(having)
+
+        sorter = query.Sorter(types.PlayPlayer, self._sort_exprs, self._limit)
+        sort_keys = []
+        for _, field, order in sorter.exprs:
+            if field in sums:
+                column, vocab = sums[field][result], None
+            elif field in keys:
+                table = [t for f, t, _ in groups if f == field][0]
+                column = keys[field][result]
+                vocab = snap._vocab(table, field)
+            else:
+                raise ValueError('%s is not a valid sort field for %s'
+                                 % (field, types.PlayPlayer.__name__))
+            sort_keys.append(_sort_key(column, vocab, order))
+        if len(sort_keys) > 0:
+            result = result[numpy.lexsort(sort_keys[::-1])]
+        if sorter.limit > 0:
+            result = result[:sorter.limit]
+
+        columns = []
+        for field, table, _ in groups:
+            decode = _decoder(snap._typname(table, field),
+                              snap._vocab(table, field))
+            columns.append(decode(keys[field][result].tolist()))
+        for f in sum_fields:
+            columns.append(sums[f][result].tolist())
+
+        if len(group_by) == 0:
+            init = types.PlayPlayer._hydrator(['player_id'] + sum_fields)
+            pps = [init(None, row) for row in zip(*columns)]
+            self._fill_players(pps)
+            return pps
+        init = query._aggregate_row_type(group_by + tuple(sum_fields))
+        return [init(*row) for row in zip(*columns)]
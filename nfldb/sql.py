@@ -1,6 +1,23 @@
 from __future__ import absolute_import, division, print_function
+import sys
 
-from nfldb.db import _upsert
+from nfldb.db import _listeners, _timed_hydrator, _unpickle_connection
+from nfldb.db import _upsert, dialect
+
+
+_empty_entities = {}
+"""
+A new instance of each entity class that has been pickled. Fields
+with the same values as these instances are omitted from pickles.
+"""
+
+_interned = {}
+"""
+A table of values interned by the hydrators generated by
+`nfldb.Entity._hydrator`. Repeated values of the fields in
+`nfldb.Entity._sql_interned` (like game ids or team abbreviations) are
+shared by every object instead of being copied for each row.
+"""
 
 
 class Entity (object):
@@ -55,6 +72,74 @@ class Entity (object):
     here so that the SQL generation code is aware of them.
     """
 
+    _sql_interned = []
+    """
+    A list of fields with values that repeat across many rows, like
+    `gsis_id` or `team`. When an entity is created from a row, the
+    values of these fields are interned.
+    """
+
+    _pickled = []
+    """
+    A list of pairs of private attributes that are pickled along with
+    the fields of an entity (like the list of drives in a game) and
+    the attribute on each object in that list that points back to the
+    entity (like `_game` on a drive). The second element is `None` if
+    there is no such attribute.
+
+    Nothing else is pickled. In particular, the database connection
+    is dropped and an unpickled entity uses the connection from
+    `nfldb.set_unpickle_connection` when it needs one.
+    """
+
+    def __getstate__(self):
+        # Only fields that differ from those of a new entity are
+        # pickled, as a flat sequence of field index and value pairs.
+        cls = self.__class__
+        if cls not in _empty_entities:
+            _empty_entities[cls] = cls(None)
+        empty = _empty_entities[cls]
+
+        fields = []
+        for i, f in enumerate(self._pickle_fields()):
+            v, default = getattr(self, f), getattr(empty, f)
+            if v is default or (type(v) is type(default) and v == default):
+                continue
+            fields += [i, v]
+        return (tuple(fields),
+                tuple(getattr(self, a) for a, _ in self._pickled))
+
+    def __setstate__(self, state):
+        self.__init__(None)
+        del self._db
+
+        fields, attrs = state
+        names = self._pickle_fields()
+        for i in range(0, len(fields), 2):
+            setattr(self, names[fields[i]], fields[i+1])
+        for (attr, _), v in zip(self._pickled, attrs):
+            setattr(self, attr, v)
+        for attr, parent in self._pickled:
+            if parent is not None:
+                for child in getattr(self, attr) or []:
+                    setattr(child, parent, self)
+
+    def __getattr__(self, k):
+        # The connection of an unpickled entity is set when it's first
+        # needed. (See `__setstate__`.)
+        if k == '_db':
+            self._db = _unpickle_connection()
+            return self._db
+        raise AttributeError(k)
+
+    @classmethod
+    def _pickle_fields(cls):
+        """
+        Returns the fields whose values are pickled. By default, this
+        is every field in `nfldb.Entity.sql_fields`.
+        """
+        return cls.sql_fields()
+
     @classmethod
     def _sql_columns(cls):
         """
@@ -110,12 +195,56 @@ class Entity (object):
         the tuple `t` must be in *exact* correspondence with the columns
         returned by `nfldb.Entity.sql_fields`.
         """
-        cols = cls.sql_fields()
-        seta = setattr
-        obj = cls(db)
-        for i, field in enumerate(cols):
-            seta(obj, field, t[i])
-        return obj
+        return cls._hydrator()(db, t)
+
+    @classmethod
+    def _hydrator(cls, fields=None):
+        """
+        Returns a function `hydrate(db, t)` that creates a new instance
+        of this entity from the tuple `t`, where `t` is in exact
+        correspondence with `fields`. If `fields` is `None`, then
+        `nfldb.Entity.sql_fields` is used.
+
+        The function is generated from `nfldb.Entity._hydrator_source`
+        and compiled once for each entity and list of fields, so that
+        every field is assigned directly instead of through `setattr`.
+        """
+        fields = tuple(cls.sql_fields() if fields is None else fields)
+        if '_cached_hydrators' not in cls.__dict__:
+            cls._cached_hydrators = {}
+        if fields not in cls._cached_hydrators:
+            src = ['def hydrate(db, t):', '    obj = cls(db)']
+            src += ['    %s' % line for line in cls._hydrator_source(fields)]
+            src.append('    return obj')
+
+            # The source may refer to anything in the module defining
+            # the entity.
+            namespace = dict(vars(sys.modules[cls.__module__]))
+            namespace.update(cls=cls, _interned=_interned.setdefault)
+            code = compile('\n'.join(src) + '\n',
+                           '<hydrate %s>' % cls.__name__, 'exec')
+            exec(code, namespace)
+            cls._cached_hydrators[fields] = namespace['hydrate']
+        if len(_listeners) > 0:
+            return _timed_hydrator(cls._cached_hydrators[fields])
+        return cls._cached_hydrators[fields]
+
+    @classmethod
+    def _hydrator_source(cls, fields):
+        """
+        Returns a list of Python statements that assign the values in
+        the tuple `t` to the fields of the new entity `obj`, where `t`
+        is in exact correspondence with `fields`. There is one
+        statement for each field, in the same order. See
+        `nfldb.Entity._hydrator`.
+        """
+        src = []
+        for i, field in enumerate(fields):
+            if field in cls._sql_interned:
+                src.append('obj.%s = _interned(t[%d], t[%d])' % (field, i, i))
+            else:
+                src.append('obj.%s = t[%d]' % (field, i))
+        return src
 
     @classmethod
     def _sql_from(cls, aliases=None):
@@ -377,6 +506,16 @@ def _as_row(fields, obj):
     return [(f, getattr(obj, f, None)) for f in fields if f not in exclude]
 
 
+def greatest(exprs):
+    """
+    Returns a SQL expression for the greatest value of the SQL
+    expressions in `exprs`.
+    """
+    if dialect() == 'sqlite':
+        return 'MAX(%s)' % ', '.join(exprs)
+    return 'GREATEST(%s)' % ', '.join(exprs)
+
+
 def ands(*exprs):
     anded = ' AND '.join('(%s)' % e for e in exprs if e)
     return 'true' if len(anded) == 0 else anded
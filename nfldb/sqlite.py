@@ -0,0 +1,414 @@
+"""
+An embedded, read only copy of the nfldb database in a SQLite file.
+
+A copy is written with `nfldb.sqlite.export`, either of the entire
+database or of a few seasons:
+
+    #!python
+    db = nfldb.connect()
+    nfldb.sqlite.export(db, 'nfldb.sqlite', season_years=[2012, 2013])
+
+And opened with `nfldb.sqlite.connect`, which returns a connection
+that can be used with `nfldb.Query` and the rest of the `nfldb` API
+like a connection returned by `nfldb.connect`:
+
+    #!python
+    db = nfldb.sqlite.connect('nfldb.sqlite')
+    q = nfldb.Query(db).game(season_year=2012, season_type='Regular')
+    for pp in q.sort('passing_yds').limit(5).as_aggregate():
+        print pp.player, pp.passing_yds
+
+The SQLite file contains the same tables and columns as the PostgreSQL
+database (including `agg_play`). Values of enumerations and of the
+`game_time`, `field_pos` and `pos_period` types are stored as integers
+that sort in the same order as the values they represent, and
+timestamps are stored as text in UTC. Nothing can be written to the
+copy, and `nfldb.player_search` and `nfldb.Query.as_columns` are not
+supported.
+"""
+from __future__ import absolute_import, division, print_function
+import datetime
+import os
+import os.path
+import sqlite3
+
+from psycopg2.extensions import cursor as tuple_cursor
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+import pytz
+
+from nfldb.db import api_version, Tx
+import nfldb.query as query
+import nfldb.types as types
+
+try:
+    strtype = basestring
+except NameError:
+    strtype = str
+
+__pdoc__ = {}
+
+
+_TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+"""The format of timestamps stored in SQLite, always in UTC."""
+
+_TABLES = [('meta', []), ('team', ['team_id'])] + [
+    (table, entity._sql_tables['primary'])
+    for entity in (types.Player, types.Game, types.Drive, types.Play,
+                   types.PlayPlayer)
+    for table, _ in entity._sql_tables['tables']
+]
+"""
+The tables copied to SQLite, in order, with their primary keys.
+"""
+
+_INDEXES = [
+    ('game', ['season_year', 'season_type', 'week']),
+    ('play_player', ['player_id']),
+    ('player', ['full_name']),
+]
+"""Secondary indexes created in SQLite."""
+
+
+def _export_sql(typname, column):
+    """
+    Returns a PostgreSQL expression that converts `column`, with the
+    SQL type `typname`, to the value stored in SQLite.
+    """
+    enum = getattr(types.Enums, typname, None)
+    if isinstance(enum, type):
+        return query._enum_code(enum, column)
+    elif typname == 'game_time':
+        phase = query._enum_code(types.Enums.game_phase, '(%s).phase' % column)
+        return '%s * 1000 + (%s).elapsed' % (phase, column)
+    elif typname == 'field_pos':
+        return '(%s).pos' % column
+    elif typname == 'pos_period':
+        return '(%s).elapsed' % column
+    elif typname == 'bool':
+        return '(%s)::int' % column
+    elif typname in ('timestamp', 'timestamptz'):
+        return "to_char(%s AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS.US')" \
+               % column
+    return column
+
+
+def export(db, path, season_years=None, batch_size=10000):
+    """
+    Writes a copy of the database of the connection `db` to a new
+    SQLite file at `path`, replacing any existing file. (The copy is
+    written to a temporary file first and then moved into place.)
+
+    If `season_years` is a list of years, then only the games of
+    those seasons are copied. (Every player and team is copied.)
+
+    Rows are copied in batches of `batch_size`.
+    """
+    tmp = path + '.tmp'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    lite = sqlite3.connect(tmp)
+    lite.text_factory = str
+
+    for table, primary in _TABLES:
+        with Tx(db, factory=tuple_cursor) as cursor:
+            cursor.execute('SELECT * FROM %s LIMIT 0' % table)
+            columns = [d.name for d in cursor.description]
+            oids = [d.type_code for d in cursor.description]
+            cursor.execute('SELECT oid, typname FROM pg_type WHERE oid IN %s',
+                           (tuple(set(oids)),))
+            names = dict(cursor.fetchall())
+        typnames = [names[oid] for oid in oids]
+
+        defs = ['%s %s' % (c, _decltype(t))
+                for c, t in zip(columns, typnames)]
+        if len(primary) > 0:
+            defs.append('PRIMARY KEY (%s)' % ', '.join(primary))
+        lite.execute('CREATE TABLE %s (%s)' % (table, ', '.join(defs)))
+
+        where = ''
+        if season_years is not None:
+            years = ', '.join(str(int(y)) for y in season_years)
+            if table == 'game':
+                where = 'WHERE season_year IN (%s)' % years
+            elif 'gsis_id' in primary:
+                where = '''
+                    WHERE gsis_id IN (
+                        SELECT gsis_id FROM game WHERE season_year IN (%s)
+                    )
+                ''' % years
+
+        select = [_export_sql(t, c) for c, t in zip(columns, typnames)]
+        insert = 'INSERT INTO %s VALUES (%s)' \
+                 % (table, ', '.join(['?'] * len(columns)))
+        with Tx(db, name=query._cursor_name(), factory=tuple_cursor) as cur:
+            cur.execute('SELECT %s FROM %s %s'
+                        % (', '.join(select), table, where))
+            lite.executemany(insert, query._fetch_batches(cur, batch_size))
+
+    for table, columns in _INDEXES:
+        lite.execute('CREATE INDEX %s_%s ON %s (%s)'
+                     % (table, '_'.join(columns), table, ', '.join(columns)))
+    lite.commit()
+    lite.close()
+    os.rename(tmp, path)
+
+
+def _sqlite_value(v):
+    """
+    Returns the Python value `v` as it is stored in SQLite.
+    """
+    if isinstance(v, types._Enum):
+        return v.value
+    elif isinstance(v, types.Clock):
+        return v.phase.value * 1000 + v.elapsed
+    elif isinstance(v, types.FieldPosition):
+        return v._offset
+    elif isinstance(v, types.PossessionTime):
+        return v._seconds
+    elif isinstance(v, datetime.datetime):
+        if v.tzinfo is not None:
+            v = v.astimezone(pytz.utc).replace(tzinfo=None)
+        return v.strftime(_TIME_FORMAT)
+    elif isinstance(v, bool):
+        return int(v)
+    return v
+
+
+def _quote(v):
+    """
+    Returns the Python value `v` as a SQLite literal.
+    """
+    v = _sqlite_value(v)
+    if v is None:
+        return 'NULL'
+    elif isinstance(v, strtype):
+        if not isinstance(v, str):
+            v = v.encode('utf-8')
+        return "'%s'" % v.replace("'", "''")
+    return str(v)
+
+
+_DECLTYPE_PREFIX = 'nfldb_'
+"""
+The prefix of the declared types of columns whose values are
+converted when they're read. (`sqlite3` converters are global to the
+process, so they're namespaced to leave other users of `sqlite3`
+alone.)
+"""
+
+
+def _converters():
+    """
+    Returns a dictionary from the names of the SQL types of the columns
+    written by `nfldb.sqlite.export` to `sqlite3` converters that read
+    their values back as the same Python values that `nfldb.connect`
+    returns.
+    """
+    def timestamp(s):
+        t = datetime.datetime.strptime(s, _TIME_FORMAT)
+        return t.replace(tzinfo=pytz.utc)
+
+    def clock(s, _):
+        v = int(s)
+        return types.Clock(types.Enums.game_phase(v // 1000), v % 1000)
+
+    def interned(cast):
+        cast = types._interned_cast(cast)
+        return lambda s: cast(s, None)
+
+    converters = {
+        'bool': lambda s: bool(int(s)),
+        'timestamptz': timestamp,
+        'game_time': interned(clock),
+        'field_pos': interned(lambda s, _: types.FieldPosition(int(s))),
+        'pos_period': interned(lambda s, _: types.PossessionTime(int(s))),
+    }
+    for name in dir(types.Enums):
+        enum = getattr(types.Enums, name)
+        if isinstance(enum, type) and issubclass(enum, types._Enum):
+            converters[name] = lambda s, enum=enum: enum(int(s))
+    return converters
+
+_CONVERTERS = _converters()
+"""
+The converters of the SQL types whose values are converted, keyed by
+type name. See `_converters`.
+"""
+
+
+def _register_converters():
+    """
+    Registers the converters in `_CONVERTERS` with `sqlite3` under the
+    namespaced names of their types. See `_decltype`.
+    """
+    for typname, convert in _CONVERTERS.items():
+        sqlite3.register_converter(_DECLTYPE_PREFIX + typname, convert)
+_register_converters()
+
+
+def _decltype(typname):
+    """
+    Returns the type declared in SQLite for a column with the SQL type
+    `typname`.
+    """
+    if typname in _CONVERTERS:
+        return _DECLTYPE_PREFIX + typname
+    return typname
+
+
+def connect(path):
+    """
+    Returns a read only `nfldb.sqlite.Connection` to the SQLite file
+    at `path`, which must have been written by `nfldb.sqlite.export`.
+    """
+    return Connection(path)
+
+
+class Connection (object):
+    """
+    A read only connection to a copy of the database written by
+    `nfldb.sqlite.export`. It provides the parts of the interface of
+    a psycopg2 connection that `nfldb` uses, so it can be used anywhere
+    a connection returned by `nfldb.connect` can. SQL is written in
+    the SQLite dialect inside `nfldb.Tx` blocks of this connection.
+    (See `nfldb.db.dialect`.)
+    """
+    dialect = 'sqlite'
+
+    def __init__(self, path):
+        self.dsn = 'sqlite:%s' % os.path.abspath(path)
+        """
+        Identifies the database, like the `dsn` of a psycopg2
+        connection.
+        """
+
+        self._conn = sqlite3.connect(path, check_same_thread=False,
+                                     detect_types=sqlite3.PARSE_DECLTYPES)
+        self._conn.text_factory = str
+        self._conn.execute('PRAGMA query_only = ON')
+
+        version = self._conn.execute('SELECT version FROM meta').fetchone()[0]
+        assert version == api_version, \
+            '%s has schema version %d but version %d is required' \
+            % (path, version, api_version)
+
+        self._column_types = {}
+        """
+        A map from `(table, column)` to the name of its SQL type in
+        PostgreSQL.
+        """
+        tables = self._conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'")
+        for (table,) in tables.fetchall():
+            for row in self._conn.execute('PRAGMA table_info(%s)' % table):
+                typname = row[2]
+                if typname.startswith(_DECLTYPE_PREFIX):
+                    typname = typname[len(_DECLTYPE_PREFIX):]
+                self._column_types[(table, row[1])] = typname
+
+    @property
+    def closed(self):
+        return self._conn is None
+
+    def cursor(self, name=None, cursor_factory=None):
+        """
+        Returns a new `nfldb.sqlite.Cursor`. Rows are returned as
+        dictionaries unless `cursor_factory` is the psycopg2 tuple
+        cursor. `name` is ignored, since SQLite cursors always fetch
+        rows as they're needed.
+        """
+        return Cursor(self, dicts=cursor_factory is not tuple_cursor)
+
+    def get_transaction_status(self):
+        return TRANSACTION_STATUS_IDLE
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+        self._conn = None
+
+    def _adapt_field(self, entity, field, value):
+        """
+        Returns `value` with the names of enumeration members replaced
+        by the members themselves if `field` of `entity` is stored as
+        an enumeration.
+        """
+        try:
+            table = entity._sql_column_to_table(field)
+        except KeyError:
+            return value
+        typname = self._column_types.get((table, field), '')
+        enum = getattr(types.Enums, typname, None)
+        if not isinstance(enum, type):
+            return value
+
+        def member(v):
+            return enum[v] if isinstance(v, strtype) else v
+        if isinstance(value, (list, tuple)):
+            return [member(v) for v in value]
+        return member(value)
+
+
+class Cursor (object):
+    """
+    A cursor of a `nfldb.sqlite.Connection`. Like a psycopg2 cursor,
+    parameters are given with `%s` and quoted into the query text.
+    """
+    def __init__(self, connection, dicts=True):
+        self.connection = connection
+        self.query = None
+        """The text of the last query executed."""
+
+        self._cursor = connection._conn.cursor()
+        self._dicts = dicts
+
+    @property
+    def closed(self):
+        return self._cursor is None
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def mogrify(self, query, args=None):
+        if args is None:
+            return query
+        if isinstance(args, dict):
+            return query % dict((k, _quote(v)) for k, v in args.items())
+        return query % tuple(_quote(v) for v in args)
+
+    def execute(self, query, args=None):
+        self.query = self.mogrify(query, args)
+        self._cursor.execute(self.query)
+
+    def _rows(self, rows):
+        if not self._dicts:
+            return rows
+        names = [d[0] for d in self._cursor.description]
+        return [dict(zip(names, row)) for row in rows]
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        return None if row is None else self._rows([row])[0]
+
+    def fetchmany(self, size):
+        return self._rows(self._cursor.fetchmany(size))
+
+    def fetchall(self):
+        return self._rows(self._cursor.fetchall())
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def close(self):
+        self._cursor.close()
+        self._cursor = None
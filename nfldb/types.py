@@ -4,9 +4,13 @@ try:
     from collections import OrderedDict
 except ImportError:
     from ordereddict import OrderedDict
-from collections import defaultdict
+from array import array
+from bisect import bisect_left
+from collections import defaultdict, deque
 import datetime
 import itertools
+import operator
+import weakref
 
 import enum
 
@@ -15,7 +19,7 @@ from psycopg2.extensions import AsIs, ISQLQuote
 import pytz
 
 import nfldb.category
-from nfldb.db import now, Tx
+from nfldb.db import _identity_maps, now, Tx
 import nfldb.sql as sql
 import nfldb.team
 
@@ -139,6 +143,58 @@ def _next_play_with(plays, play, pred):
     return None
 
 
+def _score_timeline(plays, home_team):
+    """
+    Returns a list with a `(home, away)` score tuple for each play in
+    `plays`, corresponding to the score of the game immediately after
+    that play. `plays` must be sorted in the order in which they
+    occurred.
+
+    This uses the same heuristic as `nfldb.Game.score_in_plays` (see
+    the comments there), but in a single pass. Namely, when a TD is
+    found, the extra point is assumed to be good and 7 points are
+    added. If an XP or 2PTC attempt by the same team is found later,
+    then the score is adjusted by the points of that play minus the
+    extra point that was assumed. This way, the score after any play
+    is exactly `score_in_plays` of the plays up to and including it.
+    """
+    def is_try(p):
+        return (p.kicking_xpa > 0
+                or p.passing_twopta > 0
+                or p.receiving_twopta > 0
+                or p.rushing_twopta > 0)
+
+    # Indices of XP/2PTC attempts for each team, in order.
+    tries = defaultdict(deque)
+    for i, p in enumerate(plays):
+        if is_try(p):
+            tries[p.pos_team].append(i)
+
+    paired = {}  # index of an attempt paired with a TD -> (home?, points)
+    timeline = []
+    home, away = 0, 0
+    for i, p in enumerate(plays):
+        if i in paired:
+            is_home, pts = paired.pop(i)
+        else:
+            pts = max(0, p.points)
+            is_home = p.scoring_team == home_team
+            if pts == 6:
+                pts += 1
+                candidates = tries[p.pos_team]
+                while len(candidates) > 0 and candidates[0] <= i:
+                    candidates.popleft()
+                if len(candidates) > 0:
+                    j = candidates.popleft()
+                    paired[j] = (is_home, plays[j].points - 1)
+        if is_home:
+            home += pts
+        else:
+            away += pts
+        timeline.append((home, away))
+    return timeline
+
+
 def _fill(db, fill_with, to_fill, attr):
     """
     Fills a list of entities `to_fill` with the entity `fill_with`.
@@ -159,6 +215,90 @@ def _fill(db, fill_with, to_fill, attr):
         setattr(obj, attr, byid[pkval(obj)])
 
 
+def _mapped(db, entity, pk):
+    """
+    Returns the instance of `entity` with primary key `pk` from the
+    identity map of `db`. If `db` has no identity map or the entity
+    isn't in it, `None` is returned.
+    """
+    imap = _identity_maps.get(db)
+    if imap is None:
+        return None
+    return imap.get(entity, pk)
+
+
+_SCORED_GAMES_SIZE = 64
+"""
+The maximum number of finished games remembered for each connection
+by `_scored_game`.
+"""
+
+_scored_games = weakref.WeakKeyDictionary()
+"""
+A map from connections to the finished games (keyed by GSIS
+identifier) whose scores have been looked up with `_scored_game`,
+least recently used first.
+"""
+
+
+def _scored_game(db, gsis_id):
+    """
+    Returns the `nfldb.Game` with identifier `gsis_id` that is shared
+    by every lookup of a score in that game on the connection `db`,
+    so that its score timeline is only computed once.
+
+    The identity map of `db` is used if it has one. Otherwise, a few
+    of the most recently used games are remembered. Only games that
+    have finished are remembered, since the plays of a game in
+    progress can change.
+    """
+    game = _mapped(db, Game, (gsis_id,))
+    if game is not None:
+        return game
+
+    games = _scored_games.setdefault(db, OrderedDict())
+    game = games.pop(gsis_id, None)
+    if game is None:
+        game = Game.from_id(db, gsis_id)
+        if game is None or not game.finished:
+            return game
+    games[gsis_id] = game
+    while len(games) > _SCORED_GAMES_SIZE:
+        games.popitem(last=False)
+    return game
+
+
+_CAST_CACHE_SIZE = 100000
+"""
+The maximum number of distinct SQL values remembered by each caster
+wrapped with `_interned_cast`.
+"""
+
+
+def _interned_cast(cast):
+    """
+    Wraps a psycopg2 cast function so that the Python value for each
+    distinct SQL value is only built once. Equal SQL values decode to
+    the *same* object, so values returned by the caster must never be
+    mutated. At most `_CAST_CACHE_SIZE` values are remembered; values
+    beyond that are cast every time.
+
+    The original cast function is available as the `cast` attribute of
+    the returned function.
+    """
+    cache = {}
+
+    def interned(sqlv, cursor):
+        v = cache.get(sqlv)
+        if v is None:
+            v = cast(sqlv, cursor)
+            if len(cache) < _CAST_CACHE_SIZE:
+                cache[sqlv] = v
+        return v
+    interned.cast = cast
+    return interned
+
+
 def _total_ordering(cls):
     """Class decorator that fills in missing ordering methods"""
     # Taken from Python 2.7 stdlib to support 2.6.
@@ -201,6 +341,10 @@ def _total_ordering(cls):
     return cls
 
 
+_enum_casts = {}
+"""A map from members of `nfldb.Enums` to their psycopg2 cast functions."""
+
+
 class _Enum (enum.Enum):
     """
     Conforms to the `getquoted` interface in psycopg2. This maps enum
@@ -213,13 +357,21 @@ class _Enum (enum.Enum):
         corresponding to `enum`. Namely, `enum` should be a member of
         `nfldb.Enums`.
         """
-        return lambda sqlv, _: None if not sqlv else enum[sqlv]
+        if enum not in _enum_casts:
+            _enum_casts[enum] = _interned_cast(
+                lambda sqlv, _: None if not sqlv else enum[sqlv])
+        return _enum_casts[enum]
 
     def __conform__(self, proto):
         if proto is ISQLQuote:
             return AsIs("'%s'" % self.name)
         return None
 
+    def __reduce_ex__(self, proto):
+        # Enum types are attributes of `nfldb.Enums`, so they can't be
+        # found by pickle from their names alone.
+        return (_enum_member, (type(self).__name__, self._value_))
+
     def __str__(self):
         return self.name
 
@@ -246,6 +398,14 @@ class _Enum (enum.Enum):
         return self._value_ >= other._value_
 
 
+def _enum_member(enum, value):
+    """
+    Returns the member of the enumeration named `enum` in
+    `nfldb.Enums` with the given value. This is used to unpickle enums.
+    """
+    return getattr(Enums, enum)(value)
+
+
 class Enums (object):
     """
     Enums groups all enum types used in the database schema.
@@ -434,6 +594,17 @@ _player_categories = OrderedDict(
     [(n, c) for n, c in stat_categories.items()
      if c.category_type is Enums.category_scope.player])
 
+_player_category_index = dict(
+    [(n, i) for i, n in enumerate(_player_categories)])
+"""
+Maps each player statistical category to its position in the order
+given by `nfldb.category`. This is the index of the category in the
+statistics vector of a `nfldb.PlayPlayer`.
+"""
+
+_zero_stats = array('f', [0] * len(_player_categories))
+"""The statistics vector of a `nfldb.PlayPlayer` with no statistics."""
+
 # Don't document these fields because there are too many.
 # Instead, the API docs will include a link to a Wiki page with a table
 # of stat categories.
@@ -444,21 +615,52 @@ for cat in _player_categories.values():
     __pdoc__['PlayPlayer.%s' % cat.category_id] = None
 
 
+_team_caches = {}
+"""
+Maps the DSN of a database connection to a dictionary of the
+`nfldb.Team` objects in that database keyed by team identifier.
+"""
+
+
 class Team (object):
     """
     Represents information about an NFL team. This includes its
     standard three letter abbreviation, city and mascot name.
     """
-    # BUG: If multiple databases are used with different team information,
-    # this class won't behave correctly since it's using a global cache.
-
     __slots__ = ['team_id', 'city', 'name']
-    __cache = defaultdict(dict)
+
+    @staticmethod
+    def _cache(db):
+        """
+        Returns the dictionary of teams cached for the database of
+        `db`. The entire `team` table is loaded if it isn't cached.
+        """
+        if db.dsn not in _team_caches:
+            with Tx(db) as cur:
+                cur.execute('SELECT team_id, city, name FROM team')
+                Team._cache_teams(db, cur.fetchall())
+        return _team_caches[db.dsn]
+
+    @staticmethod
+    def _cache_teams(db, rows):
+        """
+        Caches a `nfldb.Team` for each row of the `team` table in
+        `rows` for the database of `db`.
+        """
+        teams = {}
+        for row in rows:
+            team = object.__new__(Team)
+            team.team_id = row['team_id']
+            team.city = row['city']
+            team.name = row['name']
+            teams[team.team_id] = team
+        _team_caches.setdefault(db.dsn, teams)
 
     def __new__(cls, db, abbr):
         abbr = nfldb.team.standard_team(abbr)
-        if abbr in Team.__cache:
-            return Team.__cache[abbr]
+        team = Team._cache(db).get(abbr)
+        if team is not None:
+            return team
         return object.__new__(cls)
 
     def __init__(self, db, abbr):
@@ -485,14 +687,9 @@ class Team (object):
         """
         The full "mascot" name of this team.
         """
-        if self.team_id not in Team.__cache:
-            with Tx(db) as cur:
-                cur.execute('SELECT * FROM team WHERE team_id = %s',
-                            (self.team_id,))
-                row = cur.fetchone()
-                self.city = row['city']
-                self.name = row['name']
-            Team.__cache[self.team_id] = self
+
+    def __reduce__(self):
+        return (_team, (self.team_id, self.city, self.name))
 
     def __str__(self):
         return '%s %s' % (self.city, self.name)
@@ -503,6 +700,16 @@ class Team (object):
         return None
 
 
+def _team(team_id, city, name):
+    """
+    Returns a `nfldb.Team` with the given information without using
+    a database. This is used to unpickle teams.
+    """
+    team = object.__new__(Team)
+    team.team_id, team.city, team.name = team_id, city, name
+    return team
+
+
 @_total_ordering
 class FieldPosition (object):
     """
@@ -524,6 +731,7 @@ class FieldPosition (object):
     __slots__ = ['_offset']
 
     @staticmethod
+    @_interned_cast
     def _pg_cast(sqlv, cursor):
         if not sqlv:
             return FieldPosition(None)
@@ -607,6 +815,12 @@ class FieldPosition (object):
             return NotImplemented
         return self._offset == other._offset
 
+    def __getstate__(self):
+        return (self._offset,)
+
+    def __setstate__(self, state):
+        self._offset = state[0]
+
     def __str__(self):
         if not self.valid:
             return 'N/A'
@@ -648,6 +862,7 @@ class PossessionTime (object):
         return PossessionTime((minutes * 60) + seconds)
 
     @staticmethod
+    @_interned_cast
     def _pg_cast(sqlv, cursor):
         return PossessionTime(int(sqlv[1:-1]))
 
@@ -715,6 +930,12 @@ class PossessionTime (object):
             return NotImplemented
         return self._seconds == other._seconds
 
+    def __getstate__(self):
+        return (self._seconds,)
+
+    def __setstate__(self, state):
+        self._seconds = state[0]
+
     def __conform__(self, proto):
         if proto is ISQLQuote:
             if not self.valid:
@@ -769,6 +990,7 @@ class Clock (object):
         return Clock(Enums.game_phase[phase], int(elapsed))
 
     @staticmethod
+    @_interned_cast
     def _pg_cast(sqlv, cursor):
         """
         Casts a SQL string of the form `(game_phase, elapsed)` to a
@@ -874,6 +1096,12 @@ class Clock (object):
             return NotImplemented
         return self.phase == o.phase and self.elapsed == o.elapsed
 
+    def __getstate__(self):
+        return (self.phase, self.elapsed)
+
+    def __setstate__(self, state):
+        self.phase, self.elapsed = state
+
     def __conform__(self, proto):
         if proto is ISQLQuote:
             return AsIs("ROW('%s', %d)::game_time"
@@ -896,6 +1124,7 @@ class SQLPlayer (sql.Entity):
         ],
         'derived': [],
     }
+    _sql_interned = ['player_id', 'team']
 
 
 class Player (SQLPlayer):
@@ -912,11 +1141,11 @@ class Player (SQLPlayer):
     """
     __slots__ = SQLPlayer.sql_fields() + ['_db']
 
-    _existing = None
+    _existing = {}
     """
-    A cache of existing player ids in the database.
-    This is only used when saving data to detect if a player
-    needs to be added.
+    A cache of existing player ids in each database, keyed by the DSN
+    of a connection. This is only used when saving data to detect if a
+    player needs to be added.
     """
 
     @staticmethod
@@ -978,10 +1207,16 @@ class Player (SQLPlayer):
         """
         Given a player GSIS identifier (e.g., `00-0019596`) as a string,
         returns a `nfldb.Player` object corresponding to `player_id`.
-        This function will always execute a single SQL query.
+        This function will execute a single SQL query, unless the
+        player is in the identity map of `db`. (See
+        `nfldb.identity_map`.)
 
         If no corresponding player is found, `None` is returned.
         """
+        player = _mapped(db, Player, (player_id,))
+        if player is not None:
+            return player
+
         import nfldb.query
         q = nfldb.query.Query(db)
         players = q.player(player_id=player_id).limit(1).as_players()
@@ -989,6 +1224,20 @@ class Player (SQLPlayer):
             return None
         return players[0]
 
+    @staticmethod
+    def from_ids(db, player_ids):
+        """
+        Given a list of player GSIS identifiers, returns a dictionary
+        mapping each identifier to its `nfldb.Player` object. This
+        function will always execute a single SQL query.
+
+        Identifiers without a corresponding player are omitted.
+        """
+        import nfldb.query
+        ids = [(pid,) for pid in set(player_ids)]
+        players = nfldb.query._entities_by_ids(db, Player, *ids)
+        return dict([(p.player_id, p) for p in players])
+
     def __init__(self, db):
         """
         Creates a new and empty `nfldb.Player` object with the given
@@ -1056,14 +1305,15 @@ class Player (SQLPlayer):
         """The current status of this player as a free-form string."""
 
     def _save(self, cursor):
-        if Player._existing is None:
-            Player._existing = set()
+        dsn = cursor.connection.dsn
+        if dsn not in Player._existing:
             cursor.execute('SELECT player_id FROM player')
-            for row in cursor.fetchall():
-                Player._existing.add(row['player_id'])
-        if self.player_id not in Player._existing:
+            Player._existing.setdefault(
+                dsn, set(row['player_id'] for row in cursor.fetchall()))
+        existing = Player._existing[dsn]
+        if self.player_id not in existing:
             super(Player, self)._save(cursor)
-            Player._existing.add(self.player_id)
+            existing.add(self.player_id)
 
     def __str__(self):
         name = self.full_name if self.full_name else self.gsis_name
@@ -1093,6 +1343,7 @@ class SQLPlayPlayer (sql.Entity):
         'tables': [('play_player', ['team'] + _player_categories.keys())],
         'derived': ['offense_yds', 'offense_tds', 'defense_tds', 'points'],
     }
+    _sql_interned = ['gsis_id', 'player_id', 'team']
 
     # These fields are combined using `GREATEST`.
     _derived_combined = {
@@ -1128,11 +1379,11 @@ class SQLPlayPlayer (sql.Entity):
         if name in cls._derived_combined:
             fields = cls._derived_combined[name]
             fields = [cls._sql_field(f, aliases=aliases) for f in fields]
-            return 'GREATEST(%s)' % ', '.join(fields)
+            return sql.greatest(fields)
         elif name == 'points':
             fields = ['(%s * %d)' % (cls._sql_field(f, aliases=aliases), pval)
                       for f, pval in cls._point_values]
-            return 'GREATEST(%s)' % ', '.join(fields)
+            return sql.greatest(fields)
         else:
             return super(SQLPlayPlayer, cls)._sql_field(name, aliases=aliases)
 
@@ -1158,8 +1409,15 @@ class PlayPlayer (SQLPlayPlayer):
     wiki page. Each statistical field is an instance attribute in
     this class.
     """
-    __slots__ = SQLPlayPlayer.sql_fields() \
-        + ['_db', '_play', '_player', '_fields']
+    __slots__ = [f for f in SQLPlayPlayer.sql_fields()
+                 if f not in _player_category_index] \
+        + ['_db', '_play', '_player', '_fields', '_stats']
+
+    # The statistical categories are stored in a single vector, `_stats`,
+    # in the order of `_player_categories`. Each category is exposed as a
+    # property of the same name. (See `_stat_property`.)
+
+    _pickled = [('_player', None)]
 
     # Document instance variables for derived SQL fields.
     # We hide them from the public interface, but make the doco
@@ -1196,6 +1454,38 @@ class PlayPlayer (SQLPlayPlayer):
         field goals and safeties.
         """
 
+    @classmethod
+    def _hydrator_source(cls, fields):
+        # When every statistical category is present in order, the
+        # statistics vector is copied from the row with one slice.
+        src = super(PlayPlayer, cls)._hydrator_source(fields)
+        cats, n = tuple(_player_categories), len(_player_categories)
+        for i in range(len(fields) - n + 1):
+            if tuple(fields[i:i+n]) == cats:
+                stats = "obj._stats = array('f', t[%d:%d])" % (i, i + n)
+                return src[:i] + [stats] + src[i+n:]
+        return src
+
+    @classmethod
+    def _pickle_fields(cls):
+        return [f for f in cls.sql_fields()
+                if f not in _player_category_index]
+
+    def __getstate__(self):
+        # Only non-zero statistics are pickled, as a flat sequence of
+        # category index and value pairs.
+        stats = []
+        for i, v in enumerate(self._stats):
+            if v != 0:
+                stats += [i, int(v) if v == int(v) else v]
+        return (super(PlayPlayer, self).__getstate__(), tuple(stats))
+
+    def __setstate__(self, state):
+        super(PlayPlayer, self).__setstate__(state[0])
+        stats = state[1]
+        for i in range(0, len(stats), 2):
+            self._stats[stats[i]] = stats[i+1]
+
     @staticmethod
     def _from_nflgame(db, p, pp):
         """
@@ -1254,6 +1544,7 @@ class PlayPlayer (SQLPlayPlayer):
         self._play = None
         self._player = None
         self._fields = None
+        self._stats = _zero_stats[:]
 
         self.gsis_id = None
         """
@@ -1289,10 +1580,8 @@ class PlayPlayer (SQLPlayPlayer):
     def fields(self):
         """The set of non-zero statistical fields set."""
         if self._fields is None:
-            self._fields = set()
-            for k in _player_categories.keys():
-                if getattr(self, k, 0) != 0:
-                    self._fields.add(k)
+            self._fields = set(k for k, v in zip(_player_categories,
+                                                 self._stats) if v != 0)
         return self._fields
 
     @property
@@ -1371,6 +1660,16 @@ class PlayPlayer (SQLPlayPlayer):
         of `nfldb.PlayPlayer` objects (or objects that can provide
         `nfldb.PlayPlayer` objects).
         """
+        self._merge(b)
+        self._stats = array('f', map(operator.add, self._stats, b._stats))
+        self._fields = None
+
+    def _merge(self, b):
+        """
+        Merges everything but the statistics of `b` into `self`, in the
+        same way that `_add` does. This is used by `nfldb.aggregate`,
+        which sums statistics separately.
+        """
         a = self
         assert a.player_id == b.player_id
         a.gsis_id = a.gsis_id if a.gsis_id == b.gsis_id else None
@@ -1378,9 +1677,6 @@ class PlayPlayer (SQLPlayPlayer):
         a.play_id = a.play_id if a.play_id == b.play_id else None
         a.team = a.team if a.team == b.team else None
 
-        for cat in _player_categories:
-            setattr(a, cat, getattr(a, cat) + getattr(b, cat))
-
         # Try to copy player meta data too.
         if a._player is None and b._player is not None:
             a._player = b._player
@@ -1396,12 +1692,7 @@ class PlayPlayer (SQLPlayPlayer):
         pp.play_id = self.play_id
         pp.player_id = self.player_id
         pp.team = self.team
-
-        ga, sa = getattr, setattr
-        for k in _player_categories:
-            v = getattr(self, k, 0)
-            if v != 0:
-                sa(pp, k, v)
+        pp._stats = self._stats[:]
         pp._player = self._player
         pp._play = self._play
         return pp
@@ -1413,16 +1704,37 @@ class PlayPlayer (SQLPlayPlayer):
 
     def __str__(self):
         d = {}
-        for cat in _player_categories:
-            v = getattr(self, cat, 0)
-            if v != 0:
-                d[cat] = v
+        for cat in self.fields:
+            d[cat] = getattr(self, cat)
         return repr(d)
 
     def __getattr__(self, k):
-        if k in PlayPlayer.__slots__:
+        if k in PlayPlayer.__slots__ and k != '_db':
             return 0
-        raise AttributeError(k)
+        return super(PlayPlayer, self).__getattr__(k)
+
+
+def _stat_property(cat):
+    """
+    Returns a property that reads and writes the statistical category
+    `cat` (a `nfldb.Category`) in the statistics vector of a
+    `nfldb.PlayPlayer`.
+    """
+    i = _player_category_index[cat.category_id]
+    if cat.is_real:
+        def get(self):
+            return self._stats[i]
+    else:
+        def get(self):
+            return int(self._stats[i])
+
+    def set(self, v):
+        self._stats[i] = v or 0
+    return property(get, set)
+
+
+for _cat in _player_categories.values():
+    setattr(PlayPlayer, _cat.category_id, _stat_property(_cat))
 
 
 class SQLPlay (sql.Entity):
@@ -1440,20 +1752,21 @@ class SQLPlay (sql.Entity):
         'derived': ['offense_yds', 'offense_tds', 'defense_tds', 'points',
                     'game_date'],
     }
+    _sql_interned = ['gsis_id', 'pos_team']
 
     @classmethod
     def _sql_field(cls, name, aliases=None):
         if name in PlayPlayer._derived_combined:
             fields = [cls._sql_field(f, aliases=aliases)
                       for f in PlayPlayer._derived_combined[name]]
-            return 'GREATEST(%s)' % ', '.join(fields)
+            return sql.greatest(fields)
         elif name == 'points':
             fields = ['(%s * %d)' % (cls._sql_field(f, aliases=aliases), pval)
                       for f, pval in PlayPlayer._point_values]
-            return 'GREATEST(%s)' % ', '.join(fields)
+            return sql.greatest(fields)
         elif name == 'game_date':
             gsis_id = cls._sql_field('gsis_id', aliases=aliases)
-            return 'SUBSTRING(%s from 1 for 8)' % gsis_id
+            return 'SUBSTR(%s, 1, 8)' % gsis_id
         else:
             return super(SQLPlay, cls)._sql_field(name, aliases=aliases)
 
@@ -1495,6 +1808,8 @@ class Play (SQLPlay):
     """
     __slots__ = SQLPlay.sql_fields() + ['_db', '_drive', '_play_players']
 
+    _pickled = [('_play_players', '_play')]
+
     # Document instance variables for derived SQL fields.
     # We hide them from the public interface, but make the doco
     # available to nfldb-mk-stat-table. Evil!
@@ -1577,9 +1892,15 @@ class Play (SQLPlay):
         Given a GSIS identifier (e.g., `2012090500`) as a string,
         an integer drive id and an integer play id, this returns a
         `nfldb.Play` object corresponding to the given identifiers.
+        If `db` has an identity map (see `nfldb.identity_map`), it is
+        checked before querying the database.
 
         If no corresponding play is found, then `None` is returned.
         """
+        play = _mapped(db, Play, (gsis_id, drive_id, play_id))
+        if play is not None:
+            return play
+
         import nfldb.query
         q = nfldb.query.Query(db)
         q.play(gsis_id=gsis_id, drive_id=drive_id, play_id=play_id).limit(1)
@@ -1588,6 +1909,20 @@ class Play (SQLPlay):
             return None
         return plays[0]
 
+    @staticmethod
+    def from_ids(db, ids):
+        """
+        Given a list of `(gsis_id, drive_id, play_id)` tuples, returns
+        a dictionary mapping each tuple to its `nfldb.Play` object.
+        This function will always execute a single SQL query.
+
+        The `play_players` attribute of each play is loaded lazily.
+        Tuples without a corresponding play are omitted.
+        """
+        import nfldb.query
+        plays = nfldb.query._entities_by_ids(db, Play, *set(map(tuple, ids)))
+        return dict([((p.gsis_id, p.drive_id, p.play_id), p) for p in plays])
+
     @staticmethod
     def fill_drives(db, plays):
         """
@@ -1729,7 +2064,10 @@ class Play (SQLPlay):
         If `before` is `True`, then the score will *not* include this
         play.
         """
-        game = Game.from_id(self._db, self.gsis_id)
+        if self._drive is not None and self._drive._game is not None:
+            game = self._drive._game
+        else:
+            game = _scored_game(self._db, self.gsis_id)
         if not before:
             return game.score_at_time(self.time.add_seconds(1))
 
@@ -1770,9 +2108,9 @@ class Play (SQLPlay):
             return '(%s) %s' % (self.time.phase, self.description)
 
     def __getattr__(self, k):
-        if k in Play.__slots__:
+        if k in Play.__slots__ and k != '_db':
             return 0
-        raise AttributeError(k)
+        return super(Play, self).__getattr__(k)
 
 
 class SQLDrive (sql.Entity):
@@ -1790,6 +2128,7 @@ class SQLDrive (sql.Entity):
         ],
         'derived': [],
     }
+    _sql_interned = ['gsis_id', 'pos_team']
 
 
 class Drive (SQLDrive):
@@ -1805,6 +2144,8 @@ class Drive (SQLDrive):
     """
     __slots__ = SQLDrive.sql_fields() + ['_db', '_game', '_plays']
 
+    _pickled = [('_plays', '_drive')]
+
     @staticmethod
     def _from_nflgame(db, g, d):
         """
@@ -1852,10 +2193,16 @@ class Drive (SQLDrive):
         """
         Given a GSIS identifier (e.g., `2012090500`) as a string
         and a integer drive id, this returns a `nfldb.Drive` object
-        corresponding to the given identifiers.
+        corresponding to the given identifiers. If `db` has an
+        identity map (see `nfldb.identity_map`), it is checked before
+        querying the database.
 
         If no corresponding drive is found, then `None` is returned.
         """
+        drive = _mapped(db, Drive, (gsis_id, drive_id))
+        if drive is not None:
+            return drive
+
         import nfldb.query
         q = nfldb.query.Query(db)
         q.drive(gsis_id=gsis_id, drive_id=drive_id).limit(1)
@@ -1864,6 +2211,19 @@ class Drive (SQLDrive):
             return None
         return drives[0]
 
+    @staticmethod
+    def from_ids(db, ids):
+        """
+        Given a list of `(gsis_id, drive_id)` tuples, returns a
+        dictionary mapping each tuple to its `nfldb.Drive` object.
+        This function will always execute a single SQL query.
+
+        Tuples without a corresponding drive are omitted.
+        """
+        import nfldb.query
+        drives = nfldb.query._entities_by_ids(db, Drive, *set(map(tuple, ids)))
+        return dict([((d.gsis_id, d.drive_id), d) for d in drives])
+
     @staticmethod
     def fill_games(db, drives):
         """
@@ -1962,7 +2322,7 @@ class Drive (SQLDrive):
         game is retrieved from the database if it hasn't been already.
         """
         if self._game is None:
-            return Game.from_id(self._db, self.gsis_id)
+            self._game = _scored_game(self._db, self.gsis_id)
         return self._game
 
     @property
@@ -2051,6 +2411,7 @@ class SQLGame (sql.Entity):
         ],
         'derived': ['winner', 'loser'],
     }
+    _sql_interned = ['gsis_id', 'home_team', 'away_team']
 
     @classmethod
     def _sql_field(cls, name, aliases=None):
@@ -2079,7 +2440,10 @@ class Game (SQLGame):
     corresponds to at least one drive, but if the game is active, there
     exist valid ephemeral states where a game has no drives.
     """
-    __slots__ = SQLGame.sql_fields() + ['_db', '_drives', '_plays']
+    __slots__ = SQLGame.sql_fields() + ['_db', '_drives', '_plays',
+                                        '_score_timeline', '_score_times']
+
+    _pickled = [('_drives', '_game'), ('_plays', None)]
 
     # Document instance variables for derived SQL fields.
     __pdoc__['Game.winner'] = '''The winner of this game.'''
@@ -2160,9 +2524,15 @@ class Game (SQLGame):
         """
         Given a GSIS identifier (e.g., `2012090500`) as a string,
         returns a `nfldb.Game` object corresponding to `gsis_id`.
+        If `db` has an identity map (see `nfldb.identity_map`), it is
+        checked before querying the database.
 
         If no corresponding game is found, `None` is returned.
         """
+        game = _mapped(db, Game, (gsis_id,))
+        if game is not None:
+            return game
+
         import nfldb.query
         q = nfldb.query.Query(db)
         games = q.game(gsis_id=gsis_id).limit(1).as_games()
@@ -2170,6 +2540,20 @@ class Game (SQLGame):
             return None
         return games[0]
 
+    @staticmethod
+    def from_ids(db, gsis_ids):
+        """
+        Given a list of GSIS identifiers, returns a dictionary mapping
+        each identifier to its `nfldb.Game` object. This function will
+        always execute a single SQL query.
+
+        Identifiers without a corresponding game are omitted.
+        """
+        import nfldb.query
+        ids = [(gsis_id,) for gsis_id in set(gsis_ids)]
+        games = nfldb.query._entities_by_ids(db, Game, *ids)
+        return dict([(g.gsis_id, g) for g in games])
+
     def __init__(self, db):
         """
         Creates a new and empty `nfldb.Game` object with the given
@@ -2187,6 +2571,8 @@ class Game (SQLGame):
         """
         self._drives = None
         self._plays = None
+        self._score_timeline = None
+        self._score_times = None
 
         self.gsis_id = None
         """
@@ -2344,6 +2730,21 @@ class Game (SQLGame):
         q.sort([('time', 'asc'), ('play_id', 'asc')])
         return q.as_plays()
 
+    def score_timeline(self):
+        """
+        Returns a list with the score of the game immediately after
+        each play in `nfldb.Game.plays` as a `(home, away)` tuple. The
+        list is computed in a single pass over the plays of the game,
+        and it is cached on this game.
+
+        The scores are computed with the same heuristic as
+        `nfldb.Game.score_in_plays`.
+        """
+        if self._score_timeline is None:
+            self._score_timeline = _score_timeline(self.plays, self.home_team)
+            self._score_times = [p.time for p in self.plays]
+        return self._score_timeline
+
     def score_in_plays(self, plays):
         """
         Returns the scores made by the home and away teams from the
@@ -2371,35 +2772,12 @@ class Game (SQLGame):
         # searching for the XP/2PTC after a TD, it may find a play that came
         # after a different TD. But this is OK, so long as we never double
         # count any particular play.
-        def is_twopta(p):
-            return (p.passing_twopta > 0
-                    or p.receiving_twopta > 0
-                    or p.rushing_twopta > 0)
-
-        counted = set()  # don't double count
-        home, away = 0, 0
-        for i, p in enumerate(plays):
-            pts = p.points
-            if pts > 0 and p.play_id not in counted:
-                counted.add(p.play_id)
-
-                if pts == 6:
-                    def after_td(p2):
-                        return (p.pos_team == p2.pos_team
-                                and (p2.kicking_xpa > 0 or is_twopta(p2))
-                                and p2.play_id not in counted)
-
-                    next = _next_play_with(plays, p, after_td)
-                    if next is None:
-                        pts += 1
-                    elif next.play_id not in counted:
-                        pts += next.points
-                        counted.add(next.play_id)
-                if p.scoring_team == self.home_team:
-                    home += pts
-                else:
-                    away += pts
-        return home, away
+        #
+        # See `nfldb.types._score_timeline` for the implementation.
+        timeline = _score_timeline(list(plays), self.home_team)
+        if len(timeline) == 0:
+            return 0, 0
+        return timeline[-1]
 
     def score_at_time(self, time):
         """
@@ -2410,8 +2788,11 @@ class Game (SQLGame):
         (Hint: Values can be created with the `nfldb.Clock.from_str`
         function.)
         """
-        start = Clock.from_str('Pregame', '0:00')
-        return self.score_in_plays(self.plays_range(start, time))
+        timeline = self.score_timeline()
+        i = bisect_left(self._score_times, time)
+        if i == 0:
+            return 0, 0
+        return timeline[i - 1]
 
     @property
     def play_players(self):
@@ -63,5 +63,5 @@ setup(
                 ('share/doc/nfldb/doc', docfiles),
                 ('share/nfldb', ['config.ini.sample'])],
     install_requires=install_requires,
-    scripts=['scripts/nfldb-update']
+    scripts=['scripts/nfldb-update', 'scripts/nfldb-snapshot']
 )
@@ -0,0 +1,72 @@
+#!/usr/bin/env python2
+
+"""
+Compares the interned psycopg2 casters for `nfldb.Clock`,
+`nfldb.FieldPosition`, `nfldb.PossessionTime` and the `nfldb` enums
+with the old casters, which parsed every value and built a new object
+for it.
+
+Usage:
+
+    python2 tests/bench_casts.py [season_year] [repeat]
+
+The season defaults to 2013. Every regular season play and drive of
+that season is fetched and hydrated `repeat` times (3 by default) with
+each set of casters, and the best time is reported.
+"""
+
+from __future__ import absolute_import, division, print_function
+import sys
+import time
+
+from psycopg2.extensions import new_type, register_type
+
+import nfldb
+import nfldb.db
+
+
+def register_casts(db, interned):
+    """
+    Registers the `nfldb` casters on `db` only. If `interned` is
+    false, then the casters without intern tables are used.
+    """
+    oids = nfldb.db._type_oids(db)
+    for (name, cast), oid in zip(nfldb.db._type_casts(), oids):
+        if not interned:
+            cast = cast.cast
+        register_type(new_type((oid,), name, cast), db)
+
+
+def best_of(repeat, f):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.time()
+        result = f()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def hydrate(db, season_year):
+    q = nfldb.Query(db).game(season_year=season_year, season_type='Regular')
+    return q.as_plays(fill=False) + q.as_drives()
+
+
+def main(season_year=2013, repeat=3):
+    times = []
+    for interned in (False, True):
+        db = nfldb.connect()
+        register_casts(db, interned)
+        elapsed, objs = best_of(repeat, lambda: hydrate(db, season_year))
+        times.append(elapsed)
+        db.close()
+
+    print('%d plays and drives' % len(objs))
+    print('parsed casters:   %0.3fs' % times[0])
+    print('interned casters: %0.3fs' % times[1])
+    print('speedup:          %0.2fx' % (times[0] / times[1]))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:3]))
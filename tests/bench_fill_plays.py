@@ -0,0 +1,96 @@
+#!/usr/bin/env python2
+
+"""
+Compares the single round trip implementation of
+`nfldb.Query.as_plays(fill=True)` with the old implementation, which
+ran the play search and then ran it *again* as a subquery to fetch
+`play_player` rows.
+
+Usage:
+
+    python2 tests/bench_fill_plays.py [season_year] [repeat]
+
+The season defaults to 2013. Each implementation is run `repeat` times
+(3 by default) on every regular season play of that season, and the best
+time is reported.
+"""
+
+from __future__ import absolute_import, division, print_function
+from collections import OrderedDict
+import sys
+import time
+
+from psycopg2.extensions import cursor as tuple_cursor
+
+import nfldb
+
+
+def two_pass_plays(q):
+    """
+    The old implementation of `nfldb.Query.as_plays(fill=True)`.
+    """
+    def make_pid(play):
+        return (play.gsis_id, play.drive_id, play.play_id)
+
+    sorter = q._play_sorter()
+    plays = OrderedDict()
+    with nfldb.Tx(q._db, factory=tuple_cursor) as cursor:
+        init_play = nfldb.Play.from_row_tuple
+        cursor.execute(q._make_join_query(cursor, nfldb.Play, sorter=sorter))
+        for row in cursor.fetchall():
+            play = init_play(q._db, row)
+            play._play_players = []
+            plays[make_pid(play)] = play
+
+        aliases = {'play_player': 'pp'}
+        ids = q._make_join_query(cursor, nfldb.Play,
+                                 only_prim=True, sorter=sorter)
+        from_tables = nfldb.PlayPlayer._sql_from(aliases=aliases)
+        columns = nfldb.PlayPlayer._sql_select_fields(
+            fields=nfldb.PlayPlayer.sql_fields(), aliases=aliases)
+        cursor.execute('''
+            SELECT {columns} {from_tables}
+            WHERE (pp.gsis_id, pp.drive_id, pp.play_id) IN ({ids})
+        '''.format(columns=', '.join(columns),
+                   from_tables=from_tables, ids=ids))
+
+        init_pp = nfldb.PlayPlayer.from_row_tuple
+        for row in cursor.fetchall():
+            pp = init_pp(q._db, row)
+            plays[make_pid(pp)]._play_players.append(pp)
+    return plays.values()
+
+
+def best_of(repeat, f):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.time()
+        result = f()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def main(season_year=2013, repeat=3):
+    db = nfldb.connect()
+
+    def query():
+        q = nfldb.Query(db)
+        return q.game(season_year=season_year, season_type='Regular')
+
+    old_time, old = best_of(repeat, lambda: two_pass_plays(query()))
+    new_time, new = best_of(repeat, lambda: query().as_plays(fill=True))
+
+    npps = sum(len(p._play_players) for p in new)
+    assert len(old) == len(new)
+    assert npps == sum(len(p._play_players) for p in old)
+
+    print('%d plays, %d play players' % (len(new), npps))
+    print('two passes:      %0.3fs' % old_time)
+    print('single pass:     %0.3fs' % new_time)
+    print('speedup:         %0.2fx' % (old_time / new_time))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:3]))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python2
+
+"""
+Compares the code generated row hydrators used by
+`nfldb.Entity.from_row_tuple` with the old implementation, which
+called `setattr` for every column of every row.
+
+Usage:
+
+    python2 tests/bench_hydrate.py [season_year] [repeat]
+
+The season defaults to 2013. The rows of every regular season play
+and play player of that season are fetched once, and then each
+implementation creates objects from them `repeat` times (3 by
+default). The best time is reported. No time is spent in the database
+while timing.
+"""
+
+from __future__ import absolute_import, division, print_function
+import sys
+import time
+
+from psycopg2.extensions import cursor as tuple_cursor
+
+import nfldb
+
+
+def setattr_hydrate(entity, db, rows):
+    """
+    The old implementation of `nfldb.Entity.from_row_tuple`.
+    """
+    objs = []
+    cols = entity.sql_fields()
+    seta = setattr
+    for t in rows:
+        obj = entity(db)
+        for i, field in enumerate(cols):
+            seta(obj, field, t[i])
+        objs.append(obj)
+    return objs
+
+
+def generated_hydrate(entity, db, rows):
+    init = entity._hydrator()
+    return [init(db, t) for t in rows]
+
+
+def best_of(repeat, f):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        f()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main(season_year=2013, repeat=3):
+    db = nfldb.connect()
+    q = nfldb.Query(db).game(season_year=season_year, season_type='Regular')
+    for entity in (nfldb.Play, nfldb.PlayPlayer):
+        with nfldb.Tx(db, factory=tuple_cursor) as cursor:
+            cursor.execute(q._make_join_query(cursor, entity))
+            rows = cursor.fetchall()
+
+        old = best_of(repeat, lambda: setattr_hydrate(entity, db, rows))
+        new = best_of(repeat, lambda: generated_hydrate(entity, db, rows))
+        print('%s: %d rows' % (entity.__name__, len(rows)))
+        print('    setattr:     %0.3fs' % old)
+        print('    generated:   %0.3fs' % new)
+        print('    speedup:     %0.2fx' % (old / new))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:3]))
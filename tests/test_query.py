@@ -195,3 +195,367 @@ def test_fill_play_player(db):
         assert pp._play is not None
         assert pp._play._drive is not None
         assert pp._play._drive._game is not None
+
+
+def test_iter_plays(qgame):
+    qgame.play(pos_team='NE').sort('passing_yds').limit(20)
+    plays = qgame.as_plays()
+    iplays = list(qgame.iter_plays(batch_size=7))
+    assert len(iplays) == len(plays) == 20
+    for p1, p2 in zip(plays, iplays):
+        assert (p1.drive_id, p1.play_id) == (p2.drive_id, p2.play_id)
+        assert len(p1._play_players) == len(p2._play_players)
+
+
+def test_iter_games(q):
+    assert len(list(q.game(week=1).iter_games(batch_size=5))) == 16
+
+
+def test_compiled_cache(db):
+    nfldb.clear_compiled_cache()
+    for week in [1, 2]:
+        nfldb.Query(db).game(season_year=2013, week=week).as_games()
+    info = nfldb.compiled_cache_info()
+    assert info['misses'] == 1 and info['hits'] == 1
+
+
+def test_as_columns(qgame):
+    qgame.play(pos_team='NE')
+    plays = qgame.sort([('drive_id', 'asc'), ('play_id', 'asc')]).as_plays()
+    cols = qgame.as_columns(nfldb.Play, ['play_id', 'passing_yds', 'down'])
+    assert list(cols.keys()) == ['play_id', 'passing_yds', 'down']
+    assert len(cols['play_id']) == len(plays)
+    for i, p in enumerate(plays):
+        assert cols['play_id'][i] == p.play_id
+        assert cols['passing_yds'][i] == p.passing_yds
+
+
+def test_aggregate_group_by(q):
+    q.game(week=1).sort([('team', 'asc')])
+    rows = q.as_aggregate(group_by=['team'])
+    assert len(rows) == 32
+    assert [r.team for r in rows] == sorted(r.team for r in rows)
+    assert all(r.offense_yds >= r.passing_yds for r in rows)
+
+
+def test_from_ids(db):
+    games = nfldb.Game.from_ids(db, ['2013090800', '2013090500'])
+    assert sorted(games.keys()) == ['2013090500', '2013090800']
+    drives = nfldb.Drive.from_ids(db, [('2013090800', 1), ('2013090800', 2)])
+    assert all(drives[k].drive_id == k[1] for k in drives)
+
+
+def test_prefetch(qgame):
+    qgame.prefetch('drives', 'plays', 'play_players', 'player')
+    g = qgame.as_games()[0]
+    assert g._drives is not None
+    for d in g._drives:
+        assert d._game is g and d._plays is not None
+        for p in d._plays:
+            assert p._drive is d and p._play_players is not None
+            assert all(pp._player is not None for pp in p._play_players)
+
+
+def test_score_timeline(qgame):
+    g = qgame.as_games()[0]
+    timeline = g.score_timeline()
+    assert len(timeline) == len(g.plays)
+    assert timeline[-1] == g.score_in_plays(g.plays)
+    for p, score in zip(g.plays[::10], timeline[::10]):
+        assert g.score_in_plays(g.plays_range(g.plays[0].time, p.time)) \
+            == g.score_at_time(p.time)
+
+
+def test_play_player_stats(qgame):
+    pps = qgame.player(full_name='Tom Brady').as_play_players()
+    total = sum(pps[1:], pps[0]._copy())
+    assert total.passing_yds == sum(pp.passing_yds for pp in pps)
+    assert isinstance(total.passing_yds, int)
+    assert 'passing_yds' in total.fields
+
+
+def test_aggregate_generator(qgame):
+    plays = qgame.as_plays()
+    pps = nfldb.aggregate(plays)
+    assert [pp.player_id for pp in pps] \
+        == [pp.player_id for pp in nfldb.aggregate(iter(plays))]
+    assert sum(pp.rushing_yds for pp in pps) \
+        == sum(pp.rushing_yds for p in plays for pp in p.play_players)
+
+
+def test_identity_map(db, qgame):
+    imap = nfldb.identity_map(db)
+    try:
+        g = qgame.as_games()[0]
+        assert nfldb.Game.from_id(db, g.gsis_id) is g
+        assert imap.hits == 1
+        pps = qgame.player(full_name='Tom Brady').as_play_players()
+        assert all(pp.player is pps[0].player for pp in pps)
+        imap.invalidate()
+        assert len(imap) == 0
+    finally:
+        nfldb.identity_map(db, 0)
+
+
+def test_fast_connect(db):
+    db2 = nfldb.connect(fast=True)
+    assert nfldb.Team(db2, 'NE') is nfldb.Team(db, 'NE')
+    assert nfldb.Team(db2, 'NE').city == 'New England'
+    g = nfldb.Query(db2).game(gsis_id='2013090800').as_games()[0]
+    assert g.home_team == 'BUF'
+    assert g.season_type == nfldb.Enums.season_phase.Regular
+
+
+def test_pool():
+    import threading
+
+    p = nfldb.pool(1, 4)
+    found = []
+
+    def work():
+        with p.session() as db:
+            found.append(len(nfldb.Query(db).game(gsis_id='2013090800')
+                                            .as_games()))
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    p.closeall()
+    assert found == [1, 1, 1, 1]
+
+
+def test_hydrator(qgame):
+    plays = qgame.as_plays()
+    assert all(p.gsis_id is plays[0].gsis_id for p in plays)
+    pps = [pp for p in plays for pp in p.play_players]
+    assert all(pp.gsis_id is plays[0].gsis_id for pp in pps)
+    players = qgame.player(full_name='Tom Brady').as_players()
+    assert players[0].player_id == '00-0019596'
+
+
+def test_interned_casts(qgame):
+    plays = qgame.as_plays(fill=False)
+    times = dict((str(p.time), p.time) for p in plays)
+    assert all(times[str(p.time)] is p.time for p in plays)
+    assert all(p.time.phase in nfldb.Enums.game_phase for p in plays)
+
+
+def test_pickle(db, qgame):
+    import pickle
+
+    nfldb.set_unpickle_connection(db)
+    plays = qgame.play(pos_team='NE').as_plays()
+    unpickled = pickle.loads(pickle.dumps(plays, 2))
+    for p1, p2 in zip(plays, unpickled):
+        assert (p1.time, p1.yardline, p1.description) \
+            == (p2.time, p2.yardline, p2.description)
+        assert all(pp._play is p2 for pp in p2._play_players)
+        assert [pp.fields for pp in p1.play_players] \
+            == [pp.fields for pp in p2.play_players]
+    assert unpickled[0].drive.gsis_id == '2013090800'
+
+    team = pickle.loads(pickle.dumps(nfldb.Team(db, 'NE')))
+    assert team.city == 'New England'
+    phase = nfldb.Enums.game_phase.Q4
+    assert pickle.loads(pickle.dumps(phase)) is phase
+
+
+def test_snapshot(db, tmpdir):
+    import nfldb.snapshot
+
+    nfldb.snapshot.export(db, str(tmpdir), 2013)
+    snap = nfldb.snapshot.Snapshot(str(tmpdir), 2013)
+    for q in [nfldb.Query(db).game(season_year=2013), snap.query()]:
+        q.game(season_type='Regular', team='NE').player(full_name='Tom Brady')
+        assert len(q.as_games()) == 16
+        q.play_player(passing_yds__ge=40, passing_yds__le=50)
+        assert len(q.as_plays()) == 5
+
+    q = snap.query().game(season_type='Regular').play(third_down_att=1)
+    pp = q.sort('passing_yds').limit(1).as_aggregate()[0]
+    assert pp.player.full_name == 'Matthew Stafford' and pp.passing_yds == 1398
+
+
+def test_filter_objects(db, qgame):
+    plays = qgame.as_plays()
+    q = nfldb.Query(db).play(down=3, yards_to_go__ge=7).player(position='QB')
+    found = q.sort('yards_to_go').filter_objects(plays)
+    expected = qgame.play(down=3, yards_to_go__ge=7).player(position='QB')
+    assert sorted(p.play_id for p in found) \
+        == sorted(p.play_id for p in expected.as_plays())
+    assert [p.yards_to_go for p in found] \
+        == sorted((p.yards_to_go for p in found), reverse=True)
+
+
+def test_sqlite(db, tmpdir):
+    import nfldb.sqlite
+
+    path = str(tmpdir.join('nfldb.sqlite'))
+    nfldb.sqlite.export(db, path, season_years=[2013])
+    lite = nfldb.sqlite.connect(path)
+    for q in [nfldb.Query(db).game(season_year=2013), nfldb.Query(lite)]:
+        q.game(season_type='Regular', team='NE').player(full_name='Tom Brady')
+        assert len(q.as_games()) == 16
+        q.play(time__ge=nfldb.Clock.from_str('Q4', '2:00'))
+        assert all(p.time.phase == nfldb.Enums.game_phase.Q4
+                   for p in q.as_plays())
+
+    q = nfldb.Query(lite).game(season_type='Regular').play(third_down_att=1)
+    pp = q.sort('passing_yds').limit(1).as_aggregate()[0]
+    assert pp.player.full_name == 'Matthew Stafford' and pp.passing_yds == 1398
+
+    # `down` is NULL for plays like kickoffs, which sort as if NULL were
+    # the biggest value on both backends.
+    for order in ('asc', 'desc'):
+        plays = []
+        for q in [nfldb.Query(db).game(season_year=2013), nfldb.Query(lite)]:
+            q.game(week=1).sort(('down', order))
+            plays.append([(p.gsis_id, p.drive_id, p.play_id, p.down)
+                          for p in q.as_plays(fill=False)])
+        assert plays[0] == plays[1]
+        downs = [p[-1] for p in plays[0]]
+        assert downs[-1 if order == 'asc' else 0] is None
+
+
+def test_async(db, qgame):
+    import nfldb.aio
+
+    conns = [nfldb.aio.connect() for _ in range(2)]
+    games, plays = nfldb.aio.gather(qgame.as_games_async(conns[0]),
+                                    qgame.as_plays_async(conns[1]))
+    assert games == qgame.as_games()
+    assert [p.play_id for p in plays] == [p.play_id for p in qgame.as_plays()]
+
+    batches = qgame.iter_plays_async(conns[0], batch_size=7)
+    found = []
+    while not batches.done:
+        found += batches.next_batch().result()
+    assert [len(p.play_players) for p in found] \
+        == [len(p.play_players) for p in plays]
+
+
+def test_run_parallel(db):
+    years = [2012, 2013]
+    qs = [nfldb.Query(db).game(season_year=y, season_type='Regular')
+          for y in years]
+    qs = [q.sort('rushing_yds').limit(3) for q in qs]
+    results = nfldb.run_parallel(qs, workers=2, method='as_aggregate')
+    assert [[pp.player_id for pp in r] for r in results] \
+        == [[pp.player_id for pp in q.as_aggregate()] for q in qs]
+
+    q = nfldb.Query(db).play(passing_yds__ge=1).sort('passing_yds').limit(10)
+    shards = [{'season_year': y} for y in years]
+    plays = nfldb.run_parallel(q, workers=2, method='as_plays', shards=shards)
+    assert [p.play_id for p in plays] == [p.play_id for p in q.as_plays()]
+    assert all(p._db is db for p in plays)
+
+
+def test_explain(db, qgame):
+    ex = qgame.play(down=3).explain(nfldb.Play)
+    assert ex.execution_time is not None
+    assert list(ex.timings) == ['generate', 'execute', 'fetch', 'hydrate']
+    assert any(n.relation == 'play' for n in ex.nodes)
+    assert all(n.relation in ('play', 'play_player', 'agg_play')
+               for n in ex.seq_scans)
+
+    ex = qgame.explain(nfldb.Game, analyze=False)
+    assert ex.execution_time is None and list(ex.timings) == ['generate']
+    assert len(ex.slowest) > 0
+
+
+def test_profile(db):
+    q = nfldb.Query(db).game(season_year=2012, week=1).play(down=3)
+    with nfldb.profile() as prof:
+        plays = q.as_plays(fill=False)
+        for p in plays[:10]:
+            p.play_players
+    callers = [s.caller for s in prof.statements]
+    assert 'Query.as_plays' in callers
+    assert callers.count('Play.play_players') >= 10
+
+    found = [s for s in prof.statements if s.rows == len(plays)]
+    assert len(found) == 1 and found[0].hydration > 0 and found[0].bytes > 0
+    assert [key[0] for key, _ in prof.n_plus_one()] == ['Play.play_players']
+
+    with nfldb.profile() as prof2:
+        pass
+    assert len(prof2.statements) == 0
+
+
+def test_after(db, tmpdir):
+    import nfldb.sqlite
+
+    path = str(tmpdir.join('nfldb.sqlite'))
+    nfldb.sqlite.export(db, path, season_years=[2012])
+    lite = nfldb.sqlite.connect(path)
+
+    # `down` is NULL for plays like kickoffs.
+    for conn in (db, lite):
+        q = nfldb.Query(conn).game(season_year=2012, week=1)
+        q.sort([('down', 'asc'), ('passing_yds', 'desc')])
+        plays = q.limit(100000).as_plays(fill=False)
+        assert any(p.down is None for p in plays)
+        full = [(p.gsis_id, p.drive_id, p.play_id) for p in plays]
+
+        paged, last = [], None
+        while True:
+            q.limit(7)
+            if last is not None:
+                q.after(last)
+            page = q.as_plays(fill=False)
+            if len(page) == 0:
+                break
+            paged += [(p.gsis_id, p.drive_id, p.play_id) for p in page]
+            last = page[-1]
+        assert paged == full
+
+    q = nfldb.Query(db).game(season_year=2012).sort(('gsis_id', 'asc'))
+    games = q.limit(3).as_games()
+    assert q.after((games[1].gsis_id,)).as_games()[0].gsis_id \
+        == games[2].gsis_id
+
+
+def test_count_exists(db):
+    q = nfldb.Query(db).game(season_year=2012, week=1)
+    assert q.count(nfldb.Game) == len(q.as_games())
+    assert q.count(nfldb.Play) == len(q.as_plays())
+    q.player(position='QB')
+    assert q.count(nfldb.Player) == len(q.as_players())
+    assert q.count(nfldb.Game) == len(q.as_games())
+    assert q.exists(nfldb.Play)
+
+    q = nfldb.Query(db).game(season_year=1900)
+    assert q.count(nfldb.Play) == 0 and not q.exists(nfldb.Play)
+
+
+def test_score_shared_game(db):
+    q = nfldb.Query(db).game(season_year=2012, week=1, finished=True)
+    plays = q.as_plays(fill=False)
+    games = set(p.gsis_id for p in plays)
+    with nfldb.profile() as prof:
+        scores = [p.score() for p in plays]
+    # One query for each game and one for its plays, plus preparing both.
+    assert len(prof.statements) <= 2 * len(games) + 2
+    for p, score in zip(plays[::25], scores[::25]):
+        game = nfldb.Game.from_id(db, p.gsis_id)
+        assert score == game.score_at_time(p.time.add_seconds(1))
+
+
+def test_sqlite_converters(tmpdir):
+    import sqlite3
+    import nfldb.sqlite
+
+    conn = sqlite3.connect(str(tmpdir.join('other.sqlite')),
+                           detect_types=sqlite3.PARSE_DECLTYPES)
+    conn.execute('CREATE TABLE t (b BOOL, t TIMESTAMPTZ, d down)')
+    conn.execute("INSERT INTO t VALUES ('yes', '2013-09-08', 'first')")
+    assert conn.execute('SELECT * FROM t').fetchone() \
+        == ('yes', '2013-09-08', 'first')
+
+
+def test_run_parallel_ties(db):
+    q = nfldb.Query(db).sort(('season_type', 'asc')).limit(3)
+    shards = [{'season_year': 2013}, {'season_year': 2012}]
+    games = nfldb.run_parallel(q, workers=2, method='as_games', shards=shards)
+    assert [g.gsis_id for g in games] == [g.gsis_id for g in q.as_games()]